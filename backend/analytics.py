@@ -0,0 +1,344 @@
+"""
+In-memory analytics table
+Columnar, NumPy-backed copy of the inventory lines answering the statistics endpoints
+
+One row per inventory line (date ordinal, product index, category index,
+produced, sold, wasted, price) plus one row per day (date ordinal, total_revenue).
+Amounts are integer cents (money.py): revenues are exact integer products and
+sums, converted to euros only in the results. The
+server builds the table from the inventories, tags it with the "inventories"
+version counter it reflects, and applies its own writes incrementally; a
+version moved by another worker makes the next read rebuild it. Statistics
+then run as vectorized group-bys (np.bincount over the product index), on
+the offload threads (offload.py) through snapshots of the table.
+
+Compact inventory days (see compact.py) are read straight from their count
+arrays, through a per-catalogue map from entry to product, category and price.
+
+Dates that are not calendar dates cannot be stored as ordinals: a table
+holding one is marked unusable and callers fall back on MongoDB.
+"""
+import copy
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+import numpy as np
+
+import money
+
+QUANTITIES = ("quantity_produced", "quantity_sold", "quantity_wasted")
+BREAKDOWNS = ("category", "weekday", "month")
+
+
+def to_ordinal(date_str: str) -> Optional[int]:
+    try:
+        parsed = datetime.strptime(date_str, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+    return parsed.toordinal() if parsed.strftime("%Y-%m-%d") == date_str else None
+
+
+class AnalyticsTable:
+    """Inventory lines as parallel NumPy columns."""
+
+    def __init__(self):
+        self.version = None
+        self.usable = False
+        # Local writes applied (or, for line deltas, started) so far: a rebuild running meanwhile is discarded
+        self.changes = 0
+        self._reset()
+
+    def _reset(self):
+        self.product_ids = []
+        self.product_index = {}
+        self.product_meta = []
+        self.categories = []
+        self.category_index = {}
+        self.line_date = np.empty(0, dtype=np.int32)
+        self.line_product = np.empty(0, dtype=np.int32)
+        self.line_category = np.empty(0, dtype=np.int32)
+        self.quantities = np.empty((len(QUANTITIES), 0), dtype=np.int64)
+        self.price = np.empty(0, dtype=np.int64)
+        self.day_date = np.empty(0, dtype=np.int32)
+        self.day_revenue = np.empty(0, dtype=np.int64)
+        # Compact days: catalogue version -> entry maps, and the entry each product meta comes from (-1: a row line)
+        self.entry_maps = {}
+        self.entry_count = 0
+        self.meta_entry = np.empty(0, dtype=np.int64)
+
+    def _product_index(self, prod_id) -> int:
+        if prod_id not in self.product_index:
+            self.product_index[prod_id] = len(self.product_ids)
+            self.product_ids.append(prod_id)
+            self.product_meta.append({})
+            self.meta_entry = np.append(self.meta_entry, -1)
+        return self.product_index[prod_id]
+
+    def _product(self, line: dict) -> int:
+        index = self._product_index(line.get("product_id"))
+        # Latest write wins, as in the monthly rollups
+        self.product_meta[index] = {"product_name": line.get("product_name"), "category": line.get("category")}
+        self.meta_entry[index] = -1
+        return index
+
+    def _category(self, line: dict) -> int:
+        category = line.get("category")
+        if category not in self.category_index:
+            self.category_index[category] = len(self.categories)
+            self.categories.append(category)
+        return self.category_index[category]
+
+    def _entry_map(self, version: str, entries: list) -> dict:
+        if version not in self.entry_maps:
+            self.entry_maps[version] = {
+                "entries": entries,
+                "offset": self.entry_count,
+                "product": np.full(len(entries), -1, dtype=np.int32),
+                "category": np.full(len(entries), -1, dtype=np.int32),
+                "price": np.array([entry.get("price", 0) for entry in entries], dtype=np.int64),
+            }
+            self.entry_count += len(entries)
+        return self.entry_maps[version]
+
+    def _compact_lines(self, inventory: dict, catalogues: dict, ordinal: int) -> tuple:
+        """Line columns of a compact day, taken from its arrays without building one dict per line."""
+        columns = inventory["columns"]
+        entry_map = self._entry_map(inventory["catalogue"], catalogues[inventory["catalogue"]])
+        entry = np.asarray(columns["entry"], dtype=np.int64)
+        # Register unseen products and categories in line order, as for row lines
+        for e in entry[entry_map["product"][entry] < 0].tolist():
+            if entry_map["product"][e] < 0:
+                entry_map["product"][e] = self._product_index(entry_map["entries"][e].get("product_id"))
+                entry_map["category"][e] = self._category(entry_map["entries"][e])
+        product = entry_map["product"][entry]
+
+        # Latest write wins: the last line of each product, when its meta comes from another entry
+        _, reversed_first = np.unique(product[::-1], return_index=True)
+        last = len(product) - 1 - reversed_first
+        stale = last[self.meta_entry[product[last]] != entry[last] + entry_map["offset"]]
+        for e, p in zip(entry[stale].tolist(), product[stale].tolist()):
+            line = entry_map["entries"][e]
+            self.product_meta[p] = {"product_name": line.get("product_name"), "category": line.get("category")}
+            self.meta_entry[p] = e + entry_map["offset"]
+
+        counts = [columns.get(column) or [0] * len(entry) for column in ("produced", "sold", "wasted")]
+        return (
+            np.full(len(entry), ordinal, dtype=np.int32),
+            product,
+            entry_map["category"][entry],
+            np.array(counts, dtype=np.int64).reshape(len(QUANTITIES), -1),
+            entry_map["price"][entry],
+        )
+
+    def _columns(self, inventories: Iterable[dict], catalogues: Optional[dict] = None):
+        """Turn inventory documents into column chunks, or None if a date is not a calendar date."""
+        line_date, line_product, line_category, quantities, price = [], [], [], [], []
+        day_date, day_revenue = [], []
+        compact_chunks = []
+        for inventory in inventories:
+            ordinal = to_ordinal(inventory.get("date"))
+            if ordinal is None:
+                return None
+            day_date.append(ordinal)
+            day_revenue.append(inventory.get("total_revenue", 0))
+            if "columns" in inventory:
+                compact_chunks.append(self._compact_lines(inventory, catalogues, ordinal))
+                continue
+            for line in inventory.get("products", []):
+                line_date.append(ordinal)
+                line_product.append(self._product(line))
+                line_category.append(self._category(line))
+                quantities.append([line.get(q, 0) for q in QUANTITIES])
+                price.append(line.get("price", 0))
+        rows = (
+            np.array(line_date, dtype=np.int32),
+            np.array(line_product, dtype=np.int32),
+            np.array(line_category, dtype=np.int32),
+            np.array(quantities, dtype=np.int64).reshape(-1, len(QUANTITIES)).T,
+            np.array(price, dtype=np.int64),
+        )
+        if compact_chunks:
+            rows = tuple(
+                np.concatenate([chunk[i] for chunk in [rows, *compact_chunks]], axis=1 if i == 3 else 0)
+                for i in range(len(rows))
+            )
+        return (
+            *rows,
+            np.array(day_date, dtype=np.int32),
+            np.array(day_revenue, dtype=np.int64),
+        )
+
+    def load(self, inventories: Iterable[dict], version: str, catalogues: Optional[dict] = None):
+        """Replace the whole table with `inventories`, as of `version` (`catalogues`: entries of the compact days)."""
+        self._reset()
+        columns = self._columns(inventories, catalogues)
+        self.usable = columns is not None
+        if self.usable:
+            (self.line_date, self.line_product, self.line_category, self.quantities,
+             self.price, self.day_date, self.day_revenue) = columns
+        self.version = version
+
+    def apply_inventory_changes(self, changes: list):
+        """Replace the days of the (before, after) inventory changes, without rescanning the collection."""
+        self.changes += 1
+        if not self.usable:
+            return
+        removed = [to_ordinal(doc["date"]) for change in changes for doc in change if doc]
+        columns = self._columns([after for _, after in changes if after])
+        if columns is None or None in removed:
+            self.usable = False
+            return
+        keep_lines = ~np.isin(self.line_date, removed)
+        keep_days = ~np.isin(self.day_date, removed)
+        line_date, line_product, line_category, quantities, price, day_date, day_revenue = columns
+        self.line_date = np.concatenate([self.line_date[keep_lines], line_date])
+        self.line_product = np.concatenate([self.line_product[keep_lines], line_product])
+        self.line_category = np.concatenate([self.line_category[keep_lines], line_category])
+        self.quantities = np.concatenate([self.quantities[:, keep_lines], quantities], axis=1)
+        self.price = np.concatenate([self.price[keep_lines], price])
+        self.day_date = np.concatenate([self.day_date[keep_days], day_date])
+        self.day_revenue = np.concatenate([self.day_revenue[keep_days], day_revenue])
+
+    def apply_line_change(self, date_str: str, product_id: str, deltas: dict, revenue_delta: int):
+        """Shift the first line of `product_id` on `date_str` (the one a positional update modifies)."""
+        self.changes += 1
+        if not self.usable:
+            return
+        ordinal, index = to_ordinal(date_str), self.product_index.get(product_id)
+        rows = []
+        if ordinal is not None and index is not None:
+            rows = np.flatnonzero((self.line_date == ordinal) & (self.line_product == index))
+        if not len(rows):
+            self.usable = False
+            return
+        # Copied, not updated in place: snapshots being read by the offload threads share the arrays
+        quantities, day_revenue = self.quantities.copy(), self.day_revenue.copy()
+        for q, field in enumerate(QUANTITIES):
+            quantities[q, rows[0]] += deltas.get(field, 0)
+        day_revenue[self.day_date == ordinal] += revenue_delta
+        self.quantities, self.day_revenue = quantities, day_revenue
+
+    def snapshot(self) -> "AnalyticsTable":
+        """A read-only view for another thread: writes replace the arrays and grow the product lists, never the view's."""
+        view = copy.copy(self)
+        view.product_ids = list(self.product_ids)
+        view.product_index = dict(self.product_index)
+        view.product_meta = list(self.product_meta)
+        view.categories = list(self.categories)
+        return view
+
+    def mark_version(self, current: str):
+        """After applying a local write: adopt `current` if that write is the only one since our version."""
+        epoch, seq = current.rsplit("-", 1)
+        self.version = current if self.usable and self.version == f"{epoch}-{int(seq) - 1}" else None
+
+    @staticmethod
+    def _range_mask(column: np.ndarray, start: Optional[int], end: Optional[int]) -> np.ndarray:
+        mask = np.ones(len(column), dtype=bool)
+        if start is not None:
+            mask &= column >= start
+        if end is not None:
+            mask &= column <= end
+        return mask
+
+    def _revenue(self, codes: np.ndarray, lines: np.ndarray, size: int) -> np.ndarray:
+        """Revenue in cents per code: bincount sums in float64, exact for integers below 2**53 cents."""
+        weights = self.quantities[1, lines] * self.price[lines]
+        return np.bincount(codes, weights=weights, minlength=size).astype(np.int64)
+
+    def summary(self, start_date: Optional[str], end_date: Optional[str]) -> dict:
+        """Per-product totals and day totals over a date range, as vectorized group-bys."""
+        start = to_ordinal(start_date) if start_date else None
+        end = to_ordinal(end_date) if end_date else None
+        days = self._range_mask(self.day_date, start, end)
+        lines = self._range_mask(self.line_date, start, end)
+
+        products = self.line_product[lines]
+        size = len(self.product_ids)
+        produced, sold, wasted = (np.bincount(products, weights=q[lines], minlength=size) for q in self.quantities)
+        revenue = self._revenue(products, lines, size)
+
+        # Products in order of first appearance in the range
+        first_seen = np.full(size, np.iinfo(np.int32).max)
+        np.minimum.at(first_seen, products, self.line_date[lines])
+        present = np.unique(products)
+        order = present[np.lexsort((present, first_seen[present]))]
+
+        return {
+            "total_sales": money.to_euros(int(self.day_revenue[days].sum())),
+            "days": int(days.sum()),
+            "products": [
+                {
+                    "product_id": self.product_ids[i],
+                    **self.product_meta[i],
+                    "total_produced": int(produced[i]),
+                    "total_sold": int(sold[i]),
+                    "total_wasted": int(wasted[i]),
+                    "total_revenue": money.to_euros(int(revenue[i])),
+                }
+                for i in order
+            ],
+        }
+
+    def breakdown(self, by: str, start_date: Optional[str], end_date: Optional[str]) -> list:
+        """Totals per category, weekday (0 = Monday) or month over a date range, with the number of days involved."""
+        start = to_ordinal(start_date) if start_date else None
+        end = to_ordinal(end_date) if end_date else None
+        lines = self._range_mask(self.line_date, start, end)
+        dates = self.line_date[lines]
+
+        if by == "category":
+            codes, labels = self.line_category[lines], self.categories
+        elif by == "weekday":
+            # Ordinal 1 (0001-01-01) is a Monday
+            codes, labels = (dates - 1) % 7, list(range(7))
+        else:
+            unique_dates, codes = np.unique(dates, return_inverse=True)
+            months = [date.fromordinal(d).strftime("%Y-%m") for d in unique_dates.tolist()]
+            labels = sorted(set(months))
+            position = {m: i for i, m in enumerate(labels)}
+            month_code = np.array([position[m] for m in months], dtype=np.int64)
+            codes = month_code[codes] if len(codes) else codes
+
+        size = len(labels)
+        totals = [np.bincount(codes, weights=q[lines], minlength=size) for q in self.quantities]
+        revenue = self._revenue(codes, lines, size)
+        # Distinct (group, day) pairs
+        pairs = np.unique(np.stack([codes.astype(np.int64), dates.astype(np.int64)]), axis=1)
+        days = np.bincount(pairs[0], minlength=size)
+
+        groups = [
+            {
+                "key": labels[i],
+                "days": int(days[i]),
+                "total_produced": int(totals[0][i]),
+                "total_sold": int(totals[1][i]),
+                "total_wasted": int(totals[2][i]),
+                "total_revenue": money.to_euros(int(revenue[i])),
+            }
+            for i in range(size)
+            if days[i]
+        ]
+        # Same order as a MongoDB $sort on the key (null first)
+        return sorted(groups, key=lambda g: (g["key"] is not None, g["key"] or 0))
+
+    def product_series(self, product_id: str, start_date: Optional[str], end_date: Optional[str]) -> list:
+        """Every line of one product over a date range, in date order."""
+        index = self.product_index.get(product_id)
+        if index is None:
+            return []
+        start = to_ordinal(start_date) if start_date else None
+        end = to_ordinal(end_date) if end_date else None
+        rows = np.flatnonzero(self._range_mask(self.line_date, start, end) & (self.line_product == index))
+        rows = rows[np.argsort(self.line_date[rows], kind="stable")]
+        produced, sold, wasted = (q[rows].tolist() for q in self.quantities)
+        revenue = (self.quantities[1, rows] * self.price[rows] / money.CENTS).tolist()
+        dates = [date.fromordinal(d).strftime("%Y-%m-%d") for d in self.line_date[rows].tolist()]
+        return [
+            {"date": d, "produced": p, "sold": s, "wasted": w, "revenue": r}
+            for d, p, s, w, r in zip(dates, produced, sold, wasted, revenue)
+        ]
+
+    def accepts_bounds(self, *bounds: Optional[str]) -> bool:
+        """Whether the table can answer a range given as strings (MongoDB compares non-dates lexically)."""
+        return self.usable and all(not b or to_ordinal(b) is not None for b in bounds)
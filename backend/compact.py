@@ -0,0 +1,286 @@
+"""
+Compact inventory storage
+Columnar layout of closed inventory days: parallel arrays of catalogue indexes and counts
+
+A row-layout day repeats product_id, product_name, category and price in every
+line. A compact day replaces its `products` array by
+
+    "catalogue": "<snapshot version>",
+    "columns": {"entry": [3, 0, ...], "produced": [...], "sold": [...], "wasted": [...], "remaining": [...]}
+
+where `entry` indexes the product entries of a catalogue snapshot stored once
+in the inventory_catalogues collection. Snapshots are append-only: each
+migration extends the latest one with the (product_id, name, category, price)
+entries it meets and stores the result under a new version (the digest of its
+entries), so the indexes of days compacted earlier stay valid.
+
+Both layouts live in the inventories collection. Writes always store the row
+layout (editing a compact day turns it back into rows); readers expand compact
+days with expand_docs, or with EXPAND_STAGES inside an aggregation. The
+analytics table reads the columns directly.
+
+Usage:
+    python compact.py --older-than 90          # compact the days older than 90 days
+    python compact.py --before 2025-01-01      # compact the days before a date
+    python compact.py --expand                 # turn every compact day back into rows
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from pymongo import ReplaceOne
+
+CATALOGUES = "inventory_catalogues"
+
+# Line fields held by the catalogue entries, in the order of a row-layout line (the counts go before price)
+ENTRY_FIELDS = ("product_id", "product_name", "category", "price")
+# column -> inventory line field
+COUNTS = {
+    "produced": "quantity_produced",
+    "sold": "quantity_sold",
+    "wasted": "quantity_wasted",
+    "remaining": "quantity_remaining",
+}
+
+# Snapshots are immutable: version -> entries, shared by every caller of this process
+snapshots = {}
+
+
+def is_compact(doc: Optional[dict]) -> bool:
+    return bool(doc) and "columns" in doc
+
+
+def snapshot_version(entries: list) -> str:
+    return hashlib.sha1(json.dumps(entries, sort_keys=True).encode()).hexdigest()[:24]
+
+
+def expand(doc: dict, entries: list) -> dict:
+    """Turn a compact day back into the row layout, in place (`products` takes the position of `columns`)."""
+    columns = doc["columns"]
+    counts = [(field, columns.get(column) or [0] * len(columns["entry"])) for column, field in COUNTS.items()]
+    products = []
+    for i, e in enumerate(columns["entry"]):
+        entry = entries[e]
+        line = {field: entry[field] for field in ENTRY_FIELDS[:3]}
+        line.update((field, values[i]) for field, values in counts)
+        line["price"] = entry["price"]
+        products.append(line)
+    items = list(doc.items())
+    doc.clear()
+    for key, value in items:
+        if key == "columns":
+            doc["products"] = products
+        elif key != "catalogue":
+            doc[key] = value
+    return doc
+
+
+async def load_catalogues(db, docs: list) -> dict:
+    """The entries of every snapshot referenced by `docs`, fetching the ones not seen yet."""
+    versions = {doc["catalogue"] for doc in docs if is_compact(doc)}
+    missing = versions - snapshots.keys()
+    if missing:
+        async for snapshot in db[CATALOGUES].find({"_id": {"$in": list(missing)}}):
+            snapshots[snapshot["_id"]] = snapshot["products"]
+        if missing - snapshots.keys():
+            raise RuntimeError(f"Inventory catalogue snapshot(s) not found: {sorted(missing - snapshots.keys())}")
+    return {version: snapshots[version] for version in versions}
+
+
+async def expand_docs(db, docs: list) -> list:
+    """Expand the compact days among `docs` in place (row-layout documents are left untouched)."""
+    if any(is_compact(doc) for doc in docs):
+        catalogues = await load_catalogues(db, docs)
+        for doc in docs:
+            if is_compact(doc):
+                expand(doc, catalogues[doc["catalogue"]])
+    return docs
+
+
+async def has_line(db, date_str: str, product_id: str) -> bool:
+    """Whether the day holds a line for `product_id`, in either layout (a compact day is not rewritten)."""
+    doc = await db.inventories.find_one(
+        {"date": date_str},
+        {"_id": 0, "products": {"$elemMatch": {"product_id": product_id}}, "columns.entry": 1, "catalogue": 1},
+    )
+    if not is_compact(doc):
+        return bool(doc and doc.get("products"))
+    entries = (await load_catalogues(db, [doc]))[doc["catalogue"]]
+    return any(entries[e]["product_id"] == product_id for e in doc["columns"]["entry"])
+
+
+async def expand_stored(db, date_str: str):
+    """Rewrite one compact day in the row layout, before an in-place update of its lines."""
+    doc = await db.inventories.find_one({"date": date_str, "columns": {"$exists": True}})
+    if doc is not None:
+        catalogue = doc["catalogue"]
+        await expand_docs(db, [doc])
+        await db.inventories.replace_one({"_id": doc["_id"], "catalogue": catalogue}, doc)
+
+
+async def catalogues_with(db, product_id: str) -> list:
+    """Versions of the snapshots holding `product_id`: the compact days that may contain it reference one of them."""
+    return [s["_id"] async for s in db[CATALOGUES].find({"products.product_id": product_id}, {"_id": 1})]
+
+
+def _entry_expression(column: str):
+    return {"$arrayElemAt": [f"$columns.{column}", "$$i"]}
+
+
+# Aggregation stages giving compact days a `products` array, placed after the $match of a pipeline
+EXPAND_STAGES = [
+    {"$lookup": {"from": CATALOGUES, "localField": "catalogue", "foreignField": "_id", "as": "_catalogue"}},
+    {"$addFields": {"products": {"$cond": [
+        {"$eq": [{"$size": "$_catalogue"}, 0]},
+        "$products",
+        {"$let": {
+            "vars": {"entries": {"$arrayElemAt": ["$_catalogue.products", 0]}},
+            "in": {"$map": {
+                "input": {"$range": [0, {"$size": "$columns.entry"}]},
+                "as": "i",
+                "in": {"$let": {
+                    "vars": {"entry": {"$arrayElemAt": ["$$entries", _entry_expression("entry")]}},
+                    "in": {
+                        **{field: f"$$entry.{field}" for field in ENTRY_FIELDS[:3]},
+                        **{field: _entry_expression(column) for column, field in COUNTS.items()},
+                        "price": "$$entry.price",
+                    },
+                }},
+            }},
+        }},
+    ]}}},
+    {"$project": {"_catalogue": 0, "catalogue": 0, "columns": 0}},
+]
+
+
+def _entry_key(line: dict) -> tuple:
+    return tuple(line.get(field) for field in ENTRY_FIELDS)
+
+
+def _compactable(line: dict) -> bool:
+    """Lines with extra fields or non-integer counts stay in the row layout."""
+    return (
+        set(line) <= set(ENTRY_FIELDS) | set(COUNTS.values())
+        and isinstance(line.get("product_id"), str)
+        and all(type(line.get(field, 0)) is int for field in COUNTS.values())
+    )
+
+
+def compact_doc(doc: dict, index: dict, version: str) -> Optional[dict]:
+    """The compact version of a row-layout day, or None if one of its lines is not in `index`."""
+    lines = doc.get("products") or []
+    if not all(_compactable(line) and _entry_key(line) in index for line in lines):
+        return None
+    columns = {"entry": [index[_entry_key(line)] for line in lines]}
+    for column, field in COUNTS.items():
+        columns[column] = [line.get(field, 0) for line in lines]
+    compacted = {}
+    for key, value in doc.items():
+        if key == "products":
+            compacted["catalogue"] = version
+            compacted["columns"] = columns
+        else:
+            compacted[key] = value
+    return compacted
+
+
+async def migrate(db, before: str, batch_size: int = 500, log=print) -> dict:
+    """Compact the row-layout days dated before `before` (two passes: catalogue entries, then the days)."""
+    latest = await db[CATALOGUES].find_one({}, sort=[("size", -1)])
+    entries = list(latest["products"]) if latest else []
+    index = {_entry_key(entry): i for i, entry in enumerate(entries)}
+    query = {"date": {"$lt": before}, "columns": {"$exists": False}}
+
+    async for doc in db.inventories.find(query, {"_id": 0, **{f"products.{f}": 1 for f in ENTRY_FIELDS}}):
+        for line in doc.get("products") or []:
+            key = _entry_key(line)
+            if key not in index and isinstance(line.get("product_id"), str):
+                index[key] = len(entries)
+                entries.append({field: line.get(field) for field in ENTRY_FIELDS})
+    report = {"compacted": 0, "skipped": 0, "catalogue": None, "entries": len(entries)}
+    if not entries:
+        return report
+
+    version = snapshot_version(entries)
+    if latest is None or latest["_id"] != version:
+        await db[CATALOGUES].replace_one(
+            {"_id": version},
+            {"_id": version, "size": len(entries), "products": entries, "created_at": datetime.utcnow()},
+            upsert=True
+        )
+        log(f"✓ Catalogue snapshot {version}: {len(entries)} entries")
+    report["catalogue"] = version
+
+    async def flush(ops):
+        # Guarded on updated_at: a day edited since it was read is left for the next run
+        result = await db.inventories.bulk_write(ops, ordered=False)
+        report["compacted"] += result.modified_count
+        report["skipped"] += len(ops) - result.matched_count
+
+    ops = []
+    async for doc in db.inventories.find(query).sort("date", 1):
+        compacted = compact_doc(doc, index, version)
+        if compacted is None:
+            report["skipped"] += 1
+            continue
+        ops.append(ReplaceOne({"_id": doc["_id"], "updated_at": doc.get("updated_at")}, compacted))
+        if len(ops) == batch_size:
+            await flush(ops)
+            ops = []
+    if ops:
+        await flush(ops)
+    return report
+
+
+async def expand_all(db, batch_size: int = 500) -> int:
+    """Turn every compact day back into the row layout."""
+    expanded = 0
+    ops = []
+    async for doc in db.inventories.find({"columns": {"$exists": True}}):
+        catalogue = doc["catalogue"]
+        await expand_docs(db, [doc])
+        ops.append(ReplaceOne({"_id": doc["_id"], "catalogue": catalogue}, doc))
+        if len(ops) == batch_size:
+            expanded += (await db.inventories.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        expanded += (await db.inventories.bulk_write(ops, ordered=False)).modified_count
+    return expanded
+
+
+async def collection_size(db) -> str:
+    stats = await db.command("collStats", "inventories")
+    return f"{stats['count']} days, {stats['size'] / 1e6:.1f} MB ({stats.get('avgObjSize', 0) / 1e3:.1f} kB/day)"
+
+
+async def main(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    print(f"inventories: {await collection_size(db)}")
+    if args.expand:
+        print(f"✓ {await expand_all(db)} days expanded")
+    else:
+        before = args.before or (date.today() - timedelta(days=args.older_than)).strftime("%Y-%m-%d")
+        report = await migrate(db, before)
+        print(f"✓ {report['compacted']} days before {before} compacted, {report['skipped']} left in the row layout")
+    print(f"inventories: {await collection_size(db)}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact inventory storage")
+    parser.add_argument("--before", help="compact the days before this date (YYYY-MM-DD)")
+    parser.add_argument("--older-than", type=int, default=90, help="compact the days older than this many days")
+    parser.add_argument("--expand", action="store_true", help="turn every compact day back into rows")
+    asyncio.run(main(parser.parse_args()))
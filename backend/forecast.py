@@ -0,0 +1,167 @@
+"""
+Production forecasting
+Per-product, day-of-week demand models fitted on the daily statistics rollups
+
+Each product keeps one exponentially smoothed level of quantity_sold per
+weekday, plus a smoothed squared error used as a safety margin. The model
+parameters are stored in the forecast_models collection (one document per
+product, and a product_id = None document recording how far the fit went)
+and are only moved forward by the days inventoried since the last fit.
+
+Only closed days (before today) are fitted: the current day is still being
+entered and would otherwise force a refit on every correction. Writing an
+inventory for an already fitted day marks the models stale, and the next
+forecast replays the history.
+
+Usage:
+    python forecast.py --refit     # refit every model from the full history
+"""
+import argparse
+import asyncio
+import math
+import os
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import ReplaceOne
+
+import offload
+import rollups
+
+MODELS = "forecast_models"
+
+# Read at import, by the server as by the CLI: both must fit with the same settings,
+# a change of alpha replays the whole history
+load_dotenv(Path(__file__).parent / '.env')
+ALPHA = float(os.environ.get('FORECAST_ALPHA', '0.3'))
+SAFETY_FACTOR = float(os.environ.get('FORECAST_SAFETY_FACTOR', '1.0'))
+
+
+async def mark_stale(db, date_str: str):
+    """Called on every inventory write: a change to an already fitted day invalidates the models."""
+    await db[MODELS].update_one(
+        {"product_id": None, "fitted_through": {"$gte": date_str}},
+        {"$min": {"refit_from": date_str}}
+    )
+
+
+def fit(levels: np.ndarray, variances: np.ndarray, counts: np.ndarray,
+        sold: np.ndarray, weekdays: list, alpha: float = ALPHA):
+    """Advance the (product, weekday) smoothing state in place over `sold` (product x day, NaN = not inventoried).
+
+    The recursion runs over the days but every step updates all the products at once.
+    """
+    for day, weekday in enumerate(weekdays):
+        observed = sold[:, day]
+        seen = ~np.isnan(observed)
+        first = seen & (counts[:, weekday] == 0)
+        error = np.where(seen, observed - levels[:, weekday], 0.0)
+        levels[:, weekday] = np.where(first, observed, levels[:, weekday] + alpha * error)
+        variances[:, weekday] = np.where(
+            first, 0.0, np.where(seen, (1 - alpha) * (variances[:, weekday] + alpha * error ** 2), variances[:, weekday])
+        )
+        counts[:, weekday] += seen
+
+
+async def refresh(db, today: Optional[str] = None) -> dict:
+    """Bring the stored models up to the last closed day and return them with their fit state."""
+    today = today or date.today().strftime("%Y-%m-%d")
+    docs = await db[MODELS].find({}, {"_id": 0}).to_list(None)
+    state = next((d for d in docs if d["product_id"] is None), None)
+    models = {d["product_id"]: d for d in docs if d["product_id"] is not None}
+
+    replay = state is None or state.get("refit_from") is not None or state.get("alpha") != ALPHA
+    if replay:
+        # First fit, a fitted day changed or the smoothing changed: replay the whole history
+        state = {"product_id": None, "fitted_through": None, "alpha": ALPHA}
+        models = {}
+
+    query = {"date": {"$lt": today}}
+    if state["fitted_through"]:
+        query["date"]["$gt"] = state["fitted_through"]
+    rows = await db[rollups.DAILY].find(query, {"_id": 0, "date": 1, "product_id": 1, "sold": 1,
+                                                "product_name": 1, "category": 1}).sort("date", 1).to_list(None)
+    days = sorted({r["date"] for r in rows if rollups.is_date(r["date"])})
+    if not days:
+        return {"state": state, "models": models}
+
+    # CPU-bound on a long history: off the event loop
+    await offload.run("forecast", fit_rows, models, rows, days)
+    state = {"product_id": None, "fitted_through": days[-1], "alpha": ALPHA}
+
+    if replay:
+        await db[MODELS].delete_many({})
+    await db[MODELS].bulk_write([
+        ReplaceOne({"product_id": doc["product_id"]}, doc, upsert=True)
+        for doc in [*models.values(), state]
+    ])
+    return {"state": state, "models": models}
+
+
+def fit_rows(models: dict, rows: list, days: list):
+    """Move `models` (updated in place, new products added) forward by the daily rollup rows of `days`."""
+    day_index = {d: j for j, d in enumerate(days)}
+    rows = [r for r in rows if r["date"] in day_index and r["product_id"] is not None]
+    for row in rows:
+        if row["product_id"] not in models:
+            models[row["product_id"]] = {"product_id": row["product_id"], "level": [0.0] * 7,
+                                         "variance": [0.0] * 7, "count": [0] * 7}
+    product_ids = list(models)
+    index = {prod_id: i for i, prod_id in enumerate(product_ids)}
+
+    sold = np.full((len(product_ids), len(days)), np.nan)
+    for row in rows:
+        sold[index[row["product_id"]], day_index[row["date"]]] = row.get("sold", 0)
+        # Rows are date-ordered: the latest name and category win
+        models[row["product_id"]].update(product_name=row.get("product_name"), category=row.get("category"))
+
+    levels = np.array([models[p]["level"] for p in product_ids], dtype=float)
+    variances = np.array([models[p]["variance"] for p in product_ids], dtype=float)
+    counts = np.array([models[p]["count"] for p in product_ids], dtype=np.int64)
+    fit(levels, variances, counts, sold, [datetime.strptime(d, "%Y-%m-%d").weekday() for d in days])
+
+    for i, prod_id in enumerate(product_ids):
+        models[prod_id].update(level=levels[i].tolist(), variance=variances[i].tolist(), count=counts[i].tolist())
+
+
+def predict(model: dict, weekday: int, safety_factor: float = SAFETY_FACTOR) -> Optional[dict]:
+    """Expected sales and suggested production for one product on one weekday."""
+    count = model["count"][weekday]
+    if count:
+        level, variance = model["level"][weekday], model["variance"][weekday]
+    else:
+        # Never inventoried on that weekday: fall back on the other weekdays
+        seen = [d for d in range(7) if model["count"][d]]
+        if not seen:
+            return None
+        level = sum(model["level"][d] for d in seen) / len(seen)
+        variance = sum(model["variance"][d] for d in seen) / len(seen)
+    expected = max(level, 0.0)
+    return {
+        "expected_sold": round(expected, 1),
+        "suggested_production": math.ceil(expected + safety_factor * math.sqrt(variance) - 1e-9),
+        "observations": count,
+    }
+
+
+async def main(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if args.refit:
+        await db[MODELS].update_many({"product_id": None}, {"$set": {"refit_from": ""}})
+        result = await refresh(db)
+        print(f"✓ {len(result['models'])} product models fitted through {result['state']['fitted_through']}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Production forecasting models")
+    parser.add_argument("--refit", action="store_true", help="refit every model from the full history")
+    asyncio.run(main(parser.parse_args()))
@@ -1,39 +1,263 @@
 """
 Database initialization script
-Creates indexes for optimized queries
+Declares the indexes backing every query shape of server.py and keeps the database in sync with them
+
+Usage:
+    python init_db.py                   # create missing indexes, drop obsolete ones
+    python init_db.py --keep-obsolete   # only create missing indexes
+    python init_db.py --check           # explain() every query shape, fail on a COLLSCAN
+
+The server also calls ensure_indexes() on startup.
 """
+import argparse
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
-from dotenv import load_dotenv
+import sys
 from pathlib import Path
 
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
 
-async def init_database():
+# MongoDB error codes
+INDEX_NOT_FOUND = 27
+DUPLICATE_KEY = 11000
+
+# collection -> [(keys, options)]
+INDEXES = {
+    "products": [
+        # GET /products, export: filter on is_archived, keyset pages sorted by _id
+        ([("is_archived", ASCENDING), ("_id", ASCENDING)], {}),
+    ],
+    "inventories": [
+        # One inventory per day: lookups by date, upserts, sort for GET /inventories, range $match for stats/export
+        ([("date", DESCENDING)], {"unique": True}),
+        # Keyset pages of GET /inventories
+        ([("date", DESCENDING), ("_id", DESCENDING)], {}),
+        # Per-product history (/stats/product/{product_id}), multikey
+        ([("products.product_id", ASCENDING), ("date", ASCENDING)], {}),
+        # Compact days (compact.py) referencing a catalogue snapshot: $or branch of /stats/product/{product_id}
+        ([("catalogue", ASCENDING), ("date", ASCENDING)], {"sparse": True}),
+    ],
+    "employees": [
+        # GET /employees sorted by name (and its keyset pages)
+        ([("full_name", ASCENDING), ("_id", ASCENDING)], {}),
+        # Active employees: {"is_active": true} branch of the $or
+        ([("is_active", ASCENDING), ("full_name", ASCENDING)], {}),
+    ],
+    "payrolls": [
+        # One entry per employee and period (POST /payrolls/generate), GET /payrolls?employee_id=... sorted by period,
+        # $lookup of /payrolls/summary
+        ([("employee_id", ASCENDING), ("period", DESCENDING)], {"unique": True}),
+        # GET /payrolls?period=... and keyset pages sorted by period
+        ([("period", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    "stats_daily": [
+        ([("date", ASCENDING), ("product_id", ASCENDING)], {"unique": True}),
+    ],
+    "stats_monthly": [
+        ([("month", ASCENDING), ("product_id", ASCENDING)], {"unique": True}),
+    ],
+    "forecast_models": [
+        # One model per product, the fit state under product_id = None (forecast.mark_stale on every inventory write)
+        ([("product_id", ASCENDING)], {"unique": True}),
+    ],
+}
+
+
+class DuplicateKeys(Exception):
+    """Existing documents share the key of a declared unique index, which therefore cannot be built."""
+
+    def __init__(self, duplicates: dict):
+        self.duplicates = duplicates
+        details = "; ".join(
+            f"{index}: " + ", ".join(f"{d['key']} ({d['count']} documents)" for d in found)
+            for index, found in duplicates.items()
+        )
+        super().__init__(f"Duplicate keys block unique indexes, remove or merge these documents: {details}")
+
+
+def index_name(keys) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+async def find_duplicates(collection, keys, limit: int = 10) -> list:
+    """Key values held by more than one document (the first `limit`), with the _id of those documents."""
+    group_key = {field.replace(".", "_"): f"${field}" for field, _ in keys}
+    pipeline = [
+        {"$group": {"_id": group_key, "count": {"$sum": 1}, "ids": {"$push": "$_id"}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": limit},
+    ]
+    return [
+        {"key": row["_id"], "count": row["count"], "ids": [str(i) for i in row["ids"]]}
+        async for row in collection.aggregate(pipeline)
+    ]
+
+
+async def drop_index(collection, name: str):
+    """Drop an index, already gone included (workers starting together synchronize concurrently)."""
+    try:
+        await collection.drop_index(name)
+    except OperationFailure as e:
+        if e.code != INDEX_NOT_FOUND:
+            raise
+
+
+async def restore_index(collection, keys, name: str, previous: dict, log=print):
+    """Put back an index dropped for a rebuild that failed, with its previous options."""
+    try:
+        await collection.create_index(keys, name=name, **{o: True for o in ("unique", "sparse") if previous.get(o)})
+        log(f"✓ Index {collection.name}.{name} restored with its previous options")
+    except OperationFailure as e:
+        log(f"✗ Index {collection.name}.{name} could not be restored: {e}")
+
+
+async def ensure_indexes(db, drop_obsolete: bool = True, log=print) -> dict:
+    """Create the declared indexes, recreate those whose options changed and drop the undeclared ones.
+
+    A unique index that duplicate documents would make fail is left as it is (missing, or with its
+    previous options); once every other index is in sync, DuplicateKeys lists the conflicting documents.
+    """
+    report = {"created": [], "dropped": [], "failed": []}
+    duplicates = {}
+    for collection_name, specs in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        declared = set()
+        for keys, options in specs:
+            name = index_name(keys)
+            declared.add(name)
+            current = existing.get(name)
+            if current is not None and all(bool(current.get(o)) == bool(options.get(o)) for o in ("unique", "sparse")):
+                continue
+            if options.get("unique"):
+                # Checked before anything is dropped: the writes relying on the index must not lose it
+                found = await find_duplicates(collection, keys)
+                if found:
+                    duplicates[f"{collection_name}.{name}"] = found
+                    report["failed"].append(f"{collection_name}.{name}")
+                    log(f"✗ Unique index {collection_name}.{name} blocked by duplicates: "
+                        + ", ".join(f"{d['key']} ({', '.join(d['ids'])})" for d in found))
+                    continue
+            try:
+                if current is not None:
+                    await drop_index(collection, name)
+                    report["dropped"].append(f"{collection_name}.{name}")
+                await collection.create_index(keys, name=name, **options)
+                report["created"].append(f"{collection_name}.{name}")
+                log(f"✓ Index created: {collection_name}.{name}{' (unique)' if options.get('unique') else ''}")
+            except OperationFailure as e:
+                # e.g. a duplicate written since the check: report it rather than aborting
+                report["failed"].append(f"{collection_name}.{name}")
+                log(f"✗ Index {collection_name}.{name} could not be created: {e}")
+                if e.code == DUPLICATE_KEY and options.get("unique"):
+                    duplicates[f"{collection_name}.{name}"] = await find_duplicates(collection, keys)
+                if current is not None:
+                    await restore_index(collection, keys, name, current, log)
+        if drop_obsolete:
+            for name in existing:
+                if name != "_id_" and name not in declared:
+                    try:
+                        await drop_index(collection, name)
+                    except OperationFailure as e:
+                        report["failed"].append(f"{collection_name}.{name}")
+                        log(f"✗ Obsolete index {collection_name}.{name} could not be dropped: {e}")
+                        continue
+                    report["dropped"].append(f"{collection_name}.{name}")
+                    log(f"✓ Obsolete index dropped: {collection_name}.{name}")
+    if duplicates:
+        raise DuplicateKeys(duplicates)
+    return report
+
+
+def query_shapes() -> list:
+    """Representative filtered queries issued by server.py and rollups.py, as explain() command bodies."""
+    some_id = ObjectId()
+    keyset = {"$or": [{"date": {"$lt": "2024-01-15"}}, {"date": "2024-01-15", "_id": {"$lt": some_id}}]}
+    return [
+        ("GET /products", {"find": "products", "filter": {"is_archived": False}}),
+        ("GET /products (page)", {"find": "products", "filter": {"$and": [{"is_archived": False}, {"_id": {"$gt": some_id}}]}, "sort": {"_id": 1}}),
+        ("GET /products/{id}", {"find": "products", "filter": {"_id": some_id}}),
+        ("GET /inventories", {"find": "inventories", "filter": {}, "sort": {"date": -1}, "limit": 30}),
+        ("GET /inventories (page)", {"find": "inventories", "filter": {"$and": [{}, keyset]}, "sort": {"date": -1, "_id": -1}, "limit": 31}),
+        ("GET /inventories/{date}", {"find": "inventories", "filter": {"date": "2024-01-15"}}),
+        ("POST /inventories/bulk", {"find": "inventories", "filter": {"date": {"$in": ["2024-01-15", "2024-01-16"]}}}),
+        ("GET /export", {"find": "inventories", "filter": {"date": {"$gte": "2024-01-01", "$lte": "2024-12-31"}}, "sort": {"date": -1}}),
+        ("GET /stats/product/{id}", {"aggregate": "inventories", "pipeline": [
+            {"$match": {"$or": [{"products.product_id": "p"}, {"catalogue": {"$in": ["c"]}}], "date": {"$gte": "2024-01-01"}}},
+            {"$sort": {"date": 1}}
+        ], "cursor": {}}),
+        ("GET /stats/summary (months)", {"find": "stats_monthly", "filter": {"month": {"$gte": "2024-01", "$lte": "2024-12"}}}),
+        ("GET /stats/summary (edge days)", {"find": "stats_daily", "filter": {"date": {"$gte": "2024-01-05", "$lt": "2024-02-01"}}}),
+        ("rollups daily row", {"find": "stats_daily", "filter": {"date": "2024-01-15", "product_id": "p"}}),
+        ("rollups monthly row", {"find": "stats_monthly", "filter": {"month": "2024-01", "product_id": "p"}}),
+        ("forecast.mark_stale", {"find": "forecast_models", "filter": {"product_id": None, "fitted_through": {"$gte": "2024-01-15"}}}),
+        ("GET /forecast (archived products)", {"find": "products", "filter": {"is_archived": True}, "projection": {"_id": 1}}),
+        ("GET /employees", {"find": "employees", "filter": {"$or": [{"is_active": True}, {"is_active": {"$exists": False}}]}, "sort": {"full_name": 1}}),
+        ("GET /employees (page)", {"find": "employees", "filter": {"full_name": {"$gt": "M"}}, "sort": {"full_name": 1, "_id": 1}}),
+        ("GET /payrolls?employee_id", {"find": "payrolls", "filter": {"employee_id": "e"}, "sort": {"period": -1}}),
+        ("GET /payrolls?period", {"find": "payrolls", "filter": {"period": "2024-01"}, "sort": {"period": -1}}),
+        ("GET /payrolls?employee_id&period", {"find": "payrolls", "filter": {"employee_id": "e", "period": "2024-01"}, "sort": {"period": -1}}),
+    ]
+
+
+def find_collscans(plan) -> bool:
+    """True if the winning plan of an explain() output contains a COLLSCAN stage."""
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(find_collscans(value) for key, value in plan.items() if key != "rejectedPlans")
+    if isinstance(plan, list):
+        return any(find_collscans(item) for item in plan)
+    return False
+
+
+async def check_query_plans(db, log=print) -> list:
+    """Explain every query shape and return the names of those resolved with a collection scan."""
+    failures = []
+    for name, command in query_shapes():
+        explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        if find_collscans(explain):
+            failures.append(name)
+            log(f"✗ COLLSCAN: {name}")
+        else:
+            log(f"✓ {name}")
+    return failures
+
+
+async def init_database(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(ROOT_DIR / '.env')
     # MongoDB connection
     mongo_url = os.environ['MONGO_URL']
     client = AsyncIOMotorClient(mongo_url)
     db = client[os.environ['DB_NAME']]
-    
-    print("Creating indexes for optimal performance...")
-    
-    # Create index on products.is_archived for filtering
-    await db.products.create_index([('is_archived', 1)])
-    print("✓ Index created: products.is_archived")
-    
-    # Create index on inventories.date for sorting (descending for recent first)
-    await db.inventories.create_index([('date', -1)])
-    print("✓ Index created: inventories.date (descending)")
-    
-    # Create compound index for common query pattern
-    await db.inventories.create_index([('date', -1), ('total_revenue', -1)])
-    print("✓ Index created: inventories.date + total_revenue")
-    
-    print("\n✅ Database indexes initialized successfully!")
-    
+
+    print("Synchronizing indexes...")
+    try:
+        report = await ensure_indexes(db, drop_obsolete=not args.keep_obsolete)
+    except DuplicateKeys as e:
+        print(f"\n❌ {e}")
+        client.close()
+        sys.exit(1)
+    print(f"\n✅ Indexes in sync ({len(report['created'])} created, {len(report['dropped'])} dropped)")
+
+    failures = report["failed"]
+    if args.check:
+        print("\nChecking query plans...")
+        failures = failures + await check_query_plans(db)
+
     client.close()
+    if failures:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    asyncio.run(init_database())
+    parser = argparse.ArgumentParser(description="Database index management")
+    parser.add_argument("--check", action="store_true", help="explain() every query shape and fail on a COLLSCAN")
+    parser.add_argument("--keep-obsolete", action="store_true", help="do not drop undeclared indexes")
+    asyncio.run(init_database(parser.parse_args()))
@@ -0,0 +1,208 @@
+"""
+Request and database metrics
+Latency histograms per API route and per MongoDB command, exposed in Prometheus text format
+
+The HTTP middleware in server.py feeds REQUEST_DURATION; the CommandListener
+below is registered on the Motor client and feeds the MONGO_* metrics, and
+offload.py feeds the OFFLOAD_* ones. PyMongo calls listeners from Motor's
+executor threads, and offloaded computations run on pool threads, hence the locks. Every worker
+process keeps its own registry: scrape each one (or sum them) in Prometheus.
+"""
+import threading
+from typing import Dict, Tuple
+
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter per label set."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class Gauge:
+    """Current value per label set."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.buckets = buckets
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # bucket counts, then sum and count
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[-1] if series else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = 'le="%g"' % bound
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {series[-1]}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "API request latency by route template", ("method", "route", "status")
+)
+MONGO_DURATION = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency", ("collection", "command")
+)
+MONGO_DOCUMENTS = Counter(
+    "mongodb_command_documents_total", "Documents returned (reads) or written (writes) by MongoDB commands",
+    ("collection", "command")
+)
+MONGO_FAILURES = Counter(
+    "mongodb_command_failures_total", "Failed MongoDB commands", ("collection", "command")
+)
+
+# Report computations run on the offload pool (offload.py)
+OFFLOAD_JOBS = Gauge(
+    "offload_jobs", "Report computations waiting for a worker (queued) or running", ("state",)
+)
+OFFLOAD_WAIT = Histogram(
+    "offload_queue_wait_seconds", "Time report computations waited for a worker", ("kind",)
+)
+OFFLOAD_DURATION = Histogram(
+    "offload_run_duration_seconds", "Run time of report computations", ("kind",)
+)
+OFFLOAD_REJECTED = Counter(
+    "offload_rejected_total", "Report computations refused (queue full) or abandoned (timeout)", ("kind", "reason")
+)
+
+REGISTRY = (
+    REQUEST_DURATION, MONGO_DURATION, MONGO_DOCUMENTS, MONGO_FAILURES,
+    OFFLOAD_JOBS, OFFLOAD_WAIT, OFFLOAD_DURATION, OFFLOAD_REJECTED,
+)
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+def reply_documents(command_name: str, reply: dict) -> int:
+    """Documents returned (cursor batch, findAndModify) or written (n) by a command reply."""
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") is not None else 0
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Record the duration and document count of every command, per collection."""
+
+    def __init__(self):
+        self._pending: Dict[Tuple, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _target(event) -> Tuple[str, str]:
+        command = event.command
+        collection = command.get("collection") if event.command_name == "getMore" else command.get(event.command_name)
+        return (collection if isinstance(collection, str) else "", event.command_name)
+
+    def started(self, event):
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = self._target(event)
+
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop((event.request_id, event.connection_id), ("", event.command_name))
+
+    def succeeded(self, event):
+        target = self._finish(event)
+        MONGO_DURATION.observe(event.duration_micros / 1e6, *target)
+        MONGO_DOCUMENTS.inc(*target, amount=reply_documents(event.command_name, event.reply))
+
+    def failed(self, event):
+        target = self._finish(event)
+        MONGO_DURATION.observe(event.duration_micros / 1e6, *target)
+        MONGO_FAILURES.inc(*target)
+
+
+command_listener = CommandMetrics()
+
@@ -0,0 +1,171 @@
+"""
+Money amounts
+Integer cents in MongoDB, euros with two decimals in the API
+
+Prices, revenues, salaries, advances and payments are stored as integer
+cents, so that line revenues (quantity x price), day totals and statistics
+are exact integer sums, in Python, in NumPy and in aggregation pipelines.
+The API keeps speaking euros: the `Money` type of the Pydantic models rounds
+incoming amounts to the cent and converts to and from cents only when a model
+is dumped to, or validated from, a stored document (context STORAGE).
+
+Databases written before cents stored the amounts as float euros: `migrate`
+converts every money field still holding a double (the API only ever wrote
+floats, so the type tells the two units apart). The server runs it at startup.
+
+Usage:
+    python money.py            # convert the remaining float amounts to cents
+"""
+import argparse
+import asyncio
+import copy
+import os
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from pathlib import Path
+from typing import Annotated
+
+from pydantic import BeforeValidator, PlainSerializer, SerializationInfo, ValidationInfo
+from pydantic_core import PydanticCustomError
+from pymongo import UpdateOne
+
+CENTS = 100
+# Largest amount MongoDB stores as an integer (int64)
+MAX_CENTS = 2 ** 63 - 1
+
+# Model validation/dump context for stored documents
+STORAGE = {"storage": "cents"}
+
+# collection -> money fields ("array.field" for the fields of an array of subdocuments)
+FIELDS = {
+    "products": ("price",),
+    "inventories": ("total_revenue", "products.price"),
+    "inventory_catalogues": ("products.price",),
+    "employees": ("base_salary",),
+    "payrolls": ("advances", "paid"),
+}
+
+
+def to_cents(euros) -> int:
+    """Euros to integer cents, half away from zero (1.005 -> 101); ValueError unless a finite amount."""
+    try:
+        amount = Decimal(str(euros))
+        if not amount.is_finite():
+            raise ValueError(f"Not a finite amount: {euros!r}")
+        return int((amount * CENTS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, OverflowError):
+        raise ValueError(f"Not an amount: {euros!r}")
+
+
+def to_euros(cents) -> float:
+    return cents / CENTS
+
+
+def _is_storage(info) -> bool:
+    return bool(info.context) and info.context.get("storage") == STORAGE["storage"]
+
+
+def _validate(value, info: ValidationInfo):
+    if value is None:
+        # Optional fields (the float validation rejects it for the others)
+        return value
+    if _is_storage(info):
+        return to_euros(value)
+    # Numeric strings are rounded like numbers; bools would pass the float validation as 0 and 1
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise PydanticCustomError("money", "Input should be an amount in euros")
+    try:
+        cents = to_cents(value)
+    except ValueError:
+        raise PydanticCustomError("money", "Input should be a finite amount in euros")
+    if abs(cents) > MAX_CENTS:
+        raise PydanticCustomError("money", "Amount too large")
+    return to_euros(cents)
+
+
+def _serialize(value: float, info: SerializationInfo):
+    return to_cents(value) if _is_storage(info) else value
+
+
+SERIALIZER = PlainSerializer(_serialize)
+Money = Annotated[float, BeforeValidator(_validate), SERIALIZER]
+
+
+def is_money(field) -> bool:
+    """Whether a Pydantic model field is a Money amount."""
+    return any(meta is SERIALIZER for meta in field.metadata)
+
+
+def convert(doc: dict, fields, convert_value) -> dict:
+    """Apply `convert_value` to the money `fields` of `doc`, in place (missing and None values are left alone)."""
+    for path in fields:
+        parent, _, child = path.partition(".")
+        if child:
+            for item in doc.get(parent) or []:
+                if isinstance(item, dict) and item.get(child) is not None:
+                    item[child] = convert_value(item[child])
+        elif doc.get(parent) is not None:
+            doc[parent] = convert_value(doc[parent])
+    return doc
+
+
+def euros(doc: dict, collection: str) -> dict:
+    """A stored document with its amounts in euros, in place."""
+    return convert(doc, FIELDS[collection], to_euros)
+
+
+def _float_to_cents(value):
+    return to_cents(value) if isinstance(value, float) else value
+
+
+async def migrate(db, batch_size: int = 500, log=print) -> dict:
+    """Convert the float euro amounts left in every collection to cents; returns the documents converted per collection."""
+    report = {}
+    for collection, fields in FIELDS.items():
+        converted = 0
+        ops = []
+        query = {"$or": [{path: {"$type": "double"}} for path in fields]}
+        async for doc in db[collection].find(query):
+            top_level = {path.partition(".")[0] for path in fields if path.partition(".")[0] in doc}
+            # Guarded on the values read: a concurrent write keeps its own (already converted) amounts
+            guard = {"_id": doc["_id"], **{field: copy.deepcopy(doc[field]) for field in top_level}}
+            convert(doc, fields, _float_to_cents)
+            ops.append(UpdateOne(guard, {"$set": {field: doc[field] for field in top_level}}))
+            if len(ops) == batch_size:
+                converted += (await db[collection].bulk_write(ops, ordered=False)).modified_count
+                ops = []
+        if ops:
+            converted += (await db[collection].bulk_write(ops, ordered=False)).modified_count
+        if converted:
+            report[collection] = converted
+            log(f"✓ {collection}: {converted} documents converted to cents")
+    if "inventories" in report:
+        # Rollups are derived from the inventory amounts: recompute them in cents
+        import rollups
+        await rollups.rebuild(db)
+    if "inventory_catalogues" in report:
+        import compact
+        compact.snapshots.clear()
+    for name in {"products", "inventories"} & report.keys():
+        # Version counters (server.py): the in-process caches of running workers drop their float amounts
+        await db.counters.update_one({"_id": name}, {"$inc": {"seq": 1}})
+    return report
+
+
+async def main(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    report = await migrate(db)
+    if not report:
+        print("✓ Every amount is already stored in cents")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert stored money amounts to integer cents")
+    asyncio.run(main(parser.parse_args()))
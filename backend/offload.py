@@ -0,0 +1,113 @@
+"""
+CPU offload
+Bounded worker pool running the CPU-bound report computations off the event loop
+
+The statistics group-bys, the rollup folds, the forecast fit and the JSON
+export rendering work on data already fetched from MongoDB. Run inline, a large
+one holds the event loop for its whole duration and every other request of the
+uvicorn worker, the inventory entry screens first, waits behind it. `run` hands
+them to a thread pool instead: NumPy releases the GIL in its kernels and
+pure-Python loops are preempted every switch interval, so the loop keeps
+serving while a report is computed.
+
+Threads rather than processes: the analytics table lives in the worker's memory
+and would have to be pickled to another process on every request, while
+threads read it in place (through AnalyticsTable.snapshot, which later writes
+do not modify).
+
+The pool is bounded: OFFLOAD_WORKERS threads (0 runs the computations inline,
+on the event loop), at most OFFLOAD_MAX_QUEUE computations waiting for one
+(beyond that `run` raises QueueFull at once) and OFFLOAD_TIMEOUT seconds per
+computation, waiting included (Timeout). The API answers both with a 503. A
+computation that times out while running cannot be interrupted: it completes in
+its thread and its result is dropped. Queue depth, waits, run times and
+rejections are exported by /api/metrics.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+import metrics
+
+# Read at import: the server, and the CLIs offloading through forecast.refresh, take them from backend/.env
+load_dotenv(Path(__file__).parent / '.env')
+WORKERS = int(os.environ.get('OFFLOAD_WORKERS', '2'))
+MAX_QUEUE = int(os.environ.get('OFFLOAD_MAX_QUEUE', '16'))
+TIMEOUT = float(os.environ.get('OFFLOAD_TIMEOUT', '30'))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+class Rejected(Exception):
+    """A computation the pool could not run in time."""
+
+
+class QueueFull(Rejected):
+    pass
+
+
+class Timeout(Rejected):
+    pass
+
+
+def executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="offload")
+    return _executor
+
+
+def shutdown():
+    """Stop the pool, dropping the computations still queued (the next `run` starts a new one)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _unqueue_cancelled(future):
+    # Cancelled before a worker picked it up (timeout, client gone, shutdown)
+    if future.cancelled():
+        metrics.OFFLOAD_JOBS.dec("queued")
+
+
+async def run(kind: str, fn, *args, timeout: Optional[float] = TIMEOUT):
+    """The result of `fn(*args)`, computed on the pool; `kind` labels the metrics (stats_summary, export...)."""
+    if WORKERS <= 0:
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            metrics.OFFLOAD_DURATION.observe(time.perf_counter() - started, kind)
+
+    if metrics.OFFLOAD_JOBS.value("queued") >= MAX_QUEUE:
+        metrics.OFFLOAD_REJECTED.inc(kind, "queue_full")
+        raise QueueFull(f"{MAX_QUEUE} report computations already waiting, retry later")
+
+    submitted = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        metrics.OFFLOAD_JOBS.dec("queued")
+        metrics.OFFLOAD_JOBS.inc("running")
+        metrics.OFFLOAD_WAIT.observe(started - submitted, kind)
+        try:
+            return fn(*args)
+        finally:
+            metrics.OFFLOAD_JOBS.dec("running")
+            metrics.OFFLOAD_DURATION.observe(time.perf_counter() - started, kind)
+
+    metrics.OFFLOAD_JOBS.inc("queued")
+    future = executor().submit(job)
+    future.add_done_callback(_unqueue_cancelled)
+    try:
+        # Cancelling the awaiting side cancels the job too if it has not started yet
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        metrics.OFFLOAD_REJECTED.inc(kind, "timeout")
+        raise Timeout(f"{kind} did not complete within {timeout:g} s, retry later")
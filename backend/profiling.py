@@ -0,0 +1,258 @@
+"""
+Slow-request profiler
+Sampled request traces splitting the time between MongoDB, Python and response serialization
+
+Off by default. With PROFILING_SAMPLE_PERCENT set (backend/.env), that share of
+the API requests is traced: every MongoDB command issued (collection, duration,
+documents), the time spent in the endpoint function outside MongoDB ("python",
+e.g. the statistics group-bys) and in the route outside the endpoint
+("serialization": response model validation and JSON rendering). The
+PROFILING_MAX_TRACES slowest traces are kept in memory, per worker, and the
+read commands of a kept trace are explained afterwards to attach a plan
+summary. GET /api/admin/traces lists them.
+
+The trace travels in a context variable: Motor copies the context into the
+executor threads where PyMongo calls the command listener.
+"""
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+
+import metrics
+
+SAMPLE_PERCENT = float(os.environ.get('PROFILING_SAMPLE_PERCENT', '0'))
+MAX_TRACES = int(os.environ.get('PROFILING_MAX_TRACES', '50'))
+# Commands recorded per trace, beyond which they are only counted
+MAX_COMMANDS = 200
+
+EXPLAINABLE = ("find", "aggregate", "count", "distinct")
+# Driver fields that explain() rejects or does not need
+DRIVER_FIELDS = ("lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "$readConcern")
+
+current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Timings of one sampled request."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, method: str, path: str, query: str):
+        self.id = next(self._ids)
+        self.method = method
+        self.path = path
+        self.query = query
+        self.route = None
+        self.status = None
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.route_time = 0.0
+        self.endpoint_time = 0.0
+        self.commands = []
+        self.dropped_commands = 0
+
+    def add_command(self, command: dict):
+        if len(self.commands) < MAX_COMMANDS:
+            self.commands.append(command)
+        else:
+            self.dropped_commands += 1
+
+    def finish(self, route: Optional[str], status: int):
+        self.duration = time.perf_counter() - self.started
+        self.route = route
+        self.status = status
+
+    def to_dict(self) -> dict:
+        db_time = sum(c["duration_ms"] for c in self.commands) / 1000
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            # Concurrent commands (asyncio.gather) overlap: db_ms can exceed their wall-clock time
+            "phases": {
+                "db_ms": round(db_time * 1000, 3),
+                "python_ms": round(max(self.endpoint_time - db_time, 0.0) * 1000, 3),
+                "serialization_ms": round(max(self.route_time - self.endpoint_time, 0.0) * 1000, 3),
+                "other_ms": round(max(self.duration - self.route_time, 0.0) * 1000, 3),
+            },
+            "commands": [{k: v for k, v in c.items() if k != "explain"} for c in self.commands],
+            "dropped_commands": self.dropped_commands,
+        }
+
+
+class TraceBuffer:
+    """The `size` slowest traces (a min-heap on duration, so the fastest kept trace is evicted first)."""
+
+    def __init__(self, size: int = MAX_TRACES):
+        self.size = size
+        self._heap = []
+
+    def add(self, trace: Trace) -> bool:
+        """Keep `trace` if it is among the slowest; return whether it was kept."""
+        entry = (trace.duration, trace.id, trace)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, entry)
+            return True
+        if self.size and entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def traces(self) -> list:
+        return [trace for _, _, trace in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+
+    def clear(self):
+        self._heap = []
+
+
+buffer = TraceBuffer()
+
+
+def should_sample() -> bool:
+    return SAMPLE_PERCENT > 0 and random.random() * 100 < SAMPLE_PERCENT
+
+
+def plan_summary(explain: dict) -> Optional[str]:
+    """The winning plan of an explain() output as a stage chain, e.g. "FETCH > IXSCAN date_-1"."""
+    planner = _find_key(explain, "queryPlanner")
+    if not isinstance(planner, dict) or "winningPlan" not in planner:
+        return None
+    plan = planner["winningPlan"]
+    # Slot-based engine explains wrap the plan tree
+    plan = plan.get("queryPlan", plan)
+    stages = []
+    while isinstance(plan, dict):
+        stage = plan.get("stage", "?")
+        stages.append(f"{stage} {plan['indexName']}" if plan.get("indexName") else stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " > ".join(stages)
+
+
+def _find_key(value, key):
+    if isinstance(value, dict):
+        if key in value:
+            return value[key]
+        value = list(value.values())
+    if isinstance(value, list):
+        for item in value:
+            found = _find_key(item, key)
+            if found is not None:
+                return found
+    return None
+
+
+async def explain_trace(db, trace: Trace):
+    """Attach a plan summary to the read commands of a kept trace (one explain per distinct command)."""
+    plans = {}
+    for command in trace.commands:
+        body = command.pop("explain", None)
+        if body is None:
+            continue
+        key = repr(body)
+        if key not in plans:
+            try:
+                plans[key] = plan_summary(await db.command({"explain": body, "verbosity": "queryPlanner"}))
+            except Exception as e:
+                plans[key] = f"explain failed: {e}"
+        command["plan"] = plans[key]
+
+
+_explains = set()
+
+
+def explain_later(db, trace: Trace):
+    """Run explain_trace in the background (the caller must have left the trace context)."""
+    task = asyncio.create_task(explain_trace(db, trace))
+    _explains.add(task)
+    task.add_done_callback(_explains.discard)
+
+
+class CommandProfiler(monitoring.CommandListener):
+    """Add every command issued while a trace is active to that trace."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        trace = current_trace.get()
+        if trace is None:
+            return
+        command = event.command
+        name = event.command_name
+        collection = command.get("collection") if name == "getMore" else command.get(name)
+        record = {"collection": collection if isinstance(collection, str) else "", "command": name}
+        if name in EXPLAINABLE:
+            record["explain"] = {k: v for k, v in command.items() if k not in DRIVER_FIELDS}
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (trace, record)
+
+    def _finish(self, event, **fields):
+        with self._lock:
+            pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None:
+            return
+        trace, record = pending
+        record.update(duration_ms=round(event.duration_micros / 1000, 3), **fields)
+        trace.add_command(record)
+
+    def succeeded(self, event):
+        self._finish(event, documents=metrics.reply_documents(event.command_name, event.reply))
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+command_listener = CommandProfiler()
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute timing the endpoint function and the whole route handler of traced requests."""
+
+    def get_route_handler(self):
+        endpoint = self.dependant.call
+        if not asyncio.iscoroutinefunction(endpoint):
+            return super().get_route_handler()
+
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            trace = current_trace.get()
+            if trace is None:
+                return await endpoint(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                trace.endpoint_time += time.perf_counter() - started
+
+        self.dependant.call = timed_endpoint
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            trace = current_trace.get()
+            if trace is None:
+                return await handler(request)
+            started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                trace.route_time += time.perf_counter() - started
+
+        return timed_handler
@@ -0,0 +1,444 @@
+"""
+Statistics rollups
+Per-product daily and monthly totals maintained incrementally on inventory writes
+
+Both collections also hold one "day total" row per period (product_id = None)
+carrying the number of inventory days and the summed total_revenue, so that
+/stats/summary can be answered without touching the raw inventories.
+Revenues are integer cents, like the inventory amounts (money.py), so that the
+incremental updates never drift.
+
+Usage:
+    python rollups.py --verify     # compare the rollups with the raw inventories
+    python rollups.py --rebuild    # recompute every rollup from the inventories
+"""
+import argparse
+import asyncio
+import calendar
+import os
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+from uuid import uuid4
+
+import numpy as np
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+
+import compact
+import init_db
+import money
+
+DAILY = "stats_daily"
+MONTHLY = "stats_monthly"
+
+COUNTERS = ("produced", "sold", "wasted", "revenue")
+SUMMED = ("days", "total_revenue") + COUNTERS
+
+
+def is_date(value: str) -> bool:
+    """Whether `value` is a calendar date written YYYY-MM-DD (the inventory date format)."""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d") == value
+    except (TypeError, ValueError):
+        return False
+
+
+def _month(date_str: str) -> str:
+    return date_str[:7]
+
+
+def _line_totals(inventory: dict) -> dict:
+    """Sum an inventory's lines per product_id."""
+    totals = {}
+    for p in inventory.get("products", []):
+        prod_id = p.get("product_id")
+        if prod_id not in totals:
+            totals[prod_id] = {
+                "product_name": p.get("product_name"),
+                "category": p.get("category"),
+                "produced": 0,
+                "sold": 0,
+                "wasted": 0,
+                "revenue": 0,
+            }
+        row = totals[prod_id]
+        row["produced"] += p.get("quantity_produced", 0)
+        row["sold"] += p.get("quantity_sold", 0)
+        row["wasted"] += p.get("quantity_wasted", 0)
+        row["revenue"] += p.get("quantity_sold", 0) * p.get("price", 0)
+    return totals
+
+
+def _daily_rows(inventory: dict) -> list:
+    date_str = inventory["date"]
+    rows = [{
+        "date": date_str,
+        "month": _month(date_str),
+        "product_id": None,
+        "days": 1,
+        "total_revenue": inventory.get("total_revenue", 0),
+    }]
+    for prod_id, totals in _line_totals(inventory).items():
+        rows.append({"date": date_str, "month": _month(date_str), "product_id": prod_id, "days": 1, **totals})
+    return rows
+
+
+async def apply_inventory_change(db, before: Optional[dict], after: Optional[dict]):
+    """Move the rollups from `before` to `after` (either may be None for a create/delete)."""
+    await apply_inventory_changes(db, [(before, after)])
+
+
+async def apply_inventory_changes(db, changes: list):
+    """Apply several (before, after) inventory changes with one bulk write per rollup collection."""
+    daily_ops = []
+    deltas = {}
+    for before, after in changes:
+        if before and (not after or before["date"] != after["date"]):
+            daily_ops.append(DeleteMany({"date": before["date"]}))
+        if after:
+            rows = _daily_rows(after)
+            daily_ops.append(DeleteMany({"date": after["date"], "product_id": {"$nin": [r["product_id"] for r in rows]}}))
+            daily_ops.extend(
+                ReplaceOne({"date": r["date"], "product_id": r["product_id"]}, r, upsert=True) for r in rows
+            )
+
+        # Monthly rows move by the difference between the two versions of the day
+        for inventory, sign in ((before, -1), (after, 1)):
+            if not inventory:
+                continue
+            month = _month(inventory["date"])
+            total = deltas.setdefault((month, None), {"days": 0, "total_revenue": 0})
+            total["days"] += sign
+            total["total_revenue"] += sign * inventory.get("total_revenue", 0)
+            for prod_id, totals in _line_totals(inventory).items():
+                delta = deltas.setdefault((month, prod_id), {"days": 0, **{c: 0 for c in COUNTERS}})
+                delta["days"] += sign
+                for counter in COUNTERS:
+                    delta[counter] += sign * totals[counter]
+                if sign > 0:
+                    delta["$set"] = {"product_name": totals["product_name"], "category": totals["category"]}
+
+    if daily_ops:
+        await db[DAILY].bulk_write(daily_ops)
+
+    monthly_ops = []
+    for (month, prod_id), delta in deltas.items():
+        update = {"$inc": {k: v for k, v in delta.items() if k != "$set"}}
+        if "$set" in delta:
+            update["$set"] = delta["$set"]
+        monthly_ops.append(UpdateOne({"month": month, "product_id": prod_id}, update, upsert=True))
+    if monthly_ops:
+        await db[MONTHLY].bulk_write(monthly_ops)
+        months = list({month for month, _ in deltas})
+        await db[MONTHLY].delete_many({"month": {"$in": months}, "days": {"$lte": 0}})
+
+
+async def apply_line_change(db, date_str: str, product_id: str, deltas: dict):
+    """Shift one product's rollups for one day by `deltas` (produced/sold/wasted/revenue), in constant time."""
+    month = _month(date_str)
+    line_inc = {"$inc": {k: v for k, v in deltas.items() if k in COUNTERS}}
+    total_inc = {"$inc": {"total_revenue": deltas.get("revenue", 0)}}
+    await db[DAILY].bulk_write([
+        UpdateOne({"date": date_str, "product_id": product_id}, line_inc),
+        UpdateOne({"date": date_str, "product_id": None}, total_inc),
+    ])
+    await db[MONTHLY].bulk_write([
+        UpdateOne({"month": month, "product_id": product_id}, line_inc),
+        UpdateOne({"month": month, "product_id": None}, total_inc),
+    ])
+
+
+async def rebuild(db, batch_size: int = 1000):
+    """Recompute both rollup collections from the inventories.
+
+    The rows are written to fresh collections, indexed, then swapped in with renameCollection
+    (dropTarget): readers never see half-filled rollups and the incremental updates landing
+    meanwhile cannot collide with the rebuilt rows. Those updates go to the replaced collections,
+    so a rebuild run under write load is followed by `python rollups.py --verify`.
+    """
+    suffix = uuid4().hex
+    daily, monthly_rollups = db[f"{DAILY}_rebuild_{suffix}"], db[f"{MONTHLY}_rebuild_{suffix}"]
+    try:
+        monthly = {}
+        batch = []
+        async for inventory in db.inventories.find({}).sort("date", 1):
+            await compact.expand_docs(db, [inventory])
+            for row in _daily_rows(inventory):
+                batch.append(row)
+                key = (row["month"], row["product_id"])
+                if key not in monthly:
+                    monthly[key] = {k: v for k, v in row.items() if k != "date"}
+                else:
+                    for field in SUMMED:
+                        if field in row:
+                            monthly[key][field] += row[field]
+            if len(batch) >= batch_size:
+                await daily.insert_many(batch)
+                batch = []
+        if batch:
+            await daily.insert_many(batch)
+        if monthly:
+            await monthly_rollups.insert_many(list(monthly.values()))
+
+        for collection, name in ((daily, DAILY), (monthly_rollups, MONTHLY)):
+            # Also creates the collection of an empty rebuild, which renameCollection requires
+            for keys, options in init_db.INDEXES[name]:
+                await collection.create_index(keys, name=init_db.index_name(keys), **options)
+            await collection.rename(name, dropTarget=True)
+    finally:
+        # Left behind by a failed rebuild only (no-op once renamed)
+        await daily.drop()
+        await monthly_rollups.drop()
+    return {"days": await db[DAILY].count_documents({"product_id": None}), "months": len({m for m, _ in monthly})}
+
+
+def _shift_month(month: str, step: int) -> str:
+    year, mon = int(month[:4]), int(month[5:7]) + step
+    year, mon = year + (mon - 1) // 12, (mon - 1) % 12 + 1
+    return f"{year:04d}-{mon:02d}"
+
+
+def _last_day(month: str) -> str:
+    return f"{month}-{calendar.monthrange(int(month[:4]), int(month[5:7]))[1]:02d}"
+
+
+def split_range(start_date: Optional[str], end_date: Optional[str]):
+    """Split a date range into whole months and the partial days at its edges.
+
+    Returns (month_query, day_queries): month_query is None when no whole month
+    is covered, day_queries are `date` filters for the stats_daily collection.
+    """
+    bounds = [d for d in (start_date, end_date) if d is not None]
+    if not all(is_date(d) for d in bounds):
+        # Not a calendar date: let the daily rows answer with plain string comparisons
+        query = {}
+        if start_date:
+            query["$gte"] = start_date
+        if end_date:
+            query["$lte"] = end_date
+        return None, [query]
+
+    first_full = None
+    if start_date:
+        first_full = _month(start_date) if start_date.endswith("-01") else _shift_month(_month(start_date), 1)
+    last_full = None
+    if end_date:
+        last_full = _month(end_date) if end_date == _last_day(_month(end_date)) else _shift_month(_month(end_date), -1)
+
+    if first_full and last_full and first_full > last_full:
+        return None, [{"$gte": start_date, "$lte": end_date}]
+
+    month_query = {}
+    if first_full:
+        month_query["$gte"] = first_full
+    if last_full:
+        month_query["$lte"] = last_full
+
+    day_queries = []
+    if start_date and not start_date.endswith("-01"):
+        day_queries.append({"$gte": start_date, "$lt": f"{first_full}-01"})
+    if end_date and last_full != _month(end_date):
+        day_queries.append({"$gte": f"{_month(end_date)}-01", "$lte": end_date})
+    return month_query, day_queries
+
+
+async def load_summary_rows(db, start_date: Optional[str], end_date: Optional[str]) -> list:
+    """Fetch the rollup rows covering a date range (monthly rows for whole months, daily rows for the edges)."""
+    month_query, day_queries = split_range(start_date, end_date)
+    rows = []
+    if month_query is not None:
+        query = {"month": month_query} if month_query else {}
+        rows.extend(await db[MONTHLY].find(query, {"_id": 0}).to_list(None))
+    for day_query in day_queries:
+        rows.extend(await db[DAILY].find({"date": day_query}, {"_id": 0}).to_list(None))
+    return rows
+
+
+ROLLING_FIELDS = ("sold", "wasted", "revenue")
+
+
+async def load_daily_series(db, start_date: Optional[str], end_date: Optional[str],
+                            product_id: Optional[str] = None) -> list:
+    """Daily rollup rows of a date range ordered by date (day totals included), optionally for one product."""
+    query = {}
+    if start_date or end_date:
+        query["date"] = {}
+        if start_date:
+            query["date"]["$gte"] = start_date
+        if end_date:
+            query["date"]["$lte"] = end_date
+    if product_id is not None:
+        query["product_id"] = {"$in": [None, product_id]}
+    return await db[DAILY].find(query, {"_id": 0}).sort("date", 1).to_list(None)
+
+
+def warmup_start(start_date: str, windows: list) -> str:
+    """First day whose rows feed the windows ending on start_date."""
+    first = datetime.strptime(start_date, "%Y-%m-%d") - timedelta(days=max(windows) - 1)
+    return first.strftime("%Y-%m-%d")
+
+
+# Per-field divisor of the series: revenue rows are in cents, the output in euros
+ROLLING_SCALE = np.array([money.CENTS if f == "revenue" else 1 for f in ROLLING_FIELDS], dtype=np.float64)[:, None, None]
+
+
+def _column(values, field: str) -> list:
+    # Quantities stay integers in the JSON output, only revenue is a float
+    return values.tolist() if field == "revenue" else values.astype(np.int64).tolist()
+
+
+def rolling_series(rows: list, windows: list, start_date: Optional[str] = None) -> dict:
+    """Trailing sums and per-inventory-day averages of sold/wasted/revenue over each window, per product.
+
+    `rows` are daily rollup rows ordered by date. A window of N covers the N
+    calendar days ending on each inventory day; a product missing from an
+    inventory counts as zero. The series is read once into a (field, product,
+    day) matrix and every window is the difference of two cumulative sums, so
+    the cost does not depend on the window sizes.
+    The result is columnar: every list is aligned on `dates`. Rows of days
+    that are not calendar dates (legacy free-form dates) are left out: their
+    string order says nothing of their place in time.
+    """
+    rows = [row for row in rows if is_date(row["date"])]
+    days = []
+    products = {}
+    cells = []
+    for row in rows:
+        if not days or days[-1] != row["date"]:
+            days.append(row["date"])
+        if row["product_id"] is None:
+            continue
+        if row["product_id"] not in products:
+            products[row["product_id"]] = {"product_name": row.get("product_name"), "category": row.get("category")}
+        cells.append((len(days) - 1, row))
+
+    index = {prod_id: i for i, prod_id in enumerate(products)}
+    matrix = np.zeros((len(ROLLING_FIELDS), len(products), len(days)))
+    present = np.zeros((len(products), len(days)), dtype=bool)
+    for day, row in cells:
+        i = index[row["product_id"]]
+        present[i, day] = True
+        for k, f in enumerate(ROLLING_FIELDS):
+            matrix[k, i, day] = row.get(f, 0)
+
+    first = bisect_left(days, start_date) if start_date else 0
+    ordinals = np.array([datetime.strptime(d, "%Y-%m-%d").toordinal() for d in days], dtype=np.int64)
+    cumulative = np.concatenate([np.zeros(matrix.shape[:2] + (1,)), np.cumsum(matrix, axis=2)], axis=2)
+    right = np.arange(first, len(days))
+
+    counts, rolled = {}, {}
+    for w in windows:
+        # Left edge of each window: first inventory day after date - w
+        left = np.searchsorted(ordinals, ordinals[first:] - w, side="right")
+        counts[w] = right - left + 1
+        # Exact integer sums (cents for revenue), scaled once
+        sums = (cumulative[:, :, right + 1] - cumulative[:, :, left]) / ROLLING_SCALE
+        rolled[w] = (np.round(sums, 2), np.round(sums / counts[w], 2))
+
+    series = matrix / ROLLING_SCALE
+    result = []
+    for prod_id, info in products.items():
+        i = index[prod_id]
+        if not present[i, first:].any():
+            # Only seen in the warm-up days
+            continue
+        entry = {"product_id": prod_id, **info, **{f: _column(series[k, i, first:], f) for k, f in enumerate(ROLLING_FIELDS)}}
+        entry["rolling"] = {
+            str(w): {
+                **{f: _column(sums[k, i], f) for k, f in enumerate(ROLLING_FIELDS)},
+                **{f"avg_{f}": avgs[k, i].tolist() for k, f in enumerate(ROLLING_FIELDS)},
+            }
+            for w, (sums, avgs) in rolled.items()
+        }
+        result.append(entry)
+
+    return {"dates": days[first:], "days": {str(w): counts[w].tolist() for w in windows}, "products": result}
+
+
+def raw_summary_pipeline(query: dict) -> list:
+    """Aggregation computing the summary straight from the inventories: one row per product plus the day totals."""
+    return [
+        {"$match": query},
+        *compact.EXPAND_STAGES,
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "total_revenue": {"$sum": "$total_revenue"},
+                    "days": {"$sum": 1},
+                }},
+            ],
+            "products": [
+                {"$unwind": "$products"},
+                {"$group": {
+                    "_id": "$products.product_id",
+                    "produced": {"$sum": "$products.quantity_produced"},
+                    "sold": {"$sum": "$products.quantity_sold"},
+                    "wasted": {"$sum": "$products.quantity_wasted"},
+                    "revenue": {"$sum": {"$multiply": [
+                        {"$ifNull": ["$products.quantity_sold", 0]},
+                        {"$ifNull": ["$products.price", 0]},
+                    ]}},
+                }},
+            ],
+        }},
+    ]
+
+
+async def verify(db, tolerance: float = 0) -> list:
+    """Compare the monthly rollups with a raw aggregation over the inventories, returning the drifted keys.
+
+    Every counter is an integer (revenues in cents): by default any difference is a drift.
+    """
+    result = await db.inventories.aggregate(raw_summary_pipeline({})).to_list(1)
+    facets = result[0] if result else {"totals": [], "products": []}
+    expected = {None: facets["totals"][0] if facets["totals"] else {"total_revenue": 0, "days": 0}}
+    for row in facets["products"]:
+        expected[row["_id"]] = row
+
+    actual = {}
+    for row in await load_summary_rows(db, None, None):
+        acc = actual.setdefault(row["product_id"], {})
+        for field in SUMMED:
+            if field in row:
+                acc[field] = acc.get(field, 0) + row[field]
+
+    drifted = []
+    for prod_id in set(expected) | set(actual):
+        want, got = expected.get(prod_id, {}), actual.get(prod_id, {})
+        fields = ("days", "total_revenue") if prod_id is None else COUNTERS
+        if any(abs(want.get(f, 0) - got.get(f, 0)) > tolerance for f in fields):
+            drifted.append(prod_id)
+    return drifted
+
+
+async def main(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if args.verify:
+        drifted = await verify(db)
+        if drifted:
+            print(f"✗ Rollups drifted for {len(drifted)} key(s): {drifted}")
+            print("  Run `python rollups.py --rebuild` to recompute them.")
+        else:
+            print("✓ Rollups match the inventories")
+
+    if args.rebuild:
+        print("Rebuilding statistics rollups from inventories...")
+        result = await rebuild(db)
+        print(f"✓ {result['days']} days / {result['months']} months rolled up")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Statistics rollups maintenance")
+    parser.add_argument("--verify", action="store_true", help="compare the rollups with the raw inventories")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every rollup from the inventories")
+    asyncio.run(main(parser.parse_args()))
@@ -1,37 +1,67 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, status
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, status
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import time
+import asyncio
+import uuid
+import base64
+import hashlib
+import binascii
+import csv
+import io
+import json
 import logging
+import orjson
+import re
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Union
 from datetime import datetime, date
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 ROOT_DIR = Path(__file__).parent
+# Before the local modules: several read their settings (PROFILING_*, OFFLOAD_*...) at import
 load_dotenv(ROOT_DIR / '.env')
 
+import analytics  # noqa: E402
+import compact  # noqa: E402
+import forecast  # noqa: E402
+import init_db  # noqa: E402
+import metrics  # noqa: E402
+import money  # noqa: E402
+import offload  # noqa: E402
+import profiling  # noqa: E402
+import rollups  # noqa: E402
+from money import Money  # noqa: E402
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# The command listeners time every MongoDB command per collection (see /api/metrics)
+# and add those of sampled requests to their trace (see /api/admin/traces)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[metrics.command_listener, profiling.command_listener])
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI()
+# orjson renders the responses; hot list endpoints also bypass the response_model (see fast_response)
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=profiling.ProfiledRoute)
 
 # Pydantic Models
+# Amounts are Money: euros in the API, integer cents in MongoDB (money.py)
 class Product(BaseModel):
     id: Optional[str] = None
     name: str
     category: str  # gâteau, viennoiserie, autre
-    price: float
+    price: Money
     is_recurring: bool = True
     is_archived: bool = False
     created_at: Optional[datetime] = None
@@ -39,13 +69,13 @@ class Product(BaseModel):
 class ProductCreate(BaseModel):
     name: str
     category: str
-    price: float = Field(gt=0, description="Price must be positive")
+    price: Money = Field(gt=0, description="Price must be positive")
     is_recurring: bool = True
 
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
     category: Optional[str] = None
-    price: Optional[float] = None
+    price: Optional[Money] = None
     is_recurring: Optional[bool] = None
     is_archived: Optional[bool] = None
 
@@ -57,13 +87,13 @@ class InventoryProduct(BaseModel):
     quantity_sold: int = 0
     quantity_wasted: int = 0
     quantity_remaining: int = 0
-    price: float
+    price: Money
 
 class DailyInventory(BaseModel):
     id: Optional[str] = None
     date: str  # Format: YYYY-MM-DD
     products: List[InventoryProduct]
-    total_revenue: float = 0.0
+    total_revenue: Money = 0.0
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
@@ -74,54 +104,143 @@ class DailyInventoryCreate(BaseModel):
 class DailyInventoryUpdate(BaseModel):
     products: List[InventoryProduct]
 
+class InventoryProductPatch(BaseModel):
+    quantity_produced: Optional[int] = None
+    quantity_sold: Optional[int] = None
+    quantity_wasted: Optional[int] = None
+    quantity_remaining: Optional[int] = None
+
+class InventoryProductPatchResult(BaseModel):
+    date: str
+    product: InventoryProduct
+    total_revenue: Money
+    updated_at: Optional[datetime] = None
+
+class BulkInventoryResult(BaseModel):
+    index: int
+    date: Optional[str] = None
+    status: str  # created, error
+    error: Optional[str] = None
+
+class BulkInventoryReport(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkInventoryResult]
+
 class StatsSummary(BaseModel):
-    total_sales: float
+    total_sales: Money
     total_wasted: int
     total_sold: int
     total_produced: int
     products_stats: List[dict]
 
+class ProductForecast(BaseModel):
+    product_id: str
+    product_name: Optional[str] = None
+    category: Optional[str] = None
+    expected_sold: float
+    suggested_production: int
+    observations: int
+
+class ProductionForecast(BaseModel):
+    date: str
+    weekday: int
+    fitted_through: Optional[str] = None
+    products: List[ProductForecast]
+
 # Payroll models
 class Employee(BaseModel):
     id: Optional[str] = None
     full_name: str
     role: Optional[str] = None
-    base_salary: float = 0.0
+    base_salary: Money = 0.0
     is_active: bool = True
     created_at: Optional[datetime] = None
 
 class EmployeeCreate(BaseModel):
     full_name: str
     role: Optional[str] = None
-    base_salary: float = 0.0
+    base_salary: Money = 0.0
 
 class EmployeeUpdate(BaseModel):
     full_name: Optional[str] = None
     role: Optional[str] = None
-    base_salary: Optional[float] = None
+    base_salary: Optional[Money] = None
     is_active: Optional[bool] = None
 
 class PayrollEntry(BaseModel):
     id: Optional[str] = None
     employee_id: str
     period: str  # Format YYYY-MM
-    advances: float = 0.0
-    paid: float = 0.0
+    advances: Money = 0.0
+    paid: Money = 0.0
     notes: Optional[str] = None
     created_at: Optional[datetime] = None
 
 class PayrollCreate(BaseModel):
     employee_id: str
     period: str
-    advances: float = 0.0
-    paid: float = 0.0
+    advances: Money = 0.0
+    paid: Money = 0.0
     notes: Optional[str] = None
 
 class PayrollUpdate(BaseModel):
-    advances: Optional[float] = None
-    paid: Optional[float] = None
+    advances: Optional[Money] = None
+    paid: Optional[Money] = None
     notes: Optional[str] = None
 
+class PayrollBalance(BaseModel):
+    employee_id: str
+    full_name: str
+    role: Optional[str] = None
+    base_salary: Money = 0.0
+    advances: Money = 0.0
+    paid: Money = 0.0
+    entries: int = 0
+    balance: Money = 0.0  # base_salary - advances - paid
+
+class PayrollSummary(BaseModel):
+    period: str
+    total_base_salary: Money
+    total_advances: Money
+    total_paid: Money
+    total_balance: Money
+    employees: List[PayrollBalance]
+
+class PayrollGenerationReport(BaseModel):
+    period: str
+    created: int
+    skipped: int
+    entries: List[PayrollEntry]
+
+PERIOD_PATTERN = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+# Keyset pagination pages
+class ProductPage(BaseModel):
+    items: List[Product]
+    next_cursor: Optional[str] = None
+
+class InventoryPage(BaseModel):
+    items: List[DailyInventory]
+    next_cursor: Optional[str] = None
+
+class EmployeePage(BaseModel):
+    items: List[Employee]
+    next_cursor: Optional[str] = None
+
+class PayrollPage(BaseModel):
+    items: List[PayrollEntry]
+    next_cursor: Optional[str] = None
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# MongoDB stores datetimes with millisecond precision: truncate up front so that
+# documents returned straight from a write match what a later read returns
+def utc_now() -> datetime:
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
 # Helper function to convert ObjectId to string
 def serialize_doc(doc):
     if doc and "_id" in doc:
@@ -129,68 +248,277 @@ def serialize_doc(doc):
         del doc["_id"]
     return doc
 
+def from_document(model, doc: dict):
+    """`model` validated from a stored document (amounts in cents)."""
+    return model.model_validate(serialize_doc(doc), context=money.STORAGE)
+
+def to_document(model: BaseModel) -> dict:
+    """The fields of `model` as stored (amounts in cents)."""
+    return model.model_dump(context=money.STORAGE)
+
+# Fast response path
+# Hot list endpoints return documents already reduced to their response model fields and
+# encoded by orjson, instead of building models that FastAPI then validates and encodes again.
+SHAPES = {}
+
+def shape(model, doc: dict) -> dict:
+    """`doc` as `model` would serialize it (model fields only, defaults filled in), without validation."""
+    spec = SHAPES.get(model)
+    if spec is None:
+        spec = SHAPES[model] = [
+            (
+                name,
+                None if field.is_required() else field.get_default(call_default_factory=True),
+                money.to_euros if money.is_money(field) else float if field.annotation is float else None,
+            )
+            for name, field in model.model_fields.items()
+        ]
+    shaped = {}
+    for name, default, convert in spec:
+        if name not in doc:
+            shaped[name] = default
+            continue
+        value = doc[name]
+        # Stored amounts are cents; documents written before a field became a float may hold ints
+        shaped[name] = convert(value) if convert and value is not None else value
+    return shaped
+
+def shape_inventory(doc: dict) -> dict:
+    shaped = shape(DailyInventory, serialize_doc(doc))
+    shaped["products"] = [shape(InventoryProduct, p) for p in shaped["products"] or []]
+    return shaped
+
+def encode_json(content) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+def fast_response(content, response: Optional[Response] = None) -> Response:
+    """JSON response for pre-shaped content or already encoded bytes, keeping the headers set on `response`."""
+    body = content if isinstance(content, bytes) else encode_json(content)
+    headers = dict(response.headers) if response is not None else None
+    return Response(body, media_type="application/json", headers=headers)
+
+# Keyset pagination helpers
+def encode_cursor(doc: dict, sort_field: Optional[str]) -> str:
+    values = [doc[sort_field]] if sort_field else []
+    values.append(str(doc["_id"]))
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def keyset_filter(cursor: str, sort_field: Optional[str], direction: int) -> dict:
+    """Filter selecting the documents after `cursor` in (sort_field, _id) order."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        # [sort value, _id] or [_id], as written by encode_cursor
+        if not isinstance(values, list) or len(values) != (2 if sort_field else 1):
+            raise ValueError(cursor)
+        last_id = ObjectId(values[-1])
+    except (ValueError, TypeError, InvalidId, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    op = "$gt" if direction > 0 else "$lt"
+    if not sort_field:
+        return {"_id": {op: last_id}}
+    return {"$or": [
+        {sort_field: {op: values[0]}},
+        {sort_field: values[0], "_id": {op: last_id}},
+    ]}
+
+async def fetch_page(collection, query: dict, sort_field: Optional[str], direction: int,
+                     cursor: Optional[str], page_size: Optional[int]):
+    """Fetch one page sorted by (sort_field, _id) and the cursor of the next one."""
+    page_size = page_size or DEFAULT_PAGE_SIZE
+    if cursor:
+        query = {"$and": [query, keyset_filter(cursor, sort_field, direction)]}
+    sort = [(sort_field, direction), ("_id", direction)] if sort_field else [("_id", direction)]
+    docs = await collection.find(query).sort(sort).limit(page_size + 1).to_list(page_size + 1)
+    next_cursor = encode_cursor(docs[page_size - 1], sort_field) if len(docs) > page_size else None
+    return docs[:page_size], next_cursor
+
+# Collection version counters
+# Bumped after every write so that in-process caches of every worker can tell they are stale.
+# The epoch changes if the counter document is ever lost, so an old sequence number is never reused.
+async def bump_version(name: str) -> str:
+    doc = await db.counters.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"seq": 1}, "$setOnInsert": {"epoch": uuid.uuid4().hex}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return f"{doc['epoch']}-{doc['seq']}"
+
+async def get_version(name: str) -> str:
+    doc = await db.counters.find_one({"_id": name})
+    if doc is None:
+        try:
+            doc = await db.counters.find_one_and_update(
+                {"_id": name},
+                {"$setOnInsert": {"epoch": uuid.uuid4().hex, "seq": 0}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            doc = await db.counters.find_one({"_id": name})
+    return f"{doc['epoch']}-{doc['seq']}"
+
+# Conditional GET helpers
+def make_etag(*parts) -> str:
+    return '"' + hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:24] + '"'
+
+def check_etag(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Return a 304 response if the client already holds `etag`, otherwise tag the outgoing response."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if etag in candidates or "*" in candidates:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# Product catalogue cache
+class ProductCache:
+    """Encoded product lists keyed by include_archived, valid for one products version and at most `ttl` seconds."""
+    
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, include_archived: bool, version: str) -> Optional[bytes]:
+        entry = self.entries.get(include_archived)
+        if entry and entry[0] == version and entry[1] > time.monotonic():
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        return None
+    
+    def put(self, include_archived: bool, version: str, products: bytes):
+        self.entries[include_archived] = (version, time.monotonic() + self.ttl, products)
+    
+    def invalidate(self):
+        self.entries.clear()
+    
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "ttl": self.ttl}
+
+product_cache = ProductCache(ttl=float(os.environ.get('PRODUCT_CACHE_TTL', '300')))
+
+async def products_changed():
+    product_cache.invalidate()
+    await bump_version("products")
+
+ANALYTICS_PROJECTION = {
+    "_id": 0, "date": 1, "total_revenue": 1,
+    **{f"products.{field}": 1 for field in ("product_id", "product_name", "category", "price", *analytics.QUANTITIES)},
+    # Compact days (compact.py): the analytics table reads their arrays directly
+    "catalogue": 1,
+    **{f"columns.{column}": 1 for column in ("entry", "produced", "sold", "wasted")},
+}
+
+analytics_table = analytics.AnalyticsTable()
+analytics_lock = asyncio.Lock()
+
+async def inventories_changed(earliest_date: str):
+    # Independent writes: one round trip instead of two
+    _, version = await asyncio.gather(forecast.mark_stale(db, earliest_date), bump_version("inventories"))
+    analytics_table.mark_version(version)
+
+async def load_analytics(version: str) -> Optional[analytics.AnalyticsTable]:
+    """A snapshot of the analytics table as of `version`, rebuilt from the inventories if another worker wrote since.
+
+    The snapshot is read on the offload threads: local writes applied meanwhile do not modify it.
+    """
+    global analytics_table
+    if analytics_table.version != version:
+        async with analytics_lock:
+            if analytics_table.version != version:
+                # Local writes are counted before the read: any of them may or may not be in the documents
+                changes = analytics_table.changes
+                docs = await db.inventories.find({}, ANALYTICS_PROJECTION).sort("date", 1).to_list(None)
+                catalogues = await compact.load_catalogues(db, docs)
+                # Built aside then swapped in, with no timeout: every waiting request needs it
+                table = analytics.AnalyticsTable()
+                await offload.run("analytics_load", table.load, docs, version, catalogues, timeout=None)
+                if analytics_table.changes != changes:
+                    # Local writes during the read or the build: rebuild on the next read
+                    table.version = None
+                analytics_table = table
+    return analytics_table.snapshot() if analytics_table.usable else None
+
 # Products Endpoints
 @api_router.post("/products", response_model=Product)
 async def create_product(product: ProductCreate):
-    product_dict = product.dict()
-    product_dict["created_at"] = datetime.utcnow()
+    product_dict = to_document(product)
+    product_dict["created_at"] = utc_now()
     product_dict["is_archived"] = False
     
-    result = await db.products.insert_one(product_dict)
-    created_product = await db.products.find_one({"_id": result.inserted_id})
-    return Product(**serialize_doc(created_product))
+    await db.products.insert_one(product_dict)
+    await products_changed()
+    return from_document(Product, product_dict)
 
-@api_router.get("/products", response_model=List[Product])
-async def get_products(include_archived: bool = False):
+@api_router.get("/products", response_model=Union[List[Product], ProductPage])
+async def get_products(
+    request: Request,
+    response: Response,
+    include_archived: bool = False,
+    cursor: Optional[str] = None,
+    page_size: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE)
+):
+    version = await get_version("products")
+    not_modified = check_etag(request, response, make_etag("products", version, include_archived, cursor, page_size))
+    if not_modified:
+        return not_modified
+    
     query = {} if include_archived else {"is_archived": False}
-    products = await db.products.find(query).to_list(1000)
-    return [Product(**serialize_doc(p)) for p in products]
+    if cursor or page_size:
+        products, next_cursor = await fetch_page(db.products, query, None, 1, cursor, page_size)
+        items = [shape(Product, serialize_doc(p)) for p in products]
+        return fast_response({"items": items, "next_cursor": next_cursor}, response)
+    
+    cached = product_cache.get(include_archived, version)
+    if cached is None:
+        cached = encode_json([shape(Product, serialize_doc(p)) for p in await db.products.find(query).to_list(None)])
+        product_cache.put(include_archived, version, cached)
+    return fast_response(cached, response)
 
 @api_router.get("/products/{product_id}", response_model=Product)
 async def get_product(product_id: str):
     product = await db.products.find_one({"_id": ObjectId(product_id)})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return Product(**serialize_doc(product))
+    return from_document(Product, product)
 
 @api_router.put("/products/{product_id}", response_model=Product)
 async def update_product(product_id: str, product_update: ProductUpdate):
-    update_data = {k: v for k, v in product_update.dict().items() if v is not None}
+    update_data = {k: v for k, v in to_document(product_update).items() if v is not None}
     
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    result = await db.products.update_one(
+    updated_product = await db.products.find_one_and_update(
         {"_id": ObjectId(product_id)},
-        {"$set": update_data}
+        {"$set": update_data},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
+    if updated_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
+    await products_changed()
     
-    updated_product = await db.products.find_one({"_id": ObjectId(product_id)})
-    return Product(**serialize_doc(updated_product))
+    return from_document(Product, updated_product)
 
 @api_router.delete("/products/{product_id}")
 async def delete_product(product_id: str):
     result = await db.products.delete_one({"_id": ObjectId(product_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    await products_changed()
     return {"message": "Product deleted successfully"}
 
-# Daily Inventory Endpoints
-@api_router.post("/inventories", response_model=DailyInventory)
-async def create_inventory(inventory: DailyInventoryCreate):
-    logger.info(f"Creating inventory for date: {inventory.date}, products count: {len(inventory.products)}")
-    
-    # Check if inventory already exists for this date
-    existing = await db.inventories.find_one({"date": inventory.date})
-    if existing:
-        logger.warning(f"Inventory already exists for date: {inventory.date}")
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Inventory already exists for this date: {inventory.date}. Use PUT /inventories/{inventory.date} to update."
-        )
+def build_inventory_document(inventory: DailyInventoryCreate) -> dict:
+    """Validate a new daily inventory and build the document to insert (raises HTTPException 400)."""
+    # Dates are compared and ordered as strings everywhere (rollups, rolling windows): only YYYY-MM-DD sorts right
+    if not rollups.is_date(inventory.date):
+        raise HTTPException(status_code=400, detail=f"Invalid date format: {inventory.date}. Expected YYYY-MM-DD")
     
     # Validate that products list is not empty
     if not inventory.products or len(inventory.products) == 0:
@@ -216,13 +544,12 @@ async def create_inventory(inventory: DailyInventoryCreate):
                 detail=f"Product at index {i} has invalid price: {product.price}"
             )
     
-    inventory_dict = inventory.dict()
-    inventory_dict["created_at"] = datetime.utcnow()
-    inventory_dict["updated_at"] = datetime.utcnow()
+    inventory_dict = to_document(inventory)
+    inventory_dict["created_at"] = inventory_dict["updated_at"] = utc_now()
     
-    # Calculate total revenue
+    # Calculate total revenue (exact, in cents)
     try:
-        total_revenue = sum(p.quantity_sold * p.price for p in inventory.products)
+        total_revenue = sum(p["quantity_sold"] * p["price"] for p in inventory_dict["products"])
         logger.info(f"Total revenue calculated: {total_revenue}")
     except (TypeError, AttributeError) as e:
         logger.error(f"Error calculating total revenue: {str(e)}")
@@ -232,57 +559,350 @@ async def create_inventory(inventory: DailyInventoryCreate):
         )
     
     inventory_dict["total_revenue"] = total_revenue
+    return inventory_dict
+
+# Daily Inventory Endpoints
+@api_router.post("/inventories", response_model=DailyInventory)
+async def create_inventory(inventory: DailyInventoryCreate):
+    logger.info(f"Creating inventory for date: {inventory.date}, products count: {len(inventory.products)}")
+    
+    inventory_dict = build_inventory_document(inventory)
     
-    result = await db.inventories.insert_one(inventory_dict)
-    created_inventory = await db.inventories.find_one({"_id": result.inserted_id})
+    try:
+        result = await db.inventories.insert_one(inventory_dict)
+    except DuplicateKeyError:
+        # The unique index on date rejects a second inventory for the day, without a prior lookup
+        logger.warning(f"Inventory already exists for date: {inventory.date}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Inventory already exists for this date: {inventory.date}. Use PUT /inventories/{inventory.date} to update."
+        )
+    await rollups.apply_inventory_change(db, None, inventory_dict)
+    analytics_table.apply_inventory_changes([(None, inventory_dict)])
+    await inventories_changed(inventory_dict["date"])
     logger.info(f"Inventory created successfully with ID: {result.inserted_id}")
-    return DailyInventory(**serialize_doc(created_inventory))
+    return from_document(DailyInventory, inventory_dict)
+
+BULK_INSERT_BATCH_SIZE = 1000
 
-@api_router.get("/inventories", response_model=List[DailyInventory])
-async def get_inventories(limit: int = 30):
+def parse_bulk_body(body: bytes, content_type: str) -> list:
+    """Decode a bulk upload: a JSON array, or one JSON object per line for NDJSON."""
+    try:
+        text = body.decode("utf-8")
+        if "ndjson" in content_type or "jsonlines" in content_type:
+            return [json.loads(line) for line in text.splitlines() if line.strip()]
+        items = json.loads(text)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid bulk payload: {str(e)}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Bulk payload must be a JSON array of inventories")
+    return items
+
+@api_router.post("/inventories/bulk", response_model=BulkInventoryReport)
+async def create_inventories_bulk(request: Request):
+    items = parse_bulk_body(await request.body(), request.headers.get("content-type", ""))
+    logger.info(f"Bulk importing {len(items)} inventories")
+    
+    results = [BulkInventoryResult(index=i, status="error") for i in range(len(items))]
+    documents = {}  # index -> document
+    seen_dates = set()
+    for i, item in enumerate(items):
+        if isinstance(item, dict):
+            results[i].date = item.get("date") if isinstance(item.get("date"), str) else None
+        try:
+            if not isinstance(item, dict):
+                raise HTTPException(status_code=400, detail="Inventory must be a JSON object")
+            inventory = DailyInventoryCreate(**item)
+            if inventory.date in seen_dates:
+                raise HTTPException(status_code=400, detail=f"Duplicate date in payload: {inventory.date}")
+            seen_dates.add(inventory.date)
+            documents[i] = build_inventory_document(inventory)
+        except ValidationError as e:
+            error_messages = [f"{err['loc']}: {err['msg']}" for err in e.errors()]
+            results[i].error = f"Validation error: {', '.join(error_messages)}"
+        except HTTPException as e:
+            results[i].error = e.detail
+    
+    # One lookup for every date that already has an inventory
+    if documents:
+        index_by_date = {doc["date"]: i for i, doc in documents.items()}
+        async for existing in db.inventories.find({"date": {"$in": list(index_by_date)}}, {"date": 1}):
+            i = index_by_date[existing["date"]]
+            results[i].error = f"Inventory already exists for this date: {existing['date']}"
+            del documents[i]
+    
+    inserted = []
+    pending = list(documents.items())
+    for start in range(0, len(pending), BULK_INSERT_BATCH_SIZE):
+        batch = pending[start:start + BULK_INSERT_BATCH_SIZE]
+        failed = {}
+        try:
+            await db.inventories.insert_many([doc for _, doc in batch], ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"]: err.get("errmsg", "Write error") for err in e.details.get("writeErrors", [])}
+        for position, (i, doc) in enumerate(batch):
+            if position in failed:
+                results[i].error = failed[position]
+            else:
+                results[i].status = "created"
+                inserted.append(doc)
+    
+    if inserted:
+        await rollups.apply_inventory_changes(db, [(None, doc) for doc in inserted])
+        analytics_table.apply_inventory_changes([(None, doc) for doc in inserted])
+        await inventories_changed(min(doc["date"] for doc in inserted))
+    
+    logger.info(f"Bulk import done: {len(inserted)} created, {len(items) - len(inserted)} failed")
+    return BulkInventoryReport(created=len(inserted), failed=len(items) - len(inserted), results=results)
+
+@api_router.get("/inventories", response_model=Union[List[DailyInventory], InventoryPage])
+async def get_inventories(
+    request: Request,
+    response: Response,
+    limit: int = 30,
+    cursor: Optional[str] = None,
+    page_size: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE)
+):
+    version = await get_version("inventories")
+    not_modified = check_etag(request, response, make_etag("inventories", version, limit, cursor, page_size))
+    if not_modified:
+        return not_modified
+    
+    if cursor or page_size:
+        inventories, next_cursor = await fetch_page(db.inventories, {}, "date", -1, cursor, page_size)
+        await compact.expand_docs(db, inventories)
+        return fast_response({"items": [shape_inventory(inv) for inv in inventories], "next_cursor": next_cursor}, response)
     inventories = await db.inventories.find().sort("date", -1).limit(limit).to_list(limit)
-    return [DailyInventory(**serialize_doc(inv)) for inv in inventories]
+    await compact.expand_docs(db, inventories)
+    return fast_response([shape_inventory(inv) for inv in inventories], response)
 
 @api_router.get("/inventories/{date}", response_model=DailyInventory)
-async def get_inventory_by_date(date: str):
+async def get_inventory_by_date(date: str, request: Request, response: Response):
+    if request.headers.get("if-none-match"):
+        # Only the timestamps are needed to answer a revalidation
+        stamp = await db.inventories.find_one({"date": date}, {"updated_at": 1})
+        if stamp:
+            not_modified = check_etag(request, response, make_etag("inventory", stamp["_id"], stamp.get("updated_at")))
+            if not_modified:
+                return not_modified
+    
     inventory = await db.inventories.find_one({"date": date})
     if not inventory:
         raise HTTPException(status_code=404, detail="Inventory not found for this date")
-    return DailyInventory(**serialize_doc(inventory))
+    check_etag(request, response, make_etag("inventory", inventory["_id"], inventory.get("updated_at")))
+    await compact.expand_docs(db, [inventory])
+    return from_document(DailyInventory, inventory)
+
+# Writes store the row layout: a compact day being replaced loses its arrays
+COMPACT_FIELDS = {"catalogue": "", "columns": ""}
+
+async def upsert_inventory(date: str, products: List[InventoryProduct]) -> DailyInventory:
+    """Create or replace the day's inventory in one atomic write (unique index on inventories.date)."""
+    document = build_inventory_document(DailyInventoryCreate(date=date, products=products))
+    new_id = ObjectId()
+    update = {
+        "$set": {k: document[k] for k in ("products", "total_revenue", "updated_at")},
+        "$unset": COMPACT_FIELDS,
+        "$setOnInsert": {"_id": new_id, "created_at": document["created_at"]},
+    }
+    try:
+        previous = await db.inventories.find_one_and_update(
+            {"date": date}, update, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # A concurrent upsert inserted the day first: ours now simply updates it
+        previous = await db.inventories.find_one_and_update(
+            {"date": date}, update, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+    
+    if previous is None:
+        inventory = {"_id": new_id, **document}
+    else:
+        await compact.expand_docs(db, [previous])
+        inventory = {**previous, **update["$set"]}
+    await rollups.apply_inventory_change(db, previous, inventory)
+    analytics_table.apply_inventory_changes([(previous, inventory)])
+    await inventories_changed(date)
+    return from_document(DailyInventory, inventory)
 
 @api_router.put("/inventories/{date}", response_model=DailyInventory)
-async def update_inventory(date: str, inventory_update: DailyInventoryUpdate):
-    # Calculate total revenue
-    products = inventory_update.products
-    total_revenue = sum(p.quantity_sold * p.price for p in products)
+async def update_inventory(date: str, inventory_update: DailyInventoryUpdate, upsert: bool = False):
+    if upsert:
+        return await upsert_inventory(date, inventory_update.products)
+    
+    # Calculate total revenue (exact, in cents)
+    products = [to_document(p) for p in inventory_update.products]
+    total_revenue = sum(p["quantity_sold"] * p["price"] for p in products)
     
     update_data = {
-        "products": [p.dict() for p in products],
+        "products": products,
         "total_revenue": total_revenue,
-        "updated_at": datetime.utcnow()
+        "updated_at": utc_now()
     }
     
-    result = await db.inventories.update_one(
+    previous = await db.inventories.find_one_and_update(
         {"date": date},
-        {"$set": update_data}
+        {"$set": update_data, "$unset": COMPACT_FIELDS},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Inventory not found")
     
-    updated_inventory = await db.inventories.find_one({"date": date})
-    return DailyInventory(**serialize_doc(updated_inventory))
+    await compact.expand_docs(db, [previous])
+    updated_inventory = {**previous, **update_data}
+    await rollups.apply_inventory_change(db, previous, updated_inventory)
+    analytics_table.apply_inventory_changes([(previous, updated_inventory)])
+    await inventories_changed(date)
+    return from_document(DailyInventory, updated_inventory)
+
+PATCH_MAX_ATTEMPTS = 5
+
+@api_router.patch("/inventories/{date}/products/{product_id}", response_model=InventoryProductPatchResult)
+async def patch_inventory_product(date: str, product_id: str, line_update: InventoryProductPatch):
+    changes = line_update.model_dump(exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    # Before anything is counted or rewritten: a wrong product_id leaves a compact day compact
+    if not await compact.has_line(db, date, product_id):
+        raise HTTPException(status_code=404, detail="Inventory line not found")
+    
+    # The analytics table gets a delta, not the line: counted before the write, so that a rebuild
+    # reading the collection meanwhile (which may already hold the write) is discarded (load_analytics)
+    table = analytics_table
+    table.changes += 1
+    
+    # The positional update needs the lines: a compact day goes back to the row layout first
+    await compact.expand_stored(db, date)
+    for _ in range(PATCH_MAX_ATTEMPTS):
+        current = await db.inventories.find_one(
+            {"date": date}, {"_id": 0, "products": {"$elemMatch": {"product_id": product_id}}}
+        )
+        if not current or not current.get("products"):
+            raise HTTPException(status_code=404, detail="Inventory line not found")
+        line = current["products"][0]
+        
+        # Only this line is written: positional $inc on its counters, guarded by the values just read,
+        # and the revenue difference applied to the day's total with $inc
+        deltas = {field: value - (line.get(field) or 0) for field, value in changes.items()}
+        revenue_delta = deltas.get("quantity_sold", 0) * line.get("price", 0)
+        # A None condition matches the counters missing from legacy lines ($inc then creates them)
+        guard = {"product_id": product_id, "price": line.get("price")}
+        guard.update({field: line.get(field) for field in changes})
+        now = utc_now()
+        previous = await db.inventories.find_one_and_update(
+            {"date": date, "products": {"$elemMatch": guard}},
+            {
+                "$inc": {**{f"products.$.{field}": delta for field, delta in deltas.items()}, "total_revenue": revenue_delta},
+                "$set": {"updated_at": now}
+            },
+            projection={"_id": 0, "total_revenue": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is not None:
+            break
+    else:
+        raise HTTPException(status_code=409, detail="Inventory line is being modified concurrently, retry")
+    
+    await rollups.apply_line_change(db, date, product_id, {
+        "produced": deltas.get("quantity_produced", 0),
+        "sold": deltas.get("quantity_sold", 0),
+        "wasted": deltas.get("quantity_wasted", 0),
+        "revenue": revenue_delta,
+    })
+    if analytics_table is table:
+        analytics_table.apply_line_change(date, product_id, deltas, revenue_delta)
+    else:
+        # Rebuilt during the write: the new table may already count it, rebuild it on the next read
+        analytics_table.version = None
+    await inventories_changed(date)
+    return InventoryProductPatchResult.model_validate({
+        "date": date,
+        "product": {**line, **changes},
+        "total_revenue": previous.get("total_revenue", 0) + revenue_delta,
+        "updated_at": now,
+    }, context=money.STORAGE)
 
 @api_router.delete("/inventories/{date}")
 async def delete_inventory(date: str):
-    result = await db.inventories.delete_one({"date": date})
-    if result.deleted_count == 0:
+    deleted = await db.inventories.find_one_and_delete({"date": date})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Inventory not found")
+    await compact.expand_docs(db, [deleted])
+    await rollups.apply_inventory_change(db, deleted, None)
+    analytics_table.apply_inventory_changes([(deleted, None)])
+    await inventories_changed(date)
     return {"message": "Inventory deleted successfully"}
 
 # Statistics Endpoints
 @api_router.get("/stats/summary", response_model=StatsSummary)
-async def get_stats_summary(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_stats_summary(
+    request: Request,
+    response: Response,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    version = await get_version("inventories")
+    not_modified = check_etag(request, response, make_etag("stats-summary", version, start_date, end_date))
+    if not_modified:
+        return not_modified
+    
+    table = await load_analytics(version)
+    if table is not None and table.accepts_bounds(start_date, end_date):
+        summary = await offload.run("stats_summary", table.summary, start_date, end_date)
+    else:
+        # Whole months come from the monthly rollups, the partial edges of the range from the daily ones
+        rows = await rollups.load_summary_rows(db, start_date, end_date)
+        summary = await offload.run("stats_summary", summarize_rollups, rows)
+    
+    # Calculate averages
+    num_days = summary["days"] or 1
+    product_stats = summary["products"]
+    for stats in product_stats:
+        stats["avg_sold_per_day"] = round(stats["total_sold"] / num_days, 1)
+    
+    return StatsSummary(
+        total_sales=summary["total_sales"],
+        total_wasted=sum(p["total_wasted"] for p in product_stats),
+        total_sold=sum(p["total_sold"] for p in product_stats),
+        total_produced=sum(p["total_produced"] for p in product_stats),
+        products_stats=product_stats
+    )
+
+def summarize_rollups(rows: list) -> dict:
+    """Fold rollup rows into day totals and per-product totals (same shape as AnalyticsTable.summary)."""
+    total_sales = 0
+    num_days = 0
+    product_stats = {}
+    
+    for row in sorted(rows, key=lambda r: (r.get("date") or r["month"], str(r["product_id"]))):
+        prod_id = row["product_id"]
+        if prod_id is None:
+            total_sales += row.get("total_revenue", 0)
+            num_days += row.get("days", 0)
+            continue
+        if prod_id not in product_stats:
+            product_stats[prod_id] = {
+                "product_id": prod_id,
+                "product_name": row.get("product_name"),
+                "category": row.get("category"),
+                "total_produced": 0,
+                "total_sold": 0,
+                "total_wasted": 0,
+                "total_revenue": 0
+            }
+        
+        product_stats[prod_id]["total_produced"] += row.get("produced", 0)
+        product_stats[prod_id]["total_sold"] += row.get("sold", 0)
+        product_stats[prod_id]["total_wasted"] += row.get("wasted", 0)
+        product_stats[prod_id]["total_revenue"] += row.get("revenue", 0)
+    
+    # Revenues are summed in cents
+    for stats in product_stats.values():
+        stats["total_revenue"] = money.to_euros(stats["total_revenue"])
+    return {"total_sales": money.to_euros(total_sales), "days": num_days, "products": list(product_stats.values())}
+
+def build_date_query(start_date: Optional[str], end_date: Optional[str]) -> dict:
     query = {}
     if start_date and end_date:
         query["date"] = {"$gte": start_date, "$lte": end_date}
@@ -290,129 +910,302 @@ async def get_stats_summary(start_date: Optional[str] = None, end_date: Optional
         query["date"] = {"$gte": start_date}
     elif end_date:
         query["date"] = {"$lte": end_date}
+    return query
+
+def product_series_pipeline(product_id: str, query: dict, catalogues: Optional[list] = None) -> list:
+    """Only the days containing the product (multikey index on products.product_id), trimmed to its lines.
+
+    Compact days are matched by the catalogue snapshots holding the product, then expanded.
+    """
+    match = {"products.product_id": product_id}
+    if catalogues:
+        match = {"$or": [match, {"catalogue": {"$in": catalogues}}]}
+    return [
+        {"$match": {**match, **query}},
+        {"$sort": {"date": 1}},
+        *(compact.EXPAND_STAGES if catalogues else []),
+        {"$project": {
+            "_id": 0,
+            "date": 1,
+            "products": {"$filter": {
+                "input": "$products",
+                "as": "p",
+                "cond": {"$eq": ["$$p.product_id", product_id]},
+            }},
+        }},
+    ]
+
+@api_router.get("/stats/product/{product_id}")
+async def get_product_stats(product_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
+    table = await load_analytics(await get_version("inventories"))
+    if table is not None and table.accepts_bounds(start_date, end_date):
+        daily_stats = await offload.run("stats_product", table.product_series, product_id, start_date, end_date)
+        return {"product_id": product_id, "daily_stats": daily_stats}
     
-    inventories = await db.inventories.find(query).to_list(1000)
+    query = build_date_query(start_date, end_date)
     
-    total_sales = 0.0
-    total_wasted = 0
-    total_sold = 0
-    total_produced = 0
-    product_stats = {}
+    daily_stats = []
+    catalogues = await compact.catalogues_with(db, product_id)
+    async for inv in db.inventories.aggregate(product_series_pipeline(product_id, query, catalogues)):
+        for p in inv["products"]:
+            daily_stats.append({
+                "date": inv.get("date"),
+                "produced": p.get("quantity_produced", 0),
+                "sold": p.get("quantity_sold", 0),
+                "wasted": p.get("quantity_wasted", 0),
+                "revenue": money.to_euros(p.get("quantity_sold", 0) * p.get("price", 0))
+            })
     
-    for inv in inventories:
-        total_sales += inv.get("total_revenue", 0)
-        for p in inv.get("products", []):
-            total_wasted += p.get("quantity_wasted", 0)
-            total_sold += p.get("quantity_sold", 0)
-            total_produced += p.get("quantity_produced", 0)
-            
-            # Product-specific stats
-            prod_id = p.get("product_id")
-            if prod_id not in product_stats:
-                product_stats[prod_id] = {
-                    "product_id": prod_id,
-                    "product_name": p.get("product_name"),
-                    "category": p.get("category"),
-                    "total_produced": 0,
-                    "total_sold": 0,
-                    "total_wasted": 0,
-                    "total_revenue": 0.0,
-                    "avg_sold_per_day": 0.0
-                }
-            
-            product_stats[prod_id]["total_produced"] += p.get("quantity_produced", 0)
-            product_stats[prod_id]["total_sold"] += p.get("quantity_sold", 0)
-            product_stats[prod_id]["total_wasted"] += p.get("quantity_wasted", 0)
-            product_stats[prod_id]["total_revenue"] += p.get("quantity_sold", 0) * p.get("price", 0)
+    return {"product_id": product_id, "daily_stats": daily_stats}
+
+BREAKDOWN_KEYS = {
+    "category": "$products.category",
+    # isoDayOfWeek is 1 for Monday: shift to Python's weekday()
+    "weekday": {"$subtract": [{"$isoDayOfWeek": {"$dateFromString": {"dateString": "$date", "onError": None}}}, 1]},
+    "month": {"$substr": ["$date", 0, 7]},
+}
+
+def breakdown_pipeline(by: str, query: dict) -> list:
+    """Per-group totals straight from the inventories: lines grouped by (group, day), then by group."""
+    return [
+        {"$match": query},
+        *compact.EXPAND_STAGES,
+        {"$unwind": "$products"},
+        {"$group": {
+            "_id": {"key": BREAKDOWN_KEYS[by], "date": "$date"},
+            "total_produced": {"$sum": "$products.quantity_produced"},
+            "total_sold": {"$sum": "$products.quantity_sold"},
+            "total_wasted": {"$sum": "$products.quantity_wasted"},
+            "total_revenue": {"$sum": {"$multiply": [
+                {"$ifNull": ["$products.quantity_sold", 0]},
+                {"$ifNull": ["$products.price", 0]},
+            ]}},
+        }},
+        {"$group": {
+            "_id": "$_id.key",
+            "days": {"$sum": 1},
+            "total_produced": {"$sum": "$total_produced"},
+            "total_sold": {"$sum": "$total_sold"},
+            "total_wasted": {"$sum": "$total_wasted"},
+            "total_revenue": {"$sum": "$total_revenue"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+@api_router.get("/stats/breakdown")
+async def get_stats_breakdown(
+    request: Request,
+    response: Response,
+    by: str = "category",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    if by not in analytics.BREAKDOWNS:
+        raise HTTPException(status_code=400, detail=f"by must be one of: {', '.join(analytics.BREAKDOWNS)}")
     
-    # Calculate averages
-    num_days = len(inventories) if inventories else 1
-    for prod_id in product_stats:
-        product_stats[prod_id]["avg_sold_per_day"] = round(product_stats[prod_id]["total_sold"] / num_days, 1)
+    version = await get_version("inventories")
+    not_modified = check_etag(request, response, make_etag("stats-breakdown", version, by, start_date, end_date))
+    if not_modified:
+        return not_modified
     
-    return StatsSummary(
-        total_sales=total_sales,
-        total_wasted=total_wasted,
-        total_sold=total_sold,
-        total_produced=total_produced,
-        products_stats=list(product_stats.values())
-    )
+    table = await load_analytics(version)
+    if table is not None and table.accepts_bounds(start_date, end_date):
+        groups = await offload.run("stats_breakdown", table.breakdown, by, start_date, end_date)
+    else:
+        groups = [
+            {"key": row.pop("_id"), **row, "total_revenue": money.to_euros(row["total_revenue"])}
+            async for row in db.inventories.aggregate(breakdown_pipeline(by, build_date_query(start_date, end_date)))
+        ]
+    return {"by": by, "start_date": start_date, "end_date": end_date, "groups": groups}
 
-@api_router.get("/stats/product/{product_id}")
-async def get_product_stats(product_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
-    query = {}
-    if start_date and end_date:
-        query["date"] = {"$gte": start_date, "$lte": end_date}
+ROLLING_DEFAULT_WINDOWS = "7,30,90"
+ROLLING_MAX_WINDOW = 366
+
+def parse_windows(windows: str) -> list:
+    try:
+        sizes = sorted({int(w) for w in windows.split(",") if w.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="windows must be a comma-separated list of day counts")
+    if not sizes or sizes[0] < 1 or sizes[-1] > ROLLING_MAX_WINDOW:
+        raise HTTPException(status_code=400, detail=f"windows must be between 1 and {ROLLING_MAX_WINDOW} days")
+    return sizes
+
+@api_router.get("/stats/rolling")
+async def get_rolling_stats(
+    request: Request,
+    response: Response,
+    windows: str = ROLLING_DEFAULT_WINDOWS,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    product_id: Optional[str] = None
+):
+    sizes = parse_windows(windows)
+    for value in (start_date, end_date):
+        if value is not None and not rollups.is_date(value):
+            raise HTTPException(status_code=400, detail=f"Invalid date format: {value}. Expected YYYY-MM-DD")
     
-    inventories = await db.inventories.find(query).to_list(1000)
+    version = await get_version("inventories")
+    not_modified = check_etag(request, response, make_etag("stats-rolling", version, sizes, start_date, end_date, product_id))
+    if not_modified:
+        return not_modified
     
-    daily_stats = []
-    for inv in inventories:
-        for p in inv.get("products", []):
-            if p.get("product_id") == product_id:
-                daily_stats.append({
-                    "date": inv.get("date"),
-                    "produced": p.get("quantity_produced", 0),
-                    "sold": p.get("quantity_sold", 0),
-                    "wasted": p.get("quantity_wasted", 0),
-                    "revenue": p.get("quantity_sold", 0) * p.get("price", 0)
-                })
+    # The days before start_date only feed the first windows
+    load_from = rollups.warmup_start(start_date, sizes) if start_date else None
+    rows = await rollups.load_daily_series(db, load_from, end_date, product_id)
+    return {
+        "windows": sizes,
+        "start_date": start_date,
+        "end_date": end_date,
+        **await offload.run("stats_rolling", rollups.rolling_series, rows, sizes, start_date),
+    }
+
+# Forecast Endpoint
+@api_router.get("/forecast/{date}", response_model=ProductionForecast)
+async def get_forecast(date: str):
+    if not rollups.is_date(date):
+        raise HTTPException(status_code=400, detail=f"Invalid date format: {date}. Expected YYYY-MM-DD")
     
-    return {"product_id": product_id, "daily_stats": daily_stats}
+    # Only the days inventoried since the last call are fitted
+    fitted = await forecast.refresh(db)
+    archived = {str(d["_id"]) async for d in db.products.find({"is_archived": True}, {"_id": 1})}
+    weekday = datetime.strptime(date, "%Y-%m-%d").weekday()
+    
+    lines = []
+    for prod_id, model in fitted["models"].items():
+        if prod_id in archived:
+            continue
+        prediction = forecast.predict(model, weekday)
+        if prediction is not None:
+            lines.append(ProductForecast(
+                product_id=prod_id,
+                product_name=model.get("product_name"),
+                category=model.get("category"),
+                **prediction
+            ))
+    lines.sort(key=lambda line: (line.product_name or "", line.product_id))
+    return ProductionForecast(
+        date=date,
+        weekday=weekday,
+        fitted_through=fitted["state"]["fitted_through"],
+        products=lines
+    )
 
 # Export Endpoint
+EXPORT_COLUMNS = [
+    "date", "product_id", "product_name", "category", "quantity_produced",
+    "quantity_sold", "quantity_wasted", "quantity_remaining", "price", "revenue"
+]
+EXPORT_BATCH_SIZE = 500
+
+def export_rows(inv: dict):
+    for p in inv.get("products", []):
+        row = {column: p.get(column) for column in EXPORT_COLUMNS[1:-1]}
+        row["date"] = inv.get("date")
+        if row["price"] is not None:
+            row["price"] = money.to_euros(row["price"])
+        row["revenue"] = money.to_euros(p.get("quantity_sold", 0) * p.get("price", 0))
+        yield row
+
+async def stream_export(query: dict, fmt: str):
+    """Yield the export one cursor batch at a time, one row per inventory line."""
+    cursor = db.inventories.find(
+        query, {"_id": 0, "date": 1, "products": 1, "catalogue": 1, "columns": 1}
+    ).sort("date", -1).batch_size(EXPORT_BATCH_SIZE)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    if fmt == "csv":
+        writer.writeheader()
+    count = 0
+    async for inv in cursor:
+        await compact.expand_docs(db, [inv])
+        for row in export_rows(inv):
+            if fmt == "csv":
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(row, ensure_ascii=False))
+                buffer.write("\n")
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0 or buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
 @api_router.get("/export")
-async def export_data(start_date: Optional[str] = None, end_date: Optional[str] = None):
-    query = {}
-    if start_date and end_date:
-        query["date"] = {"$gte": start_date, "$lte": end_date}
+async def export_data(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$")
+):
+    query = build_date_query(start_date, end_date)
     
-    inventories = await db.inventories.find(query).sort("date", -1).to_list(1000)
-    products = await db.products.find({"is_archived": False}).to_list(1000)
+    if fmt != "json":
+        media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+        return StreamingResponse(
+            stream_export(query, fmt),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="export-patisserie.{fmt}"'}
+        )
     
-    return {
-        "inventories": [serialize_doc(inv) for inv in inventories],
-        "products": [serialize_doc(p) for p in products]
-    }
+    inventories = await db.inventories.find(query).sort("date", -1).to_list(None)
+    await compact.expand_docs(db, inventories)
+    products = await db.products.find({"is_archived": False}).to_list(None)
+    return await offload.run("export", render_export, inventories, products)
+
+def render_export(inventories: list, products: list) -> Response:
+    return fast_response({
+        "inventories": [money.euros(serialize_doc(inv), "inventories") for inv in inventories],
+        "products": [money.euros(serialize_doc(p), "products") for p in products]
+    })
 
 # Employees Endpoints
 @api_router.post("/employees", response_model=Employee)
 async def create_employee(employee: EmployeeCreate):
-    data = employee.dict()
-    data["created_at"] = datetime.utcnow()
+    data = to_document(employee)
+    data["created_at"] = utc_now()
     # Ensure active flag present
     data["is_active"] = True
-    result = await db.employees.insert_one(data)
-    created = await db.employees.find_one({"_id": result.inserted_id})
-    return Employee(**serialize_doc(created))
+    await db.employees.insert_one(data)
+    return from_document(Employee, data)
 
-@api_router.get("/employees", response_model=List[Employee])
-async def list_employees(include_inactive: bool = False):
+def employees_query(include_inactive: bool) -> dict:
     if include_inactive:
-        query = {}
-    else:
-        # Consider employees without is_active as active for backward-compatibility
-        query = {"$or": [{"is_active": True}, {"is_active": {"$exists": False}}]}
-    docs = await db.employees.find(query).sort("full_name", 1).to_list(1000)
-    return [Employee(**serialize_doc(d)) for d in docs]
+        return {}
+    # Consider employees without is_active as active for backward-compatibility
+    return {"$or": [{"is_active": True}, {"is_active": {"$exists": False}}]}
+
+@api_router.get("/employees", response_model=Union[List[Employee], EmployeePage])
+async def list_employees(
+    include_inactive: bool = False,
+    cursor: Optional[str] = None,
+    page_size: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE)
+):
+    query = employees_query(include_inactive)
+    if cursor or page_size:
+        docs, next_cursor = await fetch_page(db.employees, query, "full_name", 1, cursor, page_size)
+        return fast_response({"items": [shape(Employee, serialize_doc(d)) for d in docs], "next_cursor": next_cursor})
+    docs = await db.employees.find(query).sort("full_name", 1).to_list(None)
+    return fast_response([shape(Employee, serialize_doc(d)) for d in docs])
 
 @api_router.get("/employees/{employee_id}", response_model=Employee)
 async def get_employee(employee_id: str):
     employee = await db.employees.find_one({"_id": ObjectId(employee_id)})
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
-    return Employee(**serialize_doc(employee))
+    return from_document(Employee, employee)
 
 @api_router.put("/employees/{employee_id}", response_model=Employee)
 async def update_employee(employee_id: str, employee_update: EmployeeUpdate):
-    update_data = {k: v for k, v in employee_update.dict().items() if v is not None}
+    update_data = {k: v for k, v in to_document(employee_update).items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
-    result = await db.employees.update_one({"_id": ObjectId(employee_id)}, {"$set": update_data})
-    if result.matched_count == 0:
+    updated = await db.employees.find_one_and_update(
+        {"_id": ObjectId(employee_id)}, {"$set": update_data}, return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
         raise HTTPException(status_code=404, detail="Employee not found")
-    updated = await db.employees.find_one({"_id": ObjectId(employee_id)})
-    return Employee(**serialize_doc(updated))
+    return from_document(Employee, updated)
 
 @api_router.delete("/employees/{employee_id}")
 async def delete_employee(employee_id: str):
@@ -425,35 +1218,162 @@ async def delete_employee(employee_id: str):
 @api_router.post("/payrolls", response_model=PayrollEntry)
 async def create_payroll(entry: PayrollCreate):
     # ensure employee exists
-    emp = await db.employees.find_one({"_id": ObjectId(entry.employee_id)})
+    emp = await db.employees.find_one({"_id": ObjectId(entry.employee_id)}, {"_id": 1})
     if not emp:
         raise HTTPException(status_code=400, detail="Employee does not exist")
-    data = entry.dict()
-    data["created_at"] = datetime.utcnow()
-    result = await db.payrolls.insert_one(data)
-    created = await db.payrolls.find_one({"_id": result.inserted_id})
-    return PayrollEntry(**serialize_doc(created))
-
-@api_router.get("/payrolls", response_model=List[PayrollEntry])
-async def list_payrolls(employee_id: Optional[str] = None, period: Optional[str] = None):
+    data = to_document(entry)
+    data["created_at"] = utc_now()
+    try:
+        await db.payrolls.insert_one(data)
+    except DuplicateKeyError:
+        # Unique index on (employee_id, period)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Payroll entry already exists for this employee and period: {entry.period}. Use PUT /payrolls/{{id}} to update."
+        )
+    return from_document(PayrollEntry, data)
+
+# generate skips the existing entries through the unique index on (employee_id, period)
+PAYROLL_UNIQUE_INDEX = init_db.index_name(next(keys for keys, options in init_db.INDEXES["payrolls"] if options.get("unique")))
+payroll_index_ready = False
+
+def payroll_index_missing() -> HTTPException:
+    logger.error(f"Unique index payrolls.{PAYROLL_UNIQUE_INDEX} is missing, payroll generation disabled")
+    return HTTPException(
+        status_code=503,
+        detail="Payroll generation unavailable: the unique index on (employee_id, period) is missing, run python init_db.py"
+    )
+
+async def check_payroll_index():
+    """Refuse to generate without the unique index: every call would insert duplicates.
+
+    Cached once found; generate_payrolls resets the cache when duplicates show up after all (index dropped since).
+    """
+    global payroll_index_ready
+    if not payroll_index_ready:
+        index = (await db.payrolls.index_information()).get(PAYROLL_UNIQUE_INDEX)
+        if not index or not index.get("unique"):
+            raise payroll_index_missing()
+        payroll_index_ready = True
+
+@api_router.post("/payrolls/generate", response_model=PayrollGenerationReport)
+async def generate_payrolls(period: str):
+    global payroll_index_ready
+    if not PERIOD_PATTERN.match(period):
+        raise HTTPException(status_code=400, detail=f"Invalid period format: {period}. Expected YYYY-MM")
+    await check_payroll_index()
+    
+    employees = await db.employees.find(employees_query(False), {"_id": 1}).sort("full_name", 1).to_list(None)
+    now = utc_now()
+    docs = [
+        {"employee_id": str(e["_id"]), "period": period, "advances": 0, "paid": 0, "notes": None, "created_at": now}
+        for e in employees
+    ]
+    
+    skipped = set()
+    if docs:
+        try:
+            await db.payrolls.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
+            # Employees that already have an entry for the period (unique index on employee_id + period)
+            skipped = {err["index"] for err in errors}
+        # With the index, each employee holds exactly one entry for the period now
+        entries = await db.payrolls.count_documents({"employee_id": {"$in": [d["employee_id"] for d in docs]}, "period": period})
+        if entries > len(docs):
+            # Index dropped since it was checked: take back this call's inserts and check again next time
+            payroll_index_ready = False
+            await db.payrolls.delete_many({"_id": {"$in": [d["_id"] for i, d in enumerate(docs) if i not in skipped]}})
+            raise payroll_index_missing()
+    
+    created = [from_document(PayrollEntry, doc) for i, doc in enumerate(docs) if i not in skipped]
+    logger.info(f"Payroll generation for {period}: {len(created)} created, {len(skipped)} skipped")
+    return PayrollGenerationReport(period=period, created=len(created), skipped=len(skipped), entries=created)
+
+@api_router.get("/payrolls", response_model=Union[List[PayrollEntry], PayrollPage])
+async def list_payrolls(
+    employee_id: Optional[str] = None,
+    period: Optional[str] = None,
+    cursor: Optional[str] = None,
+    page_size: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE)
+):
     query = {}
     if employee_id:
         query["employee_id"] = employee_id
     if period:
         query["period"] = period
-    docs = await db.payrolls.find(query).sort("period", -1).to_list(1000)
-    return [PayrollEntry(**serialize_doc(d)) for d in docs]
+    if cursor or page_size:
+        docs, next_cursor = await fetch_page(db.payrolls, query, "period", -1, cursor, page_size)
+        return fast_response({"items": [shape(PayrollEntry, serialize_doc(d)) for d in docs], "next_cursor": next_cursor})
+    docs = await db.payrolls.find(query).sort("period", -1).to_list(None)
+    return fast_response([shape(PayrollEntry, serialize_doc(d)) for d in docs])
+
+def payroll_summary_pipeline(period: str, include_inactive: bool) -> list:
+    """Employees joined with their entries of one period, summed inside the $lookup.
+
+    The concise correlated $lookup (localField/foreignField + pipeline, MongoDB 5.0+)
+    resolves each employee with one seek on the (employee_id, period) index.
+    """
+    return [
+        {"$match": employees_query(include_inactive)},
+        {"$sort": {"full_name": 1, "_id": 1}},
+        {"$addFields": {"employee_id": {"$toString": "$_id"}}},
+        {"$lookup": {
+            "from": "payrolls",
+            "localField": "employee_id",
+            "foreignField": "employee_id",
+            "pipeline": [
+                {"$match": {"period": period}},
+                {"$group": {
+                    "_id": None,
+                    "advances": {"$sum": "$advances"},
+                    "paid": {"$sum": "$paid"},
+                    "entries": {"$sum": 1},
+                }},
+            ],
+            "as": "totals",
+        }},
+        {"$project": {
+            "_id": 0,
+            "employee_id": 1,
+            "full_name": 1,
+            "role": 1,
+            "base_salary": {"$ifNull": ["$base_salary", 0]},
+            "advances": {"$sum": "$totals.advances"},
+            "paid": {"$sum": "$totals.paid"},
+            "entries": {"$sum": "$totals.entries"},
+        }},
+    ]
+
+@api_router.get("/payrolls/summary", response_model=PayrollSummary)
+async def get_payroll_summary(period: str, include_inactive: bool = False):
+    if not PERIOD_PATTERN.match(period):
+        raise HTTPException(status_code=400, detail=f"Invalid period format: {period}. Expected YYYY-MM")
+    
+    # Amounts summed in cents, converted by the models
+    rows = [
+        {**row, "balance": row["base_salary"] - row["advances"] - row["paid"]}
+        async for row in db.employees.aggregate(payroll_summary_pipeline(period, include_inactive))
+    ]
+    return PayrollSummary.model_validate({
+        "period": period,
+        **{f"total_{field}": sum(row[field] for row in rows) for field in ("base_salary", "advances", "paid", "balance")},
+        "employees": rows,
+    }, context=money.STORAGE)
 
 @api_router.put("/payrolls/{payroll_id}", response_model=PayrollEntry)
 async def update_payroll(payroll_id: str, entry_update: PayrollUpdate):
-    update_data = {k: v for k, v in entry_update.dict().items() if v is not None}
+    update_data = {k: v for k, v in to_document(entry_update).items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
-    result = await db.payrolls.update_one({"_id": ObjectId(payroll_id)}, {"$set": update_data})
-    if result.matched_count == 0:
+    updated = await db.payrolls.find_one_and_update(
+        {"_id": ObjectId(payroll_id)}, {"$set": update_data}, return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
         raise HTTPException(status_code=404, detail="Payroll entry not found")
-    updated = await db.payrolls.find_one({"_id": ObjectId(payroll_id)})
-    return PayrollEntry(**serialize_doc(updated))
+    return from_document(PayrollEntry, updated)
 
 @api_router.delete("/payrolls/{payroll_id}")
 async def delete_payroll(payroll_id: str):
@@ -467,6 +1387,30 @@ async def delete_payroll(payroll_id: str):
 async def root():
     return {"message": "Pâtisserie Inventory API", "status": "running"}
 
+@api_router.get("/cache/stats")
+async def cache_stats():
+    return {"products": product_cache.stats()}
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Request and MongoDB command latencies of this worker, in Prometheus text format"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@api_router.get("/admin/traces")
+async def get_traces():
+    """Slowest sampled requests of this worker, slowest first (PROFILING_SAMPLE_PERCENT)"""
+    return {
+        "enabled": profiling.SAMPLE_PERCENT > 0,
+        "sample_percent": profiling.SAMPLE_PERCENT,
+        "max_traces": profiling.buffer.size,
+        "traces": [trace.to_dict() for trace in profiling.buffer.traces()],
+    }
+
+@api_router.delete("/admin/traces")
+async def clear_traces():
+    profiling.buffer.clear()
+    return {"message": "Traces cleared"}
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -498,6 +1442,85 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         }
     )
 
+# Report computations the offload pool could not take (queue full) or finish in time
+@app.exception_handler(offload.Rejected)
+async def offload_rejected_handler(request: Request, exc: offload.Rejected):
+    logger.warning(f"Report computation rejected on {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "5"}
+    )
+
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Label by route template (/api/inventories/{date}), not by raw path, to keep the series bounded
+        route = request.scope.get("route")
+        metrics.REQUEST_DURATION.observe(
+            time.perf_counter() - started, request.method, getattr(route, "path", "unmatched"), status_code
+        )
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    if request.url.path.startswith("/api/admin/") or not profiling.should_sample():
+        return await call_next(request)
+    trace = profiling.Trace(request.method, request.url.path, request.url.query)
+    token = profiling.current_trace.set(trace)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        profiling.current_trace.reset(token)
+        route = request.scope.get("route")
+        trace.finish(getattr(route, "path", "unmatched"), status_code)
+        if profiling.buffer.add(trace):
+            profiling.explain_later(db, trace)
+
+@app.on_event("startup")
+async def sync_indexes():
+    # Missing indexes turn the hot queries into collection scans: create them before serving
+    try:
+        await init_db.ensure_indexes(db, log=logger.info)
+    except init_db.DuplicateKeys as e:
+        # The unique indexes back the inventory upserts and payroll generation: refuse to serve without them
+        logger.critical(str(e))
+        raise
+    except Exception as e:
+        logger.error(f"Index synchronization failed: {e}")
+
+@app.on_event("startup")
+async def convert_money_to_cents():
+    # Databases written before amounts were stored in cents still hold float euros: convert them before serving
+    await money.migrate(db, log=logger.info)
+
+@app.on_event("startup")
+async def build_missing_rollups():
+    # Databases created before the rollups existed get them computed once
+    if await db[rollups.MONTHLY].estimated_document_count() == 0 and await db.inventories.estimated_document_count() > 0:
+        logger.info("Statistics rollups are empty, rebuilding them from inventories")
+        await rollups.rebuild(db)
+
+@app.on_event("startup")
+async def build_analytics_table():
+    try:
+        await load_analytics(await get_version("inventories"))
+        logger.info(f"Analytics table loaded: {len(analytics_table.line_date)} inventory lines")
+    except Exception as e:
+        logger.error(f"Analytics table could not be built, statistics will query MongoDB: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+@app.on_event("shutdown")
+async def shutdown_offload_pool():
+    offload.shutdown()
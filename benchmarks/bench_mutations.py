@@ -0,0 +1,136 @@
+"""
+Benchmark des endpoints d'écriture (clôture de fin de journée)
+
+Mesure la latence et le nombre de commandes MongoDB par requête pour les
+créations et mises à jour de produits, inventaires, employés et fiches de paie.
+
+Usage:
+    python benchmarks/bench_mutations.py --runs 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(ROOT_DIR / 'backend' / '.env')
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'halimou')
+sys.path.insert(0, str(ROOT_DIR / 'backend'))
+
+BENCH_DB_NAME = os.environ['DB_NAME'] + '_bench'
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Compter les commandes envoyées au serveur MongoDB"""
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def inventory_payload(day, products):
+    return {
+        "date": (date(2030, 1, 1) + timedelta(days=day)).strftime("%Y-%m-%d"),
+        "products": [
+            {
+                "product_id": p["id"],
+                "product_name": p["name"],
+                "category": p["category"],
+                "quantity_produced": 30,
+                "quantity_sold": 20 + day % 7,
+                "quantity_wasted": 2,
+                "quantity_remaining": 8 - day % 7,
+                "price": p["price"],
+            }
+            for p in products
+        ],
+    }
+
+
+async def measure(client, counter, scenarios, runs):
+    results = {}
+    for name, make_request in scenarios:
+        timings, commands = [], []
+        for i in range(runs):
+            before = counter.count
+            started = time.perf_counter()
+            response = await make_request(i)
+            timings.append((time.perf_counter() - started) * 1000)
+            commands.append(counter.count - before)
+            response.raise_for_status()
+        results[name] = (statistics.median(timings), max(timings), statistics.mean(commands))
+    return results
+
+
+async def main(args):
+    import server
+    from httpx import AsyncClient, ASGITransport
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    counter = CommandCounter()
+    mongo = AsyncIOMotorClient(os.environ['MONGO_URL'], event_listeners=[counter])
+    await mongo.drop_database(BENCH_DB_NAME)
+    server.db = mongo[BENCH_DB_NAME]
+
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        products = []
+        for i in range(args.products):
+            response = await client.post("/api/products", json={"name": f"Produit {i}", "category": "autre", "price": 2.5})
+            products.append(response.json())
+        employee = (await client.post("/api/employees", json={"full_name": "Bench", "base_salary": 2000})).json()
+        payroll_ids = []
+        employee_ids = []
+
+        async def create_payroll(i):
+            response = await client.post("/api/payrolls", json={"employee_id": employee["id"], "period": f"{2000 + i}-01"})
+            payroll_ids.append(response.json()["id"])
+            return response
+
+        async def create_employee(i):
+            response = await client.post("/api/employees", json={"full_name": f"Employé {i}", "base_salary": 1800})
+            employee_ids.append(response.json()["id"])
+            return response
+
+        scenarios = [
+            ("POST /products", lambda i: client.post("/api/products", json={"name": f"Bench {i}", "category": "autre", "price": 1.0})),
+            ("PUT /products/{id}", lambda i: client.put(f"/api/products/{products[i % len(products)]['id']}", json={"price": 2.0 + i % 3})),
+            ("POST /inventories", lambda i: client.post("/api/inventories", json=inventory_payload(i, products))),
+            ("PUT /inventories/{date}", lambda i: client.put(f"/api/inventories/{inventory_payload(i, products)['date']}", json={"products": inventory_payload(i + 1, products)["products"]})),
+            ("POST /employees", create_employee),
+            ("PUT /employees/{id}", lambda i: client.put(f"/api/employees/{employee_ids[i]}", json={"base_salary": 1900 + i})),
+            ("POST /payrolls", create_payroll),
+            ("PUT /payrolls/{id}", lambda i: client.put(f"/api/payrolls/{payroll_ids[i]}", json={"advances": 100 + i})),
+        ]
+        results = await measure(client, counter, scenarios, args.runs)
+
+    print(f"{args.runs} requêtes par scénario, {args.products} produits par inventaire")
+    print(f"{'scénario':<28}{'médiane':>12}{'max':>12}{'commandes':>12}")
+    for name, (median, worst, commands) in results.items():
+        print(f"{name:<28}{median:>9.2f} ms{worst:>9.2f} ms{commands:>12.1f}")
+
+    await mongo.drop_database(BENCH_DB_NAME)
+    mongo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--products", type=int, default=30)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+"""
+Benchmark de GET /api/payrolls/summary avec des milliers d'employés
+
+Usage:
+    python benchmarks/bench_payroll_summary.py --employees 3000 --years 5 --runs 20
+
+Compare la jointure côté serveur à l'ancienne méthode de la page paye
+(GET /api/employees + GET /api/payrolls?period=, jointure côté client).
+Les données sont générées dans une base dédiée (`<DB_NAME>_bench`) qui est
+vidée au début du benchmark.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(ROOT_DIR / 'backend' / '.env')
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'halimou')
+sys.path.insert(0, str(ROOT_DIR / 'backend'))
+import money  # noqa: E402
+
+BENCH_DB_NAME = os.environ['DB_NAME'] + '_bench'
+
+
+def periods(years):
+    return [f"{2030 - years + y}-{m:02d}" for y in range(years) for m in range(1, 13)]
+
+
+async def seed(db, num_employees, years, seed=42):
+    """Créer `num_employees` employés et une fiche de paie par employé et par mois"""
+    rng = random.Random(seed)
+    await db.employees.delete_many({})
+    await db.payrolls.delete_many({})
+    result = await db.employees.insert_many([
+        {"full_name": f"Employé {i:05d}", "role": "Vendeur", "base_salary": 1800 * money.CENTS, "is_active": i % 10 != 0}
+        for i in range(num_employees)
+    ])
+    batch = []
+    for employee_id in result.inserted_ids:
+        for period in periods(years):
+            batch.append({
+                "employee_id": str(employee_id),
+                "period": period,
+                # Montants en centimes, comme les documents écrits par l'API
+                "advances": rng.choice([0, 100, 200, 500]) * money.CENTS,
+                "paid": 0,
+            })
+            if len(batch) == 5000:
+                await db.payrolls.insert_many(batch)
+                batch = []
+    if batch:
+        await db.payrolls.insert_many(batch)
+
+
+async def timed(runs, make_request):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await make_request()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+async def main(args):
+    import init_db
+    import server
+    from httpx import AsyncClient, ASGITransport
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    mongo = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    server.db = mongo[BENCH_DB_NAME]
+
+    print(f"Génération de {args.employees} employés x {args.years * 12} périodes dans {BENCH_DB_NAME}...")
+    await seed(server.db, args.employees, args.years)
+    await init_db.ensure_indexes(server.db, log=lambda message: None)
+    period = periods(args.years)[-1]
+
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def server_side():
+            response = await client.get("/api/payrolls/summary", params={"period": period})
+            response.raise_for_status()
+            return response.json()
+
+        async def client_side():
+            employees, payrolls = await asyncio.gather(
+                client.get("/api/employees"),
+                client.get("/api/payrolls", params={"period": period}),
+            )
+            entries = {}
+            for entry in payrolls.json():
+                entries.setdefault(entry["employee_id"], []).append(entry)
+            return [
+                e["base_salary"] - sum(p["advances"] + p["paid"] for p in entries.get(e["id"], []))
+                for e in employees.json()
+            ]
+
+        summary = await server_side()
+        assert [e["balance"] for e in summary["employees"]] == await client_side(), "les deux méthodes doivent concorder"
+
+        results = {
+            "GET /payrolls/summary": await timed(args.runs, server_side),
+            "employees + payrolls (client)": await timed(args.runs, client_side),
+        }
+
+    print(f"{len(summary['employees'])} employés actifs, période {period}, {args.runs} requêtes")
+    print(f"{'méthode':<32}{'médiane':>12}{'max':>12}")
+    for name, (median, worst) in results.items():
+        print(f"{name:<32}{median:>9.1f} ms{worst:>9.1f} ms")
+
+    if not args.keep:
+        await mongo.drop_database(BENCH_DB_NAME)
+    mongo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--employees", type=int, default=3000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="conserver la base de benchmark")
+    asyncio.run(main(parser.parse_args()))
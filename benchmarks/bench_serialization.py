@@ -0,0 +1,111 @@
+"""
+Benchmark de la sérialisation des réponses volumineuses
+
+Usage:
+    python benchmarks/bench_serialization.py --days 365 --products 40 --runs 20
+
+Mesure le temps CPU par requête (time.process_time) passé à transformer les
+documents MongoDB en corps de réponse, sans base de données :
+- `modèles + json` : l'ancien chemin, modèles Pydantic puis validation et
+  encodage par FastAPI (`serialize_response`) et `JSONResponse` ;
+- `modèles + orjson` : le même chemin avec `ORJSONResponse`, la classe par défaut ;
+- `dicts + orjson` : les documents réduits aux champs du modèle (`shape`) et
+  encodés par orjson (`fast_response`), sans response_model.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+
+from datagen import generate_inventories, generate_products
+
+
+def response_field(app, path):
+    return next(r.response_field for r in app.routes if getattr(r, "path", None) == path and "GET" in r.methods)
+
+
+async def cpu_per_request(runs, build, inventories, products):
+    """Temps CPU médian d'un appel à `build`, en ms"""
+    timings = []
+    for _ in range(runs):
+        # Chaque requête reçoit ses propres documents, comme à la sortie d'un curseur Motor
+        # (serialize_doc ne modifie que le premier niveau)
+        docs = [dict(inv) for inv in inventories], [dict(p) for p in products]
+        started = time.process_time()
+        await build(*docs)
+        timings.append((time.process_time() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def main(args):
+    import server
+
+    rng = random.Random(42)
+    products = generate_products(args.products, rng)
+    for product in products:
+        product["_id"] = ObjectId()
+    inventories = list(generate_inventories(products, -(-args.days // 365), rng))[-args.days:]
+    for inventory in inventories:
+        inventory["_id"] = ObjectId()
+    field = response_field(server.app, "/api/inventories")
+
+    async def inventories_models(response_class, inventories, products):
+        models = [server.from_document(server.DailyInventory, inv) for inv in inventories]
+        content = await serialize_response(field=field, response_content=models, is_coroutine=True)
+        return response_class(content).body
+
+    async def inventories_fast(inventories, products):
+        return server.fast_response([server.shape_inventory(inv) for inv in inventories]).body
+
+    async def export(response_class, inventories, products):
+        content = {
+            "inventories": [server.money.euros(server.serialize_doc(inv), "inventories") for inv in inventories],
+            "products": [server.money.euros(server.serialize_doc(p), "products") for p in products],
+        }
+        return response_class(jsonable_encoder(content)).body
+
+    async def export_fast(inventories, products):
+        return server.fast_response({
+            "inventories": [server.money.euros(server.serialize_doc(inv), "inventories") for inv in inventories],
+            "products": [server.money.euros(server.serialize_doc(p), "products") for p in products],
+        }).body
+
+    fast = await inventories_fast([dict(inv) for inv in inventories], products)
+    assert fast == await inventories_models(ORJSONResponse, [dict(inv) for inv in inventories], products), \
+        "les deux chemins doivent concorder"
+
+    scenarios = {
+        f"GET /inventories?limit={args.days}": {
+            "modèles + json": lambda *docs: inventories_models(JSONResponse, *docs),
+            "modèles + orjson": lambda *docs: inventories_models(ORJSONResponse, *docs),
+            "dicts + orjson": inventories_fast,
+        },
+        "GET /export": {
+            "jsonable_encoder + json": lambda *docs: export(JSONResponse, *docs),
+            "jsonable_encoder + orjson": lambda *docs: export(ORJSONResponse, *docs),
+            "dicts + orjson": export_fast,
+        },
+    }
+
+    print(f"{args.days} inventaires x {args.products} produits, {args.runs} requêtes, temps CPU médian par requête")
+    for endpoint, paths in scenarios.items():
+        print(f"\n{endpoint}")
+        reference = None
+        for name, build in paths.items():
+            cpu = await cpu_per_request(args.runs, build, inventories, products)
+            reference = reference or cpu
+            print(f"  {name:<28}{cpu:>9.1f} ms{reference / cpu:>8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--runs", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,64 @@
+"""
+Benchmark de GET /api/stats/summary sur un historique de plusieurs années
+
+Usage:
+    python benchmarks/bench_stats_summary.py --years 4 --products 40 --runs 20
+
+Les données sont celles de `datagen.py` (produits et inventaires, sans
+employés), générées dans une base dédiée (`<DB_NAME>_bench`) qui est vidée au
+début du benchmark.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from datagen import BENCH_DB_NAME, populate
+
+
+async def main(args):
+    import server
+    from httpx import AsyncClient, ASGITransport
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    mongo = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    server.db = mongo[BENCH_DB_NAME]
+
+    print(f"Génération de {args.years} an(s) x {args.products} produits dans {BENCH_DB_NAME}...")
+    await populate(server.db, args.products, args.years, 0)
+    num_days = await server.db.inventories.count_documents({})
+
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.get("/api/stats/summary")
+        response.raise_for_status()
+        first_sold = response.json()["products_stats"][0]["total_sold"]
+        avg = response.json()["products_stats"][0]["avg_sold_per_day"]
+        assert round(first_sold / num_days, 1) == avg, "tous les jours doivent être agrégés"
+
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            response = await client.get("/api/stats/summary")
+            response.raise_for_status()
+            timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    print(f"{num_days} jours, {args.runs} requêtes")
+    print(f"  médiane: {statistics.median(timings):.1f} ms")
+    print(f"  min:     {timings[0]:.1f} ms")
+    print(f"  max:     {timings[-1]:.1f} ms")
+
+    if not args.keep:
+        await mongo.drop_database(BENCH_DB_NAME)
+    mongo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, default=4)
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="conserver la base de benchmark")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,169 @@
+"""
+Générateur de données synthétiques pour les benchmarks
+
+Usage:
+    python benchmarks/datagen.py --products 40 --years 3 --employees 200
+
+Produit un jeu de données déterministe (même graine, mêmes documents) :
+`products` produits, un inventaire par jour sur `years` années se terminant
+le 31/12/2025, `employees` employés et une fiche de paie par employé et par
+mois. Les données sont écrites dans une base dédiée (`<DB_NAME>_bench`), vidée
+au préalable, puis les rollups et les index sont construits comme en production.
+Les montants sont écrits en centimes, comme le fait l'API (`backend/money.py`).
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(ROOT_DIR / 'backend' / '.env')
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'halimou')
+sys.path.insert(0, str(ROOT_DIR / 'backend'))
+import money  # noqa: E402
+
+BENCH_DB_NAME = os.environ['DB_NAME'] + '_bench'
+CATEGORIES = ["gâteau", "viennoiserie", "autre"]
+ROLES = ["Vendeur", "Pâtissier", "Boulanger", "Apprenti"]
+# Fin fixe de l'historique : les dates ne dépendent pas du jour d'exécution
+LAST_DAY = date(2025, 12, 31)
+CREATED_AT = datetime(2020, 1, 1)
+
+
+def inventory_dates(years):
+    first = LAST_DAY - timedelta(days=365 * years - 1)
+    return [(first + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(365 * years)]
+
+
+def periods(years):
+    return sorted({d[:7] for d in inventory_dates(years)})
+
+
+def generate_products(num_products, rng):
+    return [
+        {
+            "name": f"Produit {i:04d}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "price": money.to_cents(round(rng.uniform(0.8, 25.0), 2)),
+            "is_recurring": i % 4 != 0,
+            # Un produit sur vingt est archivé
+            "is_archived": i % 20 == 19,
+            "created_at": CREATED_AT,
+        }
+        for i in range(num_products)
+    ]
+
+
+def generate_inventories(products, years, rng):
+    """Un inventaire par jour ; chaque produit est présent neuf jours sur dix"""
+    for day in inventory_dates(years):
+        lines = []
+        for product in products:
+            if rng.random() >= 0.9:
+                continue
+            produced = rng.randint(5, 60)
+            sold = rng.randint(0, produced)
+            wasted = rng.randint(0, produced - sold)
+            lines.append({
+                "product_id": str(product["_id"]),
+                "product_name": product["name"],
+                "category": product["category"],
+                "quantity_produced": produced,
+                "quantity_sold": sold,
+                "quantity_wasted": wasted,
+                "quantity_remaining": produced - sold - wasted,
+                "price": product["price"],
+            })
+        yield {
+            "date": day,
+            "products": lines,
+            "total_revenue": sum(l["quantity_sold"] * l["price"] for l in lines),
+            "created_at": CREATED_AT,
+            "updated_at": CREATED_AT,
+        }
+
+
+def generate_employees(num_employees, rng):
+    return [
+        {
+            "full_name": f"Employé {i:05d}",
+            "role": ROLES[i % len(ROLES)],
+            "base_salary": rng.randrange(1700, 3200, 50) * money.CENTS,
+            "is_active": i % 10 != 9,
+            "created_at": CREATED_AT,
+        }
+        for i in range(num_employees)
+    ]
+
+
+def generate_payrolls(employee_ids, years, rng):
+    for employee_id in employee_ids:
+        for period in periods(years):
+            yield {
+                "employee_id": str(employee_id),
+                "period": period,
+                "advances": rng.choice([0, 0, 100, 200, 500]) * money.CENTS,
+                "paid": 0,
+                "notes": None,
+                "created_at": CREATED_AT,
+            }
+
+
+async def insert_batches(collection, documents, batch_size):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            await collection.insert_many(batch)
+            batch = []
+    if batch:
+        await collection.insert_many(batch)
+
+
+async def populate(db, num_products, years, num_employees, seed=42, batch_size=1000):
+    """Vider `db` puis y écrire le jeu de données ; renvoie le nombre de documents par collection"""
+    import init_db
+    import rollups
+
+    rng = random.Random(seed)
+    for name in await db.list_collection_names():
+        await db.drop_collection(name)
+
+    products = generate_products(num_products, rng)
+    await db.products.insert_many(products)
+    await insert_batches(db.inventories, generate_inventories(products, years, rng), batch_size)
+    employees = generate_employees(num_employees, rng)
+    if employees:
+        await db.employees.insert_many(employees)
+    await insert_batches(db.payrolls, generate_payrolls([e["_id"] for e in employees], years, rng), batch_size)
+
+    await rollups.rebuild(db, batch_size=batch_size)
+    await init_db.ensure_indexes(db, log=lambda message: None)
+    return {
+        name: await db[name].count_documents({})
+        for name in ("products", "inventories", "employees", "payrolls")
+    }
+
+
+async def main(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    mongo = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    counts = await populate(mongo[BENCH_DB_NAME], args.products, args.years, args.employees, seed=args.seed)
+    print(f"✓ {BENCH_DB_NAME}: " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+    mongo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
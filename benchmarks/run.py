@@ -0,0 +1,255 @@
+"""
+Suite de benchmarks de l'API
+
+Usage:
+    python benchmarks/run.py --products 40 --years 3 --employees 200 --runs 50 --output resultats.json
+    python benchmarks/run.py --output apres.json --compare avant.json --max-regression 20
+    python benchmarks/run.py --compact --output compact.json --compare resultats.json
+
+Génère le jeu de données de `datagen.py` dans `<DB_NAME>_bench`, puis exécute
+chaque scénario (un par endpoint) à travers httpx `ASGITransport`, sans
+serveur HTTP. Les lectures passent d'abord, les écritures ensuite, pour que
+les lectures mesurent toutes le même jeu de données. `--compact` convertit tout
+l'historique au stockage compact (`backend/compact.py`) avant les mesures.
+
+Le résultat JSON (sur la sortie standard, ou `--output`) donne par scénario
+les latences p50/p95/p99 et le débit ; `--compare` affiche l'écart avec un
+résultat précédent, et `--max-regression` fait échouer le script si un p50
+se dégrade de plus de ce pourcentage.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from datagen import BENCH_DB_NAME, LAST_DAY, ROOT_DIR, inventory_dates, periods, populate
+
+
+def percentile(sorted_values, pct):
+    """Percentile au rang le plus proche"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def new_day(i):
+    """Jours postérieurs à l'historique généré, pour les créations d'inventaires"""
+    return (LAST_DAY + timedelta(days=1 + i)).strftime("%Y-%m-%d")
+
+
+def inventory_lines(products, i):
+    return [
+        {
+            "product_id": p["id"],
+            "product_name": p["name"],
+            "category": p["category"],
+            "quantity_produced": 30,
+            "quantity_sold": 20 + i % 7,
+            "quantity_wasted": 2,
+            "quantity_remaining": 8 - i % 7,
+            "price": p["price"],
+        }
+        for p in products
+    ]
+
+
+def build_scenarios(client, data, runs):
+    """(nom, écriture, fonction i -> requête) ; les écritures suivent les lectures"""
+    products, employees, payrolls = data["products"], data["employees"], data["payrolls"]
+    days, last_period = data["days"], data["periods"][-1]
+    month_start = f"{last_period}-01"
+    product = lambda i: products[i % len(products)]["id"]
+    day = lambda i: days[-1 - i % len(days)]
+    bulk_size = 7
+
+    reads = [
+        ("GET /", lambda i: client.get("/api/")),
+        ("GET /products", lambda i: client.get("/api/products")),
+        ("GET /products/{id}", lambda i: client.get(f"/api/products/{product(i)}")),
+        ("GET /inventories", lambda i: client.get("/api/inventories")),
+        ("GET /inventories?page_size=100", lambda i: client.get("/api/inventories", params={"page_size": 100})),
+        ("GET /inventories/{date}", lambda i: client.get(f"/api/inventories/{day(i)}")),
+        ("GET /stats/summary", lambda i: client.get("/api/stats/summary")),
+        ("GET /stats/summary (mois)", lambda i: client.get("/api/stats/summary", params={"start_date": month_start})),
+        ("GET /stats/product/{id}", lambda i: client.get(f"/api/stats/product/{product(i)}")),
+        ("GET /stats/breakdown?by=category", lambda i: client.get("/api/stats/breakdown", params={"by": "category"})),
+        ("GET /stats/breakdown?by=weekday", lambda i: client.get("/api/stats/breakdown", params={"by": "weekday"})),
+        ("GET /stats/rolling", lambda i: client.get("/api/stats/rolling", params={"start_date": days[-90], "end_date": days[-1]})),
+        ("GET /forecast/{date}", lambda i: client.get(f"/api/forecast/{new_day(0)}")),
+        ("GET /export", lambda i: client.get("/api/export")),
+        ("GET /export?format=csv", lambda i: client.get("/api/export", params={"format": "csv"})),
+        ("GET /employees", lambda i: client.get("/api/employees")),
+        ("GET /employees/{id}", lambda i: client.get(f"/api/employees/{employees[i % len(employees)]['id']}")),
+        ("GET /payrolls?period=", lambda i: client.get("/api/payrolls", params={"period": last_period})),
+        ("GET /payrolls/summary", lambda i: client.get("/api/payrolls/summary", params={"period": last_period})),
+    ]
+    writes = [
+        ("POST /products", lambda i: client.post("/api/products", json={"name": f"Bench {i}", "category": "autre", "price": 1.0})),
+        ("PUT /products/{id}", lambda i: client.put(f"/api/products/{product(i)}", json={"price": 2.0 + i % 3})),
+        ("POST /inventories", lambda i: client.post("/api/inventories", json={"date": new_day(i), "products": inventory_lines(products, i)})),
+        ("POST /inventories/bulk", lambda i: client.post("/api/inventories/bulk", json=[
+            {"date": new_day(runs + i * bulk_size + k), "products": inventory_lines(products, k)} for k in range(bulk_size)
+        ])),
+        ("PUT /inventories/{date}", lambda i: client.put(f"/api/inventories/{day(i)}", json={"products": inventory_lines(products, i)})),
+        ("PATCH /inventories/{date}/products/{id}", lambda i: client.patch(
+            f"/api/inventories/{day(i)}/products/{products[0]['id']}", json={"quantity_sold": 10 + i % 5, "quantity_remaining": 18 - i % 5}
+        )),
+        ("DELETE /inventories/{date}", lambda i: client.delete(f"/api/inventories/{new_day(i)}")),
+        ("POST /employees", lambda i: client.post("/api/employees", json={"full_name": f"Bench {i}", "base_salary": 1800})),
+        ("PUT /employees/{id}", lambda i: client.put(f"/api/employees/{employees[i % len(employees)]['id']}", json={"base_salary": 1900 + i})),
+        ("PUT /payrolls/{id}", lambda i: client.put(f"/api/payrolls/{payrolls[i % len(payrolls)]['id']}", json={"advances": 100 + i})),
+        ("POST /payrolls/generate", lambda i: client.post("/api/payrolls/generate", params={"period": f"{2100 + i // 12}-{i % 12 + 1:02d}"})),
+    ]
+    return [(name, False, make) for name, make in reads] + [(name, True, make) for name, make in writes]
+
+
+async def measure(make_request, runs, concurrency):
+    """Exécuter `runs` requêtes, `concurrency` à la fois ; latences en ms et débit"""
+    timings, errors = [], 0
+    queue = iter(range(runs))
+
+    async def worker():
+        nonlocal errors
+        for i in queue:
+            started = time.perf_counter()
+            response = await make_request(i)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {
+        "requests": runs,
+        "errors": errors,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "max_ms": round(timings[-1], 3),
+        "throughput_rps": round(runs / elapsed, 1),
+    }
+
+
+async def load_context(client):
+    products = (await client.get("/api/products")).json()
+    employees = (await client.get("/api/employees", params={"include_inactive": True})).json()
+    return {"products": products, "employees": employees}
+
+
+def compare(baseline, current):
+    """Afficher l'écart de p50/p95 avec un résultat précédent ; renvoie le pire écart de p50 en %"""
+    print(f"{'scénario':<44}{'p50 avant':>12}{'p50 après':>12}{'écart':>9}{'p95 avant':>12}{'p95 après':>12}", file=sys.stderr)
+    worst = 0.0
+    for name, result in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        change = (result["p50_ms"] / before["p50_ms"] - 1) * 100 if before["p50_ms"] else 0.0
+        worst = max(worst, change)
+        print(f"{name:<44}{before['p50_ms']:>9.2f} ms{result['p50_ms']:>9.2f} ms{change:>+8.1f}%"
+              f"{before['p95_ms']:>9.2f} ms{result['p95_ms']:>9.2f} ms", file=sys.stderr)
+    return worst
+
+
+async def main(args):
+    import server
+    from httpx import AsyncClient, ASGITransport
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    mongo = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    server.db = mongo[BENCH_DB_NAME]
+
+    print(f"Génération de {args.products} produits x {args.years} an(s), {args.employees} employés dans {BENCH_DB_NAME}...",
+          file=sys.stderr)
+    counts = await populate(server.db, args.products, args.years, args.employees, seed=args.seed)
+    if args.compact:
+        import compact
+        report = await compact.migrate(server.db, new_day(0), log=lambda message: None)
+        print(f"Stockage compact : {report['compacted']} inventaires convertis", file=sys.stderr)
+
+    results = {}
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        data = await load_context(client)
+        data["days"] = inventory_dates(args.years)
+        data["periods"] = periods(args.years)
+        payrolls = await client.get("/api/payrolls", params={"period": data["periods"][-1]})
+        data["payrolls"] = payrolls.json()
+
+        for name, is_write, make_request in build_scenarios(client, data, args.runs):
+            if args.scenario and not re.search(args.scenario, name):
+                continue
+            if not is_write:
+                # Échauffement : caches, tableau analytique, modèles de prévision
+                for i in range(args.warmup):
+                    await make_request(i)
+            results[name] = await measure(make_request, args.runs, 1 if is_write else args.concurrency)
+            print(f"  {name:<44}p50 {results[name]['p50_ms']:>9.2f} ms  p95 {results[name]['p95_ms']:>9.2f} ms"
+                  f"  {results[name]['throughput_rps']:>8.1f} req/s", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "dataset": {"products": args.products, "years": args.years, "employees": args.employees,
+                        "seed": args.seed, "documents": counts},
+            "runs": args.runs,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "compact": args.compact,
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if not args.keep:
+        await mongo.drop_database(BENCH_DB_NAME)
+    mongo.close()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            worst = compare(json.load(f), report)
+        if args.max_regression is not None and worst > args.max_regression:
+            print(f"✗ p50 dégradé de {worst:.1f}% (max {args.max_regression}%)", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--runs", type=int, default=50, help="requêtes mesurées par scénario")
+    parser.add_argument("--warmup", type=int, default=3, help="requêtes non mesurées avant chaque lecture")
+    parser.add_argument("--concurrency", type=int, default=1, help="requêtes simultanées pour les lectures")
+    parser.add_argument("--compact", action="store_true", help="stockage compact des inventaires")
+    parser.add_argument("--scenario", help="expression régulière filtrant les scénarios")
+    parser.add_argument("--output", help="fichier JSON de résultats (sortie standard par défaut)")
+    parser.add_argument("--compare", help="résultat JSON précédent à comparer")
+    parser.add_argument("--max-regression", type=float, help="échouer si un p50 se dégrade de plus de ce pourcentage")
+    parser.add_argument("--keep", action="store_true", help="conserver la base de benchmark")
+    asyncio.run(main(parser.parse_args()))
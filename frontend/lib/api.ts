@@ -58,6 +58,11 @@ export interface ProductStat {
   avg_sold_per_day: number
 }
 
+export interface Page<T> {
+  items: T[]
+  next_cursor: string | null
+}
+
 // API Functions
 export const productApi = {
   getAll: () => api.get<Product[]>('/products'),
@@ -69,19 +74,99 @@ export const productApi = {
 
 export const inventoryApi = {
   getAll: (limit = 30) => api.get<DailyInventory[]>('/inventories', { params: { limit } }),
+  getPage: (pageSize = 30, cursor?: string) =>
+    api.get<Page<DailyInventory>>('/inventories', { params: { page_size: pageSize, cursor } }),
   getByDate: (date: string) => api.get<DailyInventory>(`/inventories/${date}`),
   create: (data: { date: string; products: InventoryProduct[] }) => api.post<DailyInventory>('/inventories', data),
   update: (date: string, data: { products: InventoryProduct[] }) => api.put<DailyInventory>(`/inventories/${date}`, data),
+  updateLine: (
+    date: string,
+    productId: string,
+    data: Partial<Pick<InventoryProduct, 'quantity_produced' | 'quantity_sold' | 'quantity_wasted' | 'quantity_remaining'>>
+  ) => api.patch<{ date: string; product: InventoryProduct; total_revenue: number }>(`/inventories/${date}/products/${productId}`, data),
   delete: (date: string) => api.delete(`/inventories/${date}`),
 }
 
+export interface RollingWindow {
+  sold: number[]
+  wasted: number[]
+  revenue: number[]
+  avg_sold: number[]
+  avg_wasted: number[]
+  avg_revenue: number[]
+}
+
+export interface RollingProductStats {
+  product_id: string
+  product_name: string
+  category: string
+  sold: number[]
+  wasted: number[]
+  revenue: number[]
+  rolling: Record<string, RollingWindow>
+}
+
+export interface RollingStats {
+  windows: number[]
+  start_date: string | null
+  end_date: string | null
+  dates: string[]
+  days: Record<string, number[]>
+  products: RollingProductStats[]
+}
+
+export interface ProductForecast {
+  product_id: string
+  product_name: string | null
+  category: string | null
+  expected_sold: number
+  suggested_production: number
+  observations: number
+}
+
+export interface ProductionForecast {
+  date: string
+  weekday: number
+  fitted_through: string | null
+  products: ProductForecast[]
+}
+
+export interface BreakdownGroup {
+  key: string | number | null
+  days: number
+  total_produced: number
+  total_sold: number
+  total_wasted: number
+  total_revenue: number
+}
+
+export interface StatsBreakdown {
+  by: 'category' | 'weekday' | 'month'
+  start_date: string | null
+  end_date: string | null
+  groups: BreakdownGroup[]
+}
+
+export const forecastApi = {
+  get: (date: string) => api.get<ProductionForecast>(`/forecast/${date}`),
+}
+
 export const statsApi = {
   getSummary: (startDate?: string, endDate?: string) => 
     api.get<StatsSummary>('/stats/summary', { params: { start_date: startDate, end_date: endDate } }),
   getProductStats: (productId: string, startDate?: string, endDate?: string) =>
     api.get(`/stats/product/${productId}`, { params: { start_date: startDate, end_date: endDate } }),
-  export: (startDate?: string, endDate?: string) =>
-    api.get('/export', { params: { start_date: startDate, end_date: endDate } }),
+  getBreakdown: (by: StatsBreakdown['by'], startDate?: string, endDate?: string) =>
+    api.get<StatsBreakdown>('/stats/breakdown', { params: { by, start_date: startDate, end_date: endDate } }),
+  getRolling: (windows: number[] = [7, 30, 90], startDate?: string, endDate?: string, productId?: string) =>
+    api.get<RollingStats>('/stats/rolling', {
+      params: { windows: windows.join(','), start_date: startDate, end_date: endDate, product_id: productId },
+    }),
+  export: (startDate?: string, endDate?: string, format: 'json' | 'ndjson' | 'csv' = 'json') =>
+    api.get('/export', {
+      params: { start_date: startDate, end_date: endDate, format },
+      responseType: format === 'json' ? 'json' : 'blob',
+    }),
 }
 
 // Payroll types and APIs
@@ -111,9 +196,39 @@ export const employeesApi = {
   delete: (id: string) => api.delete(`/employees/${id}`),
 }
 
+export interface PayrollBalance {
+  employee_id: string
+  full_name: string
+  role?: string | null
+  base_salary: number
+  advances: number
+  paid: number
+  entries: number
+  balance: number
+}
+
+export interface PayrollSummary {
+  period: string
+  total_base_salary: number
+  total_advances: number
+  total_paid: number
+  total_balance: number
+  employees: PayrollBalance[]
+}
+
+export interface PayrollGenerationReport {
+  period: string
+  created: number
+  skipped: number
+  entries: PayrollEntry[]
+}
+
 export const payrollApi = {
   getAll: (params?: { employee_id?: string; period?: string }) => api.get<PayrollEntry[]>('/payrolls', { params }),
+  getSummary: (period: string, includeInactive = false) =>
+    api.get<PayrollSummary>('/payrolls/summary', { params: { period, include_inactive: includeInactive } }),
   create: (data: Omit<PayrollEntry, 'id' | 'created_at'>) => api.post<PayrollEntry>('/payrolls', data),
+  generate: (period: string) => api.post<PayrollGenerationReport>('/payrolls/generate', null, { params: { period } }),
   update: (id: string, data: Partial<PayrollEntry>) => api.put<PayrollEntry>(`/payrolls/${id}`, data),
   delete: (id: string) => api.delete(`/payrolls/${id}`),
 }
@@ -4,7 +4,11 @@ Configuration et fixtures pour les tests pytest
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
+import ast
 import os
+import shutil
+import subprocess
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -40,10 +44,14 @@ async def test_client():
     test_db = test_client_mongo[TEST_DB_NAME]
     
     # Nettoyer la base de données de test avant le test
-    collections = ['products', 'inventories', 'employees', 'payrolls']
+    collections = ['products', 'inventories', 'employees', 'payrolls', 'stats_daily', 'stats_monthly', 'counters', 'forecast_models', 'inventory_catalogues']
     for collection_name in collections:
         await test_db[collection_name].delete_many({})
     
+    # Créer les index déclarés (dont l'unicité des dates d'inventaire)
+    import init_db
+    await init_db.ensure_indexes(test_db, log=lambda message: None)
+    
     # Sauvegarder la référence originale de db
     original_db = server.db
     
@@ -117,3 +125,23 @@ def sample_payroll_data():
         "paid": 0,
         "notes": "Avance sur salaire"
     }
+
+
+@pytest.fixture
+def settings_from_env(tmp_path):
+    """Évaluer une expression après import d'un module d'une copie de backend/ dotée du .env donné"""
+    def evaluate(env: dict, expression: str, module: str = "server"):
+        backend = tmp_path / 'backend'
+        shutil.copytree(ROOT_DIR / 'backend', backend, ignore=shutil.ignore_patterns('__pycache__', '.env'),
+                        dirs_exist_ok=True)
+        settings = {'MONGO_URL': TEST_MONGO_URL, 'DB_NAME': TEST_DB_NAME, **env}
+        (backend / '.env').write_text(''.join(f'{key}={value}\n' for key, value in settings.items()))
+        # Seul le .env fournit ces variables
+        environ = {key: value for key, value in os.environ.items() if key not in settings}
+        result = subprocess.run(
+            [sys.executable, '-c', f'import {module}; print(repr({expression}))'],
+            cwd=backend, env=environ, capture_output=True, text=True, timeout=120
+        )
+        assert result.returncode == 0, result.stderr
+        return ast.literal_eval(result.stdout.strip().splitlines()[-1])
+    return evaluate
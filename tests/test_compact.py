@@ -0,0 +1,185 @@
+"""
+Tests pour le stockage compact des inventaires (compact.py)
+"""
+import pytest
+from datetime import date, timedelta
+
+
+def day(offset):
+    return (date.today() - timedelta(days=offset)).strftime("%Y-%m-%d")
+
+
+TODAY = day(0)
+
+READS = [
+    ("/api/inventories", {}),
+    ("/api/inventories", {"page_size": 2}),
+    ("/api/inventories/" + day(2), {}),
+    ("/api/stats/summary", {}),
+    ("/api/stats/breakdown", {"by": "category"}),
+    ("/api/stats/breakdown", {"by": "month"}),
+    ("/api/export", {}),
+    ("/api/export", {"format": "csv"}),
+]
+
+
+async def create_history(test_client):
+    """Deux produits sur quatre jours ; le second produit change de prix et manque un jour"""
+    products = []
+    for name, category, price in (("Croissant", "viennoiserie", 1.2), ("Tarte", "gâteau", 18.5)):
+        response = await test_client.post("/api/products", json={"name": name, "category": category, "price": price})
+        products.append(response.json())
+    for offset in range(3, -1, -1):
+        lines = [
+            {
+                "product_id": p["id"],
+                "product_name": p["name"],
+                "category": p["category"],
+                "quantity_produced": 20 + offset,
+                "quantity_sold": 15 + i,
+                "quantity_wasted": 2,
+                "quantity_remaining": 3 + offset - i,
+                "price": p["price"] + (1 if i and offset < 2 else 0),
+            }
+            for i, p in enumerate(products)
+            if not (i and offset == 2)
+        ]
+        response = await test_client.post("/api/inventories", json={"date": day(offset), "products": lines})
+        assert response.status_code == 200
+    return products
+
+
+async def read_all(test_client, product_ids):
+    paths = READS + [(f"/api/stats/product/{pid}", {}) for pid in product_ids]
+    return [(await test_client.get(path, params=params)).text for path, params in paths]
+
+
+async def reload_analytics():
+    """Reconstruire le tableau analytique depuis la collection (la migration ne change pas la version)"""
+    import server
+    server.analytics_table.version = None
+    await server.load_analytics(await server.get_version("inventories"))
+
+
+class TestCompactStorage:
+    """Tests pour la migration vers la disposition en colonnes et sa lecture"""
+
+    @pytest.mark.asyncio
+    async def test_migrate_keeps_responses(self, test_client, monkeypatch):
+        """Les jours compactés répondent à l'identique, par le tableau analytique comme par MongoDB"""
+        import compact
+        import rollups
+        import server
+        products = await create_history(test_client)
+        product_ids = [p["id"] for p in products]
+        before = await read_all(test_client, product_ids)
+
+        report = await compact.migrate(server.db, TODAY, log=lambda message: None)
+        assert report["compacted"] == 3
+        assert report["entries"] == 3
+        stored = await server.db.inventories.find_one({"date": day(1)})
+        assert "products" not in stored
+        assert stored["columns"]["sold"] == [15, 16]
+        assert "products" in await server.db.inventories.find_one({"date": TODAY})
+
+        await reload_analytics()
+        assert server.analytics_table.usable
+        assert await read_all(test_client, product_ids) == before
+
+        # Repli sur les agrégations MongoDB
+        async def no_table(version):
+            return None
+        monkeypatch.setattr(server, "load_analytics", no_table)
+        assert await read_all(test_client, product_ids) == before
+        assert await rollups.verify(server.db) == []
+
+    @pytest.mark.asyncio
+    async def test_migrate_is_incremental(self, test_client):
+        """Une seconde migration étend l'instantané du catalogue sans invalider les jours déjà compactés"""
+        import compact
+        import server
+        products = await create_history(test_client)
+        first = await compact.migrate(server.db, day(1), log=lambda message: None)
+        second = await compact.migrate(server.db, TODAY, log=lambda message: None)
+        assert (first["compacted"], second["compacted"]) == (2, 1)
+        assert second["entries"] > first["entries"]
+        assert await server.db.inventory_catalogues.count_documents({}) == 2
+
+        response = await test_client.get(f"/api/stats/product/{products[1]['id']}")
+        assert [s["date"] for s in response.json()["daily_stats"]] == [day(3), day(1), day(0)]
+
+    @pytest.mark.asyncio
+    async def test_writes_restore_rows(self, test_client):
+        """PUT et PATCH sur un jour compact le réécrivent en lignes"""
+        import compact
+        import server
+        products = await create_history(test_client)
+        await compact.migrate(server.db, TODAY, log=lambda message: None)
+        await reload_analytics()
+
+        response = await test_client.patch(
+            f"/api/inventories/{day(1)}/products/{products[0]['id']}", json={"quantity_sold": 10, "quantity_remaining": 10}
+        )
+        assert response.status_code == 200
+        assert response.json()["product"]["product_name"] == "Croissant"
+        stored = await server.db.inventories.find_one({"date": day(1)})
+        assert "columns" not in stored and "catalogue" not in stored
+        assert stored["products"][0]["quantity_sold"] == 10
+
+        line = {**stored["products"][1], "quantity_sold": 1, "quantity_remaining": 19}
+        response = await test_client.put(f"/api/inventories/{day(3)}", json={"products": [line]})
+        assert response.status_code == 200
+        stored = await server.db.inventories.find_one({"date": day(3)})
+        assert "columns" not in stored and len(stored["products"]) == 1
+
+        # Les statistiques incrémentales et celles recalculées depuis la collection concordent
+        summary = (await test_client.get("/api/stats/summary")).json()
+        await reload_analytics()
+        assert (await test_client.get("/api/stats/summary")).json() == summary
+
+        response = await test_client.delete(f"/api/inventories/{day(2)}")
+        assert response.status_code == 200
+        import rollups
+        assert await rollups.verify(server.db) == []
+
+    @pytest.mark.asyncio
+    async def test_patch_missing_line_keeps_compact(self, test_client):
+        """PATCH d'un produit absent du jour (mais présent au catalogue) : 404, le jour reste compact"""
+        import compact
+        import server
+        products = await create_history(test_client)
+        await compact.migrate(server.db, TODAY, log=lambda message: None)
+        await reload_analytics()
+        changes = server.analytics_table.changes
+
+        for product_id in (products[1]["id"], "inconnu"):
+            response = await test_client.patch(f"/api/inventories/{day(2)}/products/{product_id}", json={"quantity_sold": 1})
+            assert response.status_code == 404
+        assert "columns" in await server.db.inventories.find_one({"date": day(2)})
+        assert server.analytics_table.changes == changes
+
+        response = await test_client.patch(f"/api/inventories/{day(2)}/products/{products[0]['id']}", json={"quantity_sold": 1})
+        assert response.status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_expand_all(self, test_client):
+        """--expand rend les documents d'origine"""
+        import compact
+        import server
+        await create_history(test_client)
+        original = await server.db.inventories.find().sort("date", 1).to_list(None)
+        await compact.migrate(server.db, TODAY, log=lambda message: None)
+        assert await compact.expand_all(server.db) == 3
+        assert await server.db.inventories.find().sort("date", 1).to_list(None) == original
+
+    @pytest.mark.asyncio
+    async def test_unusual_lines_stay_rows(self, test_client):
+        """Un jour dont une ligne porte un champ inconnu n'est pas compacté"""
+        import compact
+        import server
+        await create_history(test_client)
+        await server.db.inventories.update_one({"date": day(2)}, {"$set": {"products.0.note": "four en panne"}})
+        report = await compact.migrate(server.db, TODAY, log=lambda message: None)
+        assert (report["compacted"], report["skipped"]) == (2, 1)
+        stored = await server.db.inventories.find_one({"date": day(2)})
+        assert stored["products"][0]["note"] == "four en panne"
@@ -1,6 +1,9 @@
 """
 Tests pour les endpoints d'employés et de paie
 """
+import base64
+import json
+
 import pytest
 import pytest_asyncio
 
@@ -103,6 +106,41 @@ class TestEmployees:
         assert employee_id not in employee_ids
 
 
+    @pytest.mark.asyncio
+    async def test_employees_pagination(self, test_client, sample_employee_data):
+        """Test de la pagination par curseur des employés (tri par nom)"""
+        names = ["Émile", "Alice", "Bruno", "Alice", "Chloé"]
+        for name in names:
+            await test_client.post("/api/employees", json={**sample_employee_data, "full_name": name})
+        
+        seen = []
+        cursor = None
+        while True:
+            params = {"page_size": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = await test_client.get("/api/employees", params=params)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page["items"]) <= 2
+            seen.extend(e["full_name"] for e in page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        assert seen == sorted(names)
+        
+        response = await test_client.get("/api/employees", params={"cursor": "pas-un-curseur"})
+        assert response.status_code == 400
+        
+        # Du JSON valide qui n'a pas la forme d'un curseur
+        for payload in ({"a": 1}, ["Alice"], [{"a": 1}, "x"], "Alice"):
+            malformed = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+            response = await test_client.get("/api/employees", params={"cursor": malformed})
+            assert response.status_code == 400
+            response = await test_client.get("/api/products", params={"cursor": malformed})
+            assert response.status_code == 400
+
+
 class TestPayrolls:
     """Tests pour les opérations CRUD sur les fiches de paie"""
     
@@ -214,3 +252,113 @@ class TestPayrolls:
         payroll_ids = [p["id"] for p in payrolls]
         assert payroll_id not in payroll_ids
 
+    
+    @pytest.mark.asyncio
+    async def test_payroll_summary(self, test_client, sample_employee_data):
+        """Test du solde par employé pour une période (jointure côté serveur)"""
+        jean = (await test_client.post("/api/employees", json=sample_employee_data)).json()
+        marie = (await test_client.post("/api/employees", json={"full_name": "Marie Curie", "base_salary": 1800.0})).json()
+        old = (await test_client.post("/api/employees", json={"full_name": "Ancien", "base_salary": 1500.0})).json()
+        await test_client.put(f"/api/employees/{old['id']}", json={"is_active": False})
+        
+        await test_client.post("/api/payrolls", json={"employee_id": jean["id"], "period": "2024-01", "advances": 700.0, "paid": 300.0})
+        await test_client.post("/api/payrolls", json={"employee_id": jean["id"], "period": "2024-02", "advances": 999.0})
+        
+        response = await test_client.get("/api/payrolls/summary?period=2024-01")
+        assert response.status_code == 200
+        data = response.json()
+        assert [e["full_name"] for e in data["employees"]] == ["Jean Dupont", "Marie Curie"]
+        assert data["employees"][0] == {
+            "employee_id": jean["id"],
+            "full_name": "Jean Dupont",
+            "role": "Pâtissier",
+            "base_salary": 2500.0,
+            "advances": 700.0,
+            "paid": 300.0,
+            "entries": 1,
+            "balance": 1500.0
+        }
+        # Sans fiche de paie sur la période : le solde est le salaire de base
+        assert data["employees"][1] == {
+            "employee_id": marie["id"],
+            "full_name": "Marie Curie",
+            "role": None,
+            "base_salary": 1800.0,
+            "advances": 0.0,
+            "paid": 0.0,
+            "entries": 0,
+            "balance": 1800.0
+        }
+        assert data["total_balance"] == 3300.0
+        
+        response = await test_client.get("/api/payrolls/summary?period=2024-01&include_inactive=true")
+        assert len(response.json()["employees"]) == 3
+        
+        response = await test_client.get("/api/payrolls/summary?period=janvier")
+        assert response.status_code == 400
+    
+    @pytest.mark.asyncio
+    async def test_create_payroll_duplicate_period(self, test_client, sample_employee_data, sample_payroll_data):
+        """Une seule fiche de paie par employé et par période"""
+        employee = (await test_client.post("/api/employees", json=sample_employee_data)).json()
+        payroll_data = {**sample_payroll_data, "employee_id": employee["id"]}
+        assert (await test_client.post("/api/payrolls", json=payroll_data)).status_code == 200
+        response = await test_client.post("/api/payrolls", json=payroll_data)
+        assert response.status_code == 400
+        assert "already exists" in response.json()["detail"]
+    
+    @pytest.mark.asyncio
+    async def test_generate_payrolls(self, test_client, sample_employee_data):
+        """Génération des fiches de paie d'une période pour tous les employés actifs"""
+        jean = (await test_client.post("/api/employees", json=sample_employee_data)).json()
+        marie = (await test_client.post("/api/employees", json={"full_name": "Marie Curie", "base_salary": 1800.0})).json()
+        old = (await test_client.post("/api/employees", json={"full_name": "Ancien", "base_salary": 1500.0})).json()
+        await test_client.put(f"/api/employees/{old['id']}", json={"is_active": False})
+        await test_client.post("/api/payrolls", json={"employee_id": jean["id"], "period": "2024-03", "advances": 100.0})
+        
+        response = await test_client.post("/api/payrolls/generate?period=2024-03")
+        assert response.status_code == 200
+        report = response.json()
+        assert report["created"] == 1
+        assert report["skipped"] == 1
+        assert [e["employee_id"] for e in report["entries"]] == [marie["id"]]
+        assert report["entries"][0]["id"]
+        
+        payrolls = (await test_client.get("/api/payrolls?period=2024-03")).json()
+        assert sorted(p["employee_id"] for p in payrolls) == sorted([jean["id"], marie["id"]])
+        assert next(p for p in payrolls if p["employee_id"] == jean["id"])["advances"] == 100.0
+        
+        # Relancer la génération ne crée rien
+        response = await test_client.post("/api/payrolls/generate?period=2024-03")
+        assert response.json()["created"] == 0
+        assert response.json()["skipped"] == 2
+        
+        response = await test_client.post("/api/payrolls/generate?period=2024-3")
+        assert response.status_code == 400
+    
+    @pytest.mark.asyncio
+    async def test_generate_payrolls_requires_unique_index(self, test_client, sample_employee_data, monkeypatch):
+        """Sans l'index unique (employee_id, period), la génération est refusée plutôt que de créer des doublons"""
+        import server
+        await test_client.post("/api/employees", json=sample_employee_data)
+        await server.db.payrolls.drop_index(server.PAYROLL_UNIQUE_INDEX)
+        monkeypatch.setattr(server, "payroll_index_ready", False)
+        
+        response = await test_client.post("/api/payrolls/generate?period=2024-03")
+        assert response.status_code == 503
+        assert "init_db" in response.json()["detail"]
+        assert await server.db.payrolls.count_documents({}) == 0
+    
+    @pytest.mark.asyncio
+    async def test_generate_payrolls_index_dropped_later(self, test_client, sample_employee_data):
+        """Un index supprimé après sa vérification est détecté aux doublons : ils sont retirés, la génération refusée"""
+        import server
+        await test_client.post("/api/employees", json=sample_employee_data)
+        assert (await test_client.post("/api/payrolls/generate?period=2024-03")).status_code == 200
+        await server.db.payrolls.drop_index(server.PAYROLL_UNIQUE_INDEX)
+        
+        response = await test_client.post("/api/payrolls/generate?period=2024-03")
+        assert response.status_code == 503
+        assert await server.db.payrolls.count_documents({}) == 1
+        response = await test_client.post("/api/payrolls/generate?period=2024-04")
+        assert response.status_code == 503
@@ -0,0 +1,110 @@
+"""
+Tests pour les prévisions de production
+"""
+import pytest
+
+
+def inventory(day, sold, product_id="test_product_id", product_name="Croissant"):
+    return {
+        "date": day,
+        "products": [{
+            "product_id": product_id,
+            "product_name": product_name,
+            "category": "viennoiserie",
+            "quantity_produced": 40,
+            "quantity_sold": sold,
+            "quantity_wasted": 0,
+            "quantity_remaining": 40 - sold,
+            "price": 1.5
+        }]
+    }
+
+
+class TestForecast:
+    """Tests pour l'endpoint /forecast/{date}"""
+
+    @pytest.mark.asyncio
+    async def test_forecast_by_weekday(self, test_client):
+        """La prévision d'un lundi ne dépend que des lundis précédents"""
+        # 2024-01-01, 08 et 15 sont des lundis, le 02 un mardi
+        for day, sold in [("2024-01-01", 10), ("2024-01-02", 5), ("2024-01-08", 20), ("2024-01-15", 30)]:
+            await test_client.post("/api/inventories", json=inventory(day, sold))
+
+        response = await test_client.get("/api/forecast/2024-01-22")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["weekday"] == 0
+        assert data["fitted_through"] == "2024-01-15"
+        line = data["products"][0]
+        # Lissage exponentiel (alpha = 0.3) : 10 -> 13 -> 18.1
+        assert line["expected_sold"] == 18.1
+        assert line["observations"] == 3
+        # Marge de sécurité : un écart type lissé des erreurs
+        assert line["suggested_production"] == 27
+
+        response = await test_client.get("/api/forecast/2024-01-23")
+        assert response.json()["products"][0]["expected_sold"] == 5.0
+
+    @pytest.mark.asyncio
+    async def test_forecast_incremental_refit(self, test_client):
+        """Les nouveaux jours sont ajoutés au modèle sans refit, avec le même résultat qu'un refit complet"""
+        import server
+        import forecast
+        for day, sold in [("2024-01-01", 10), ("2024-01-08", 20)]:
+            await test_client.post("/api/inventories", json=inventory(day, sold))
+        await test_client.get("/api/forecast/2024-01-22")
+
+        await test_client.post("/api/inventories", json=inventory("2024-01-15", 30))
+        state = await server.db[forecast.MODELS].find_one({"product_id": None})
+        assert state["fitted_through"] == "2024-01-08"
+        assert "refit_from" not in state
+        incremental = (await test_client.get("/api/forecast/2024-01-22")).json()
+
+        await server.db[forecast.MODELS].delete_many({})
+        assert (await test_client.get("/api/forecast/2024-01-22")).json() == incremental
+
+    @pytest.mark.asyncio
+    async def test_forecast_follows_past_corrections(self, test_client):
+        """Modifier un jour déjà appris force un nouvel apprentissage"""
+        import server
+        import forecast
+        for day, sold in [("2024-01-01", 10), ("2024-01-08", 20)]:
+            await test_client.post("/api/inventories", json=inventory(day, sold))
+        await test_client.get("/api/forecast/2024-01-15")
+
+        await test_client.put("/api/inventories/2024-01-01", json={"products": inventory("2024-01-01", 20)["products"]})
+        state = await server.db[forecast.MODELS].find_one({"product_id": None})
+        assert state["refit_from"] == "2024-01-01"
+
+        response = await test_client.get("/api/forecast/2024-01-15")
+        assert response.json()["products"][0]["expected_sold"] == 20.0
+
+    @pytest.mark.asyncio
+    async def test_forecast_skips_archived_products(self, test_client, sample_product_data):
+        """Les produits archivés ne sont pas proposés à la production"""
+        product = (await test_client.post("/api/products", json=sample_product_data)).json()
+        await test_client.post("/api/inventories", json={
+            "date": "2024-01-01",
+            "products": inventory("2024-01-01", 10)["products"] + inventory("2024-01-01", 8, product["id"], "Éclair")["products"]
+        })
+        await test_client.put(f"/api/products/{product['id']}", json={"is_archived": True})
+
+        response = await test_client.get("/api/forecast/2024-01-08")
+        assert [p["product_id"] for p in response.json()["products"]] == ["test_product_id"]
+
+    @pytest.mark.asyncio
+    async def test_forecast_invalid_date(self, test_client):
+        """Une date invalide est refusée"""
+        response = await test_client.get("/api/forecast/2024-13-01")
+        assert response.status_code == 400
+
+        response = await test_client.get("/api/forecast/2024-01-08")
+        assert response.status_code == 200
+        assert response.json()["products"] == []
+
+    def test_settings_from_env_file(self, settings_from_env):
+        """backend/.env règle le lissage, pour le serveur comme pour la ligne de commande"""
+        env = {"FORECAST_ALPHA": "0.5", "FORECAST_SAFETY_FACTOR": "2"}
+        expected = (0.5, 2.0)
+        assert settings_from_env(env, "(forecast.ALPHA, forecast.SAFETY_FACTOR)", module="server, forecast") == expected
+        assert settings_from_env(env, "(forecast.ALPHA, forecast.SAFETY_FACTOR)", module="forecast") == expected
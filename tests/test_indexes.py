@@ -0,0 +1,146 @@
+"""
+Tests pour la gestion des index (init_db.py)
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+import init_db  # noqa: E402
+
+
+class TestEnsureIndexes:
+    """Tests de synchronisation des index déclarés"""
+
+    @pytest.mark.asyncio
+    async def test_declared_indexes_exist(self, test_client):
+        """Tous les index déclarés sont créés avec leurs options"""
+        import server
+        for collection_name, specs in init_db.INDEXES.items():
+            existing = await server.db[collection_name].index_information()
+            for keys, options in specs:
+                name = init_db.index_name(keys)
+                assert name in existing, f"{collection_name}.{name} manquant"
+                assert bool(existing[name].get("unique")) == bool(options.get("unique"))
+
+    @pytest.mark.asyncio
+    async def test_obsolete_and_outdated_indexes_are_replaced(self, test_client):
+        """Un index non déclaré est supprimé, un index aux options différentes est recréé"""
+        import server
+        await server.db.inventories.drop_index("date_-1")
+        await server.db.inventories.create_index([("date", -1)], name="date_-1")
+        await server.db.inventories.create_index([("date", -1), ("total_revenue", -1)])
+
+        report = await init_db.ensure_indexes(server.db, log=lambda message: None)
+
+        existing = await server.db.inventories.index_information()
+        assert "date_-1_total_revenue_-1" not in existing
+        assert existing["date_-1"].get("unique") is True
+        assert "inventories.date_-1" in report["created"]
+        assert "inventories.date_-1_total_revenue_-1" in report["dropped"]
+
+    @pytest.mark.asyncio
+    async def test_duplicates_keep_previous_index(self, test_client):
+        """Des dates en double : l'ancien index reste en place et l'erreur liste les documents en conflit"""
+        import server
+        await server.db.inventories.drop_index("date_-1")
+        await server.db.inventories.create_index([("date", -1)], name="date_-1")
+        first = await server.db.inventories.insert_one({"date": "2024-01-15", "products": []})
+        second = await server.db.inventories.insert_one({"date": "2024-01-15", "products": []})
+        await server.db.inventories.insert_one({"date": "2024-01-16", "products": []})
+        await server.db.products.drop_index("is_archived_1__id_1")
+
+        with pytest.raises(init_db.DuplicateKeys) as error:
+            await init_db.ensure_indexes(server.db, log=lambda message: None)
+        found = error.value.duplicates["inventories.date_-1"]
+        assert found == [{"key": {"date": "2024-01-15"}, "count": 2,
+                          "ids": [str(first.inserted_id), str(second.inserted_id)]}]
+        assert "2024-01-15" in str(error.value)
+
+        existing = await server.db.inventories.index_information()
+        assert "date_-1" in existing and not existing["date_-1"].get("unique")
+        # Les autres index sont tout de même synchronisés
+        assert "is_archived_1__id_1" in await server.db.products.index_information()
+
+    @pytest.mark.asyncio
+    async def test_failed_rebuild_restores_index(self, test_client, monkeypatch):
+        """Un doublon écrit après la vérification fait échouer la reconstruction : l'ancien index est remis"""
+        import server
+        await server.db.inventories.drop_index("date_-1")
+        await server.db.inventories.create_index([("date", -1)], name="date_-1")
+        await server.db.inventories.insert_many([{"date": "2024-01-15"}, {"date": "2024-01-15"}])
+        checks = []
+        find_duplicates = init_db.find_duplicates
+
+        async def check_misses_race(collection, keys, limit=10):
+            checks.append(keys)
+            return [] if len(checks) == 1 else await find_duplicates(collection, keys, limit)
+        monkeypatch.setattr(init_db, "find_duplicates", check_misses_race)
+
+        with pytest.raises(init_db.DuplicateKeys) as error:
+            await init_db.ensure_indexes(server.db, log=lambda message: None)
+        assert error.value.duplicates["inventories.date_-1"][0]["count"] == 2
+        existing = await server.db.inventories.index_information()
+        assert "date_-1" in existing and not existing["date_-1"].get("unique")
+
+    @pytest.mark.asyncio
+    async def test_drop_index_already_gone(self):
+        """Un index déjà supprimé par un autre worker n'interrompt pas la synchronisation"""
+        from pymongo.errors import OperationFailure
+
+        class Collection:
+            async def drop_index(self, name):
+                raise OperationFailure("index not found with name [x_1]", code=init_db.INDEX_NOT_FOUND)
+
+        await init_db.drop_index(Collection(), "x_1")
+
+        class Failing:
+            async def drop_index(self, name):
+                raise OperationFailure("not authorized", code=13)
+
+        with pytest.raises(OperationFailure):
+            await init_db.drop_index(Failing(), "x_1")
+
+    @pytest.mark.asyncio
+    async def test_keep_obsolete(self, test_client):
+        """Avec drop_obsolete=False les index non déclarés sont conservés"""
+        import server
+        await server.db.products.create_index([("name", 1)])
+        await init_db.ensure_indexes(server.db, drop_obsolete=False, log=lambda message: None)
+        assert "name_1" in await server.db.products.index_information()
+
+    @pytest.mark.asyncio
+    async def test_sync_is_idempotent(self, test_client):
+        """Une seconde synchronisation ne crée ni ne supprime rien"""
+        import server
+        report = await init_db.ensure_indexes(server.db, log=lambda message: None)
+        assert report == {"created": [], "dropped": [], "failed": []}
+
+
+class TestQueryPlans:
+    """Tests de détection des COLLSCAN dans les plans d'exécution"""
+
+    def test_collscan_in_winning_plan(self):
+        """Un COLLSCAN imbriqué dans le plan retenu est détecté"""
+        explain = {"queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}}
+        assert init_db.find_collscans(explain)
+
+    def test_index_scan(self):
+        """Un plan IXSCAN passe, même si un plan rejeté est un COLLSCAN"""
+        explain = {"queryPlanner": {
+            "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "date_-1"}},
+            "rejectedPlans": [{"stage": "COLLSCAN"}],
+        }}
+        assert not init_db.find_collscans(explain)
+
+    def test_aggregate_explain(self):
+        """Les plans d'agrégation (stages[].$cursor) sont parcourus"""
+        explain = {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}}, {"$sort": {}}]}
+        assert init_db.find_collscans(explain)
+
+    def test_query_shapes_are_filtered(self):
+        """Chaque requête vérifiée cible une collection indexée"""
+        for name, command in init_db.query_shapes():
+            collection = command.get("find") or command.get("aggregate")
+            assert collection in init_db.INDEXES, name
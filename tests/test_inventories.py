@@ -229,3 +229,189 @@ class TestInventories:
         expected_revenue = (10 * 1.50) + (12 * 2.00)  # 15 + 24 = 39
         assert data["total_revenue"] == expected_revenue
 
+
+    @pytest.mark.asyncio
+    async def test_inventories_pagination(self, test_client, sample_inventory_data):
+        """Test de la pagination par curseur des inventaires (dates décroissantes)"""
+        dates = [f"2024-01-{day:02d}" for day in range(1, 8)]
+        for test_date in dates:
+            await test_client.post("/api/inventories", json={**sample_inventory_data, "date": test_date})
+        
+        first = (await test_client.get("/api/inventories?page_size=3")).json()
+        assert [inv["date"] for inv in first["items"]] == ["2024-01-07", "2024-01-06", "2024-01-05"]
+        
+        second = (await test_client.get(f"/api/inventories?page_size=3&cursor={first['next_cursor']}")).json()
+        assert [inv["date"] for inv in second["items"]] == ["2024-01-04", "2024-01-03", "2024-01-02"]
+        
+        last = (await test_client.get(f"/api/inventories?page_size=3&cursor={second['next_cursor']}")).json()
+        assert [inv["date"] for inv in last["items"]] == ["2024-01-01"]
+        assert last["next_cursor"] is None
+    
+    @pytest.mark.asyncio
+    async def test_inventory_conditional_get(self, test_client, sample_inventory_data):
+        """Test des ETag / If-None-Match sur les inventaires et les statistiques"""
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        
+        for url in ["/api/inventories/2024-01-15", "/api/inventories", "/api/stats/summary"]:
+            response = await test_client.get(url)
+            assert response.status_code == 200
+            etag = response.headers["etag"]
+            
+            response = await test_client.get(url, headers={"If-None-Match": etag})
+            assert response.status_code == 304
+            assert response.content == b""
+            assert response.headers["etag"] == etag
+        
+        summary_etag = (await test_client.get("/api/stats/summary")).headers["etag"]
+        inventory_etag = (await test_client.get("/api/inventories/2024-01-15")).headers["etag"]
+        
+        # Une modification rend les ETag précédents obsolètes
+        updated_products = [{**sample_inventory_data["products"][0], "quantity_sold": 16}]
+        await test_client.put("/api/inventories/2024-01-15", json={"products": updated_products})
+        
+        response = await test_client.get("/api/stats/summary", headers={"If-None-Match": summary_etag})
+        assert response.status_code == 200
+        assert response.json()["total_sold"] == 16
+        response = await test_client.get("/api/inventories/2024-01-15", headers={"If-None-Match": inventory_etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != inventory_etag
+    
+    @pytest.mark.asyncio
+    async def test_bulk_import(self, test_client, sample_inventory_data):
+        """Test de l'import groupé d'inventaires (JSON et NDJSON) avec rapport par date"""
+        import json
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        line = sample_inventory_data["products"][0]
+        payload = [
+            {"date": "2024-02-01", "products": [line]},
+            {"date": "2024-02-02", "products": [line]},
+            {"date": "2024-02-02", "products": [line]},                      # doublon dans le lot
+            {"date": "2024-01-15", "products": [line]},                      # déjà en base
+            {"date": "2024-02-03", "products": []},                          # liste vide
+            {"date": "2024-02-04", "products": [{**line, "price": -1}]},     # prix négatif
+            {"date": "2024-02-05"},                                          # champ manquant
+        ]
+        response = await test_client.post("/api/inventories/bulk", json=payload)
+        assert response.status_code == 200
+        report = response.json()
+        assert report["created"] == 2
+        assert report["failed"] == 5
+        statuses = [(r["date"], r["status"]) for r in report["results"]]
+        assert statuses[:3] == [("2024-02-01", "created"), ("2024-02-02", "created"), ("2024-02-02", "error")]
+        assert "already exists" in report["results"][3]["error"]
+        assert "empty" in report["results"][4]["error"]
+        assert "price" in report["results"][5]["error"]
+        assert "Validation error" in report["results"][6]["error"]
+        
+        ndjson = "\n".join(json.dumps({"date": f"2024-03-{d:02d}", "products": [line]}) for d in range(1, 4))
+        response = await test_client.post(
+            "/api/inventories/bulk", content=ndjson, headers={"Content-Type": "application/x-ndjson"}
+        )
+        assert response.json()["created"] == 3
+        
+        stats = (await test_client.get("/api/stats/summary")).json()
+        assert stats["total_sold"] == 15 * 6
+        
+        response = await test_client.post("/api/inventories/bulk", json={"date": "2024-04-01"})
+        assert response.status_code == 400
+    
+    @pytest.mark.asyncio
+    async def test_upsert_inventory(self, test_client, sample_inventory_data):
+        """Test de la création/remplacement atomique via PUT ?upsert=true"""
+        products = sample_inventory_data["products"]
+        
+        response = await test_client.put("/api/inventories/2024-05-01?upsert=true", json={"products": products})
+        assert response.status_code == 200
+        created = response.json()
+        assert created["date"] == "2024-05-01"
+        assert created["total_revenue"] == 15 * 1.50
+        assert created == (await test_client.get("/api/inventories/2024-05-01")).json()
+        
+        replaced_products = [{**products[0], "quantity_sold": 19}]
+        response = await test_client.put("/api/inventories/2024-05-01?upsert=true", json={"products": replaced_products})
+        replaced = response.json()
+        assert replaced["id"] == created["id"]
+        assert replaced["created_at"] == created["created_at"]
+        assert replaced["products"][0]["quantity_sold"] == 19
+        
+        inventories = (await test_client.get("/api/inventories")).json()
+        assert [inv["date"] for inv in inventories] == ["2024-05-01"]
+        stats = (await test_client.get("/api/stats/summary")).json()
+        assert stats["total_sold"] == 19
+        
+        # Les mêmes validations que la création s'appliquent
+        response = await test_client.put("/api/inventories/2024-05-02?upsert=true", json={"products": []})
+        assert response.status_code == 400
+    
+    @pytest.mark.asyncio
+    async def test_patch_inventory_product(self, test_client, sample_inventory_data):
+        """Test de la mise à jour d'une seule ligne produit (PATCH) avec ajustement du revenu"""
+        other_line = {**sample_inventory_data["products"][0], "product_id": "autre", "price": 3.0, "quantity_sold": 4}
+        inventory_data = {**sample_inventory_data, "products": [sample_inventory_data["products"][0], other_line]}
+        await test_client.post("/api/inventories", json=inventory_data)
+        
+        response = await test_client.patch(
+            "/api/inventories/2024-01-15/products/autre",
+            json={"quantity_sold": 6, "quantity_remaining": 12}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["product"]["product_id"] == "autre"
+        assert data["product"]["quantity_sold"] == 6
+        assert data["product"]["quantity_remaining"] == 12
+        assert data["total_revenue"] == 15 * 1.50 + 6 * 3.0
+        
+        inventory = (await test_client.get("/api/inventories/2024-01-15")).json()
+        assert inventory["products"][0]["quantity_sold"] == 15
+        assert inventory["products"][1]["quantity_sold"] == 6
+        assert inventory["total_revenue"] == data["total_revenue"]
+        
+        stats = (await test_client.get("/api/stats/summary")).json()
+        assert stats["total_sold"] == 21
+        assert stats["total_sales"] == data["total_revenue"]
+        
+        response = await test_client.patch("/api/inventories/2024-01-15/products/inconnu", json={"quantity_sold": 1})
+        assert response.status_code == 404
+        response = await test_client.patch("/api/inventories/2024-01-15/products/autre", json={})
+        assert response.status_code == 400
+    
+    @pytest.mark.asyncio
+    async def test_patch_legacy_line_without_counters(self, test_client):
+        """PATCH d'une ligne ancienne sans quantity_sold ni quantity_wasted : pas de 409"""
+        import server
+        await server.db.inventories.insert_one({"date": "2024-01-15", "total_revenue": 0, "products": [{
+            "product_id": "ancien", "product_name": "Chausson", "category": "viennoiserie",
+            "quantity_produced": 10, "price": 150,
+        }]})
+        
+        response = await test_client.patch(
+            "/api/inventories/2024-01-15/products/ancien", json={"quantity_sold": 4, "quantity_wasted": 1}
+        )
+        assert response.status_code == 200
+        assert response.json()["total_revenue"] == 6.0
+        stored = await server.db.inventories.find_one({"date": "2024-01-15"})
+        assert stored["products"][0]["quantity_sold"] == 4
+        assert stored["products"][0]["quantity_wasted"] == 1
+        assert stored["total_revenue"] == 600
+    
+    @pytest.mark.asyncio
+    async def test_list_matches_response_model(self, test_client, sample_inventory_data):
+        """La liste servie sans response_model a exactement la forme du modèle DailyInventory"""
+        import server
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        # Document ancien (montants en centimes) : champ inconnu, ligne sans quantity_wasted
+        legacy_line = {k: v for k, v in sample_inventory_data["products"][0].items() if k != "quantity_wasted"}
+        legacy_line["price"] = 150
+        await server.db.inventories.insert_one({
+            "date": "2024-01-10", "products": [legacy_line], "total_revenue": 2250, "legacy": True
+        })
+        
+        response = await test_client.get("/api/inventories")
+        assert response.headers["content-type"] == "application/json"
+        assert "etag" in response.headers
+        data = response.json()
+        docs = await server.db.inventories.find().sort("date", -1).to_list(None)
+        assert data == [server.from_document(server.DailyInventory, d).model_dump(mode="json") for d in docs]
+        assert data[1]["total_revenue"] == 22.5
+        assert data[1]["products"][0]["price"] == 1.5
+        assert data[1]["products"][0]["quantity_wasted"] == 0
@@ -0,0 +1,135 @@
+"""
+Tests pour les métriques de latence (/api/metrics)
+"""
+from types import SimpleNamespace
+
+import pytest
+
+
+class TestMetrics:
+    """Tests pour le middleware de latence et le listener MongoDB"""
+
+    @pytest.mark.asyncio
+    async def test_request_histogram_by_route(self, test_client):
+        """Les requêtes sont comptées par modèle de route, pas par chemin"""
+        import metrics
+        before = metrics.REQUEST_DURATION.count("GET", "/api/inventories/{date}", 404)
+        await test_client.get("/api/inventories/2024-01-01")
+        await test_client.get("/api/inventories/2024-01-02")
+        assert metrics.REQUEST_DURATION.count("GET", "/api/inventories/{date}", 404) == before + 2
+
+        response = await test_client.get("/api/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        assert "# TYPE http_request_duration_seconds histogram" in body
+        assert 'http_request_duration_seconds_count{method="GET",route="/api/inventories/{date}",status="404"}' in body
+        assert 'route="/api/inventories/2024-01-01"' not in body
+
+    @pytest.mark.asyncio
+    async def test_unmatched_route(self, test_client):
+        """Les chemins inconnus partagent une seule série"""
+        import metrics
+        before = metrics.REQUEST_DURATION.count("GET", "unmatched", 404)
+        await test_client.get("/api/does-not-exist")
+        assert metrics.REQUEST_DURATION.count("GET", "unmatched", 404) == before + 1
+
+    def test_command_listener(self):
+        """Le listener enregistre durée, documents et échecs par collection et commande"""
+        import metrics
+        listener = metrics.CommandMetrics()
+        documents = metrics.MONGO_DOCUMENTS.value("test_listener", "find")
+        durations = metrics.MONGO_DURATION.count("test_listener", "find")
+        failures = metrics.MONGO_FAILURES.value("test_listener", "getMore")
+
+        listener.started(SimpleNamespace(command_name="find", command={"find": "test_listener"},
+                                         request_id=1, connection_id=("localhost", 27017)))
+        listener.succeeded(SimpleNamespace(command_name="find", request_id=1, connection_id=("localhost", 27017),
+                                           duration_micros=1500, reply={"cursor": {"firstBatch": [{}, {}, {}]}}))
+        listener.started(SimpleNamespace(command_name="getMore", command={"getMore": 7, "collection": "test_listener"},
+                                         request_id=2, connection_id=("localhost", 27017)))
+        listener.failed(SimpleNamespace(command_name="getMore", request_id=2, connection_id=("localhost", 27017),
+                                        duration_micros=800))
+
+        assert metrics.MONGO_DOCUMENTS.value("test_listener", "find") == documents + 3
+        assert metrics.MONGO_DURATION.count("test_listener", "find") == durations + 1
+        assert metrics.MONGO_FAILURES.value("test_listener", "getMore") == failures + 1
+        assert 'mongodb_command_duration_seconds_bucket{collection="test_listener",command="find",le="0.0025"}' in metrics.render()
+
+
+class TestProfiling:
+    """Tests pour les traces échantillonnées (/api/admin/traces)"""
+
+    @pytest.fixture(autouse=True)
+    def sample_everything(self, monkeypatch):
+        import profiling
+        monkeypatch.setattr(profiling, "SAMPLE_PERCENT", 100.0)
+        profiling.buffer.clear()
+        yield
+        profiling.buffer.clear()
+
+    @pytest.mark.asyncio
+    async def test_sampled_request_trace(self, test_client):
+        """Une requête échantillonnée est décomposée en temps MongoDB, Python et sérialisation"""
+        await test_client.get("/api/stats/summary", params={"start_date": "2024-01-01"})
+
+        response = await test_client.get("/api/admin/traces")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["enabled"] is True
+        # Les requêtes d'administration ne sont pas tracées
+        assert [t["route"] for t in data["traces"]] == ["/api/stats/summary"]
+        trace = data["traces"][0]
+        assert trace["query"] == "start_date=2024-01-01"
+        assert trace["status"] == 200
+        assert set(trace["phases"]) == {"db_ms", "python_ms", "serialization_ms", "other_ms"}
+        assert trace["phases"]["python_ms"] > 0
+        assert sum(trace["phases"].values()) <= trace["duration_ms"] + 1
+
+        await test_client.delete("/api/admin/traces")
+        assert (await test_client.get("/api/admin/traces")).json()["traces"] == []
+
+    def test_commands_added_to_active_trace(self):
+        """Les commandes émises pendant une trace y sont ajoutées, avec leur requête pour explain()"""
+        import profiling
+        listener = profiling.CommandProfiler()
+        trace = profiling.Trace("GET", "/api/stats/summary", "")
+        token = profiling.current_trace.set(trace)
+        try:
+            listener.started(SimpleNamespace(
+                command_name="find", request_id=1, connection_id=("localhost", 27017),
+                command={"find": "stats_daily", "filter": {"date": "2024-01-01"}, "lsid": {}, "$db": "halimou"}
+            ))
+        finally:
+            profiling.current_trace.reset(token)
+        listener.succeeded(SimpleNamespace(command_name="find", request_id=1, connection_id=("localhost", 27017),
+                                           duration_micros=2500, reply={"cursor": {"firstBatch": [{}]}}))
+
+        assert trace.commands[0]["explain"] == {"find": "stats_daily", "filter": {"date": "2024-01-01"}}
+        assert trace.to_dict()["commands"] == [
+            {"collection": "stats_daily", "command": "find", "duration_ms": 2.5, "documents": 1}
+        ]
+        assert trace.to_dict()["phases"]["db_ms"] == 2.5
+
+    def test_buffer_keeps_slowest(self):
+        """Le tampon ne garde que les N traces les plus lentes"""
+        import profiling
+        buffer = profiling.TraceBuffer(size=2)
+        for duration in (0.3, 0.1, 0.5, 0.2):
+            trace = profiling.Trace("GET", "/api/", "")
+            trace.duration = duration
+            buffer.add(trace)
+        assert [t.duration for t in buffer.traces()] == [0.5, 0.3]
+
+    def test_plan_summary(self):
+        """Le plan gagnant est résumé en chaîne d'étapes"""
+        import profiling
+        explain = {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {
+            "stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "date_-1"}
+        }}}}]}
+        assert profiling.plan_summary(explain) == "FETCH > IXSCAN date_-1"
+
+    def test_settings_from_env_file(self, settings_from_env):
+        """Le profilage s'active depuis backend/.env"""
+        env = {"PROFILING_SAMPLE_PERCENT": "50", "PROFILING_MAX_TRACES": "7"}
+        assert settings_from_env(env, "(profiling.SAMPLE_PERCENT, profiling.MAX_TRACES)", module="server, profiling") == (50.0, 7)
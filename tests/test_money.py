@@ -0,0 +1,106 @@
+"""
+Tests pour les montants en centimes (money.py)
+"""
+import sys
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+import money  # noqa: E402
+
+
+def line(product_id, price, sold):
+    return {
+        "product_id": product_id,
+        "product_name": product_id,
+        "category": "autre",
+        "quantity_produced": sold,
+        "quantity_sold": sold,
+        "quantity_wasted": 0,
+        "quantity_remaining": 0,
+        "price": price,
+    }
+
+
+class TestMoney:
+    """Tests pour le stockage en centimes et la migration des montants flottants"""
+
+    def test_conversions(self):
+        """Arrondi au centime le plus proche, demi-centime vers le haut"""
+        assert money.to_cents(1.005) == 101
+        assert money.to_cents(0.1) == 10
+        assert money.to_cents(19) == 1900
+        assert money.to_euros(30) == 0.3
+        for value in ("nan", float("inf"), "abc", [1]):
+            with pytest.raises(ValueError):
+                money.to_cents(value)
+
+    @pytest.mark.asyncio
+    async def test_exact_totals(self, test_client):
+        """Les totaux sont des sommes exactes de centimes (0,10 € + 0,20 € = 0,30 €)"""
+        import server
+        response = await test_client.post("/api/inventories", json={
+            "date": "2024-01-15", "products": [line("a", 0.1, 1), line("b", 0.2, 1)]
+        })
+        assert response.status_code == 200
+        assert response.json()["total_revenue"] == 0.3
+
+        stored = await server.db.inventories.find_one({"date": "2024-01-15"})
+        assert stored["total_revenue"] == 30
+        assert [p["price"] for p in stored["products"]] == [10, 20]
+
+        stats = (await test_client.get("/api/stats/summary")).json()
+        assert stats["total_sales"] == 0.3
+        assert [p["total_revenue"] for p in stats["products_stats"]] == [0.1, 0.2]
+        export = (await test_client.get("/api/export", params={"format": "ndjson"})).text.splitlines()
+        assert '"price": 0.1' in export[0] and '"revenue": 0.1' in export[0]
+
+    @pytest.mark.asyncio
+    async def test_api_rounds_to_cents(self, test_client):
+        """Un prix saisi avec plus de deux décimales est arrondi au centime"""
+        import server
+        response = await test_client.post("/api/products", json={"name": "Éclair", "category": "gâteau", "price": 1.005})
+        assert response.json()["price"] == 1.01
+        stored = await server.db.products.find_one({"_id": ObjectId(response.json()["id"])})
+        assert stored["price"] == 101
+
+    @pytest.mark.asyncio
+    async def test_api_rejects_non_amounts(self, test_client):
+        """Booléens, listes, montants non finis ou trop grands : erreur de validation ; une chaîne numérique est arrondie"""
+        for price in (True, [1], {"euros": 1}, "NaN", "Infinity", "1e30", 1e30, "abc"):
+            response = await test_client.post("/api/products", json={"name": "Éclair", "category": "gâteau", "price": price})
+            assert response.status_code == 400, price
+            assert response.json()["errors"][0]["type"] == "money"
+
+        response = await test_client.post("/api/products", json={"name": "Éclair", "category": "gâteau", "price": "12.345"})
+        assert response.status_code == 200
+        assert response.json()["price"] == 12.35
+
+    @pytest.mark.asyncio
+    async def test_migrate_float_amounts(self, test_client):
+        """La migration convertit les montants flottants restants, une seule fois"""
+        import rollups
+        import server
+        db = server.db
+        await db.products.insert_one({"name": "Tarte", "category": "gâteau", "price": 18.5, "is_archived": False})
+        await db.inventories.insert_one({
+            "date": "2024-01-15", "products": [line("a", 0.1, 3), line("b", 2.35, 2)], "total_revenue": 5.0
+        })
+        employee = await db.employees.insert_one({"full_name": "Jean", "base_salary": 1850.5, "is_active": True})
+        await db.payrolls.insert_one({"employee_id": str(employee.inserted_id), "period": "2024-01", "advances": 100.0, "paid": 0.0})
+
+        report = await money.migrate(db, log=lambda message: None)
+        assert report == {"products": 1, "inventories": 1, "employees": 1, "payrolls": 1}
+        assert await money.migrate(db, log=lambda message: None) == {}
+
+        stored = await db.inventories.find_one({"date": "2024-01-15"})
+        assert stored["total_revenue"] == 500
+        assert [p["price"] for p in stored["products"]] == [10, 235]
+        assert (await test_client.get("/api/products")).json()[0]["price"] == 18.5
+        summary = (await test_client.get("/api/payrolls/summary", params={"period": "2024-01"})).json()
+        assert summary["total_balance"] == 1750.5
+        # Rollups recalculés en centimes
+        assert await rollups.verify(db) == []
+        assert (await test_client.get("/api/stats/summary")).json()["total_sales"] == 5.0
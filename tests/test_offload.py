@@ -0,0 +1,101 @@
+"""
+Tests pour l'exécution des calculs de rapports hors de la boucle d'événements (offload.py)
+"""
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+import analytics  # noqa: E402
+import metrics  # noqa: E402
+import offload  # noqa: E402
+
+
+class TestOffload:
+    """Tests pour le pool borné : threads, délai maximal, file pleine et métriques"""
+
+    @pytest.mark.asyncio
+    async def test_loop_stays_responsive(self):
+        """Un calcul bloquant tourne sur un thread du pool pendant que la boucle continue de servir"""
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        def report():
+            time.sleep(0.2)
+            return threading.current_thread().name
+
+        runs = metrics.OFFLOAD_DURATION.count("test_report")
+        task = asyncio.create_task(ticker())
+        thread = await offload.run("test_report", report)
+        task.cancel()
+        assert thread.startswith("offload")
+        assert ticks >= 5
+        assert metrics.OFFLOAD_DURATION.count("test_report") == runs + 1
+        assert metrics.OFFLOAD_WAIT.count("test_report") >= 1
+        assert metrics.OFFLOAD_JOBS.value("queued") == 0
+
+    @pytest.mark.asyncio
+    async def test_timeout(self):
+        """Un calcul trop long est abandonné ; celui resté en file n'est jamais exécuté"""
+        started = []
+        timeouts = metrics.OFFLOAD_REJECTED.value("test_slow", "timeout")
+        blockers = [offload.run("test_slow", time.sleep, 0.3) for _ in range(offload.WORKERS)]
+        blocking = asyncio.gather(*blockers)
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(offload.Timeout):
+            await offload.run("test_slow", started.append, 1, timeout=0.05)
+        assert metrics.OFFLOAD_REJECTED.value("test_slow", "timeout") == timeouts + 1
+        assert metrics.OFFLOAD_JOBS.value("queued") == 0
+
+        await blocking
+        assert started == []
+
+    @pytest.mark.asyncio
+    async def test_queue_full(self, test_client, sample_inventory_data, monkeypatch):
+        """File pleine : l'API répond 503 avec Retry-After et /api/metrics compte le refus"""
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        # Tableau analytique déjà construit : seul le calcul du résumé passe par le pool
+        await test_client.get("/api/stats/summary")
+        monkeypatch.setattr(offload, "MAX_QUEUE", 0)
+        response = await test_client.get("/api/stats/summary")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "5"
+
+        monkeypatch.setattr(offload, "MAX_QUEUE", 16)
+        response = await test_client.get("/api/stats/summary")
+        assert response.json()["total_sold"] == 15
+        body = (await test_client.get("/api/metrics")).text
+        assert 'offload_rejected_total{kind="stats_summary",reason="queue_full"}' in body
+        assert "# TYPE offload_jobs gauge" in body
+
+    def test_snapshot_ignores_later_writes(self):
+        """Une écriture locale ne modifie pas l'instantané lu par un thread du pool"""
+        line = {"product_id": "p", "product_name": "Croissant", "category": "viennoiserie",
+                "quantity_produced": 10, "quantity_sold": 8, "quantity_wasted": 1, "price": 120}
+        table = analytics.AnalyticsTable()
+        table.load([{"date": "2024-01-15", "products": [line], "total_revenue": 960}], "1-1")
+        snapshot = table.snapshot()
+
+        table.apply_line_change("2024-01-15", "p", {"quantity_sold": 1}, 120)
+        table.apply_inventory_changes([(None, {"date": "2024-01-16", "total_revenue": 0,
+                                               "products": [{**line, "product_id": "q"}]})])
+        assert snapshot.summary(None, None)["products"][0]["total_sold"] == 8
+        assert len(snapshot.summary(None, None)["products"]) == 1
+        assert table.summary(None, None)["products"][0]["total_sold"] == 9
+
+    def test_settings_from_env_file(self, settings_from_env):
+        """Le pool se dimensionne depuis backend/.env, pour le serveur comme pour forecast.py --refit"""
+        env = {"OFFLOAD_WORKERS": "0", "OFFLOAD_MAX_QUEUE": "4", "OFFLOAD_TIMEOUT": "2.5"}
+        expression = "(offload.WORKERS, offload.MAX_QUEUE, offload.TIMEOUT)"
+        assert settings_from_env(env, expression, module="server, offload") == (0, 4, 2.5)
+        assert settings_from_env(env, expression, module="offload, forecast") == (0, 4, 2.5)
@@ -216,3 +216,67 @@ class TestProducts:
             data = response.json()
             assert data["category"] == category
 
+    
+    @pytest.mark.asyncio
+    async def test_products_pagination(self, test_client, sample_product_data):
+        """Test de la pagination par curseur des produits"""
+        created = []
+        for i in range(5):
+            response = await test_client.post("/api/products", json={**sample_product_data, "name": f"Produit {i}"})
+            created.append(response.json()["id"])
+        
+        first = (await test_client.get("/api/products?page_size=4")).json()
+        assert [p["id"] for p in first["items"]] == created[:4]
+        second = (await test_client.get(f"/api/products?page_size=4&cursor={first['next_cursor']}")).json()
+        assert [p["id"] for p in second["items"]] == created[4:]
+        assert second["next_cursor"] is None
+    
+    @pytest.mark.asyncio
+    async def test_products_cache(self, test_client, sample_product_data):
+        """Test du cache du catalogue : hits, invalidation locale et par un autre worker"""
+        import server
+        created = (await test_client.post("/api/products", json=sample_product_data)).json()
+        
+        await test_client.get("/api/products")
+        before = server.product_cache.stats()
+        response = await test_client.get("/api/products")
+        assert response.json()[0]["name"] == "Croissant"
+        assert server.product_cache.stats()["hits"] == before["hits"] + 1
+        
+        # Écriture locale : le cache est invalidé
+        await test_client.put(f"/api/products/{created['id']}", json={"name": "Pain au chocolat"})
+        response = await test_client.get("/api/products")
+        assert response.json()[0]["name"] == "Pain au chocolat"
+        
+        # Écriture par un autre worker : seul le compteur de version en base change
+        from bson import ObjectId
+        await server.db.products.update_one({"_id": ObjectId(created["id"])}, {"$set": {"name": "Chouquette"}})
+        await server.db.counters.update_one({"_id": "products"}, {"$inc": {"seq": 1}})
+        response = await test_client.get("/api/products")
+        assert response.json()[0]["name"] == "Chouquette"
+        
+        stats = (await test_client.get("/api/cache/stats")).json()
+        assert stats["products"]["misses"] >= 3
+        
+        # Requête conditionnelle : 304 tant que le catalogue ne change pas
+        etag = response.headers["etag"]
+        response = await test_client.get("/api/products", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        await test_client.delete(f"/api/products/{created['id']}")
+        response = await test_client.get("/api/products", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json() == []
+    
+    @pytest.mark.asyncio
+    async def test_write_responses_match_reads(self, test_client, sample_product_data, sample_employee_data):
+        """Test que les réponses des écritures (sans relecture) sont identiques à une lecture ultérieure"""
+        created = (await test_client.post("/api/products", json=sample_product_data)).json()
+        fetched = (await test_client.get(f"/api/products/{created['id']}")).json()
+        assert created == fetched
+        
+        updated = (await test_client.put(f"/api/products/{created['id']}", json={"price": 1.8})).json()
+        assert updated == (await test_client.get(f"/api/products/{created['id']}")).json()
+        assert updated["price"] == 1.8
+        
+        employee = (await test_client.post("/api/employees", json=sample_employee_data)).json()
+        assert employee == (await test_client.get(f"/api/employees/{employee['id']}")).json()
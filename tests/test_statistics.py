@@ -208,3 +208,348 @@ class TestStatistics:
             assert "avg_sold_per_day" in product_stat
             assert product_stat["total_revenue"] > 0
 
+    @pytest.mark.asyncio
+    async def test_stats_summary_totals(self, test_client):
+        """Test des totaux exacts agrégés sur plusieurs produits et plusieurs jours"""
+        lines = {
+            "a": {"product_id": "a", "product_name": "A", "category": "gâteau", "price": 2.0},
+            "b": {"product_id": "b", "product_name": "B", "category": "autre", "price": 1.5},
+        }
+        days = [
+            ("2024-03-01", [("a", 10, 8, 1), ("b", 6, 4, 2)]),
+            ("2024-03-02", [("a", 12, 9, 0)]),
+            ("2024-03-03", [("b", 5, 5, 0)]),
+        ]
+        for day, entries in days:
+            await test_client.post("/api/inventories", json={
+                "date": day,
+                "products": [
+                    {**lines[pid], "quantity_produced": produced, "quantity_sold": sold,
+                     "quantity_wasted": wasted, "quantity_remaining": produced - sold - wasted}
+                    for pid, produced, sold, wasted in entries
+                ]
+            })
+        
+        response = await test_client.get("/api/stats/summary?start_date=2024-03-01")
+        stats = response.json()
+        assert stats["total_sales"] == 17 * 2.0 + 9 * 1.5
+        assert stats["total_sold"] == 26
+        assert stats["total_wasted"] == 3
+        assert stats["total_produced"] == 33
+        by_id = {p["product_id"]: p for p in stats["products_stats"]}
+        assert by_id["a"]["total_revenue"] == 34.0
+        assert by_id["a"]["avg_sold_per_day"] == round(17 / 3, 1)
+        assert by_id["b"]["product_name"] == "B"
+        assert by_id["b"]["total_wasted"] == 2
+        
+        response = await test_client.get("/api/stats/summary?end_date=2024-03-01")
+        assert response.json()["total_sold"] == 12
+
+    @pytest.mark.asyncio
+    async def test_stats_follow_inventory_updates(self, test_client, sample_inventory_data):
+        """Test que les statistiques suivent les mises à jour et suppressions d'inventaires"""
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        other_day = {**sample_inventory_data, "date": "2024-02-10"}
+        await test_client.post("/api/inventories", json=other_day)
+        
+        updated_products = [{**sample_inventory_data["products"][0], "quantity_sold": 18}]
+        await test_client.put("/api/inventories/2024-01-15", json={"products": updated_products})
+        
+        stats = (await test_client.get("/api/stats/summary")).json()
+        assert stats["total_sold"] == 18 + 15
+        assert stats["total_sales"] == (18 + 15) * 1.50
+        
+        await test_client.delete("/api/inventories/2024-02-10")
+        stats = (await test_client.get("/api/stats/summary")).json()
+        assert stats["total_sold"] == 18
+        assert stats["products_stats"][0]["avg_sold_per_day"] == 18.0
+        
+        # Plage couvrant un mois complet et une fin de mois partielle
+        stats = (await test_client.get("/api/stats/summary?start_date=2024-01-01&end_date=2024-02-15")).json()
+        assert stats["total_sold"] == 18
+        
+        product_stats = (await test_client.get("/api/stats/product/test_product_id")).json()
+        assert [d["sold"] for d in product_stats["daily_stats"]] == [18]
+    
+    @pytest.mark.asyncio
+    async def test_rollups_rebuild(self, test_client, sample_inventory_data):
+        """Test de la reconstruction des rollups à partir des inventaires"""
+        import server
+        import rollups
+        
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        expected = (await test_client.get("/api/stats/summary")).json()
+        
+        # Simuler une dérive des rollups
+        await server.db[rollups.MONTHLY].update_many({}, {"$inc": {"sold": 7}})
+        assert await rollups.verify(server.db) == ["test_product_id"]
+        
+        await rollups.rebuild(server.db)
+        assert await rollups.verify(server.db) == []
+        assert (await test_client.get("/api/stats/summary")).json() == expected
+
+    @pytest.mark.asyncio
+    async def test_rollups_rebuild_during_writes(self, test_client, sample_inventory_data, monkeypatch):
+        """Une écriture incrémentale pendant la reconstruction n'entre pas en conflit avec les lignes reconstruites"""
+        import server
+        import compact
+        import rollups
+
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        expected = (await test_client.get("/api/stats/summary")).json()
+
+        expand_docs = compact.expand_docs
+        async def write_meanwhile(db, docs):
+            # Un autre worker répercute une écriture pendant le parcours des inventaires
+            await db[rollups.DAILY].delete_many({})
+            await db[rollups.DAILY].insert_one({"date": "2024-01-15", "product_id": None, "days": 1})
+            await expand_docs(db, docs)
+        monkeypatch.setattr(compact, "expand_docs", write_meanwhile)
+
+        await rollups.rebuild(server.db)
+        assert await rollups.verify(server.db) == []
+        assert (await test_client.get("/api/stats/summary")).json() == expected
+        names = await server.db.list_collection_names()
+        assert not [name for name in names if "_rebuild_" in name]
+        indexes = await server.db[rollups.DAILY].index_information()
+        assert indexes["date_1_product_id_1"]["unique"]
+
+    @pytest.mark.asyncio
+    async def test_product_stats_single_bound(self, test_client, sample_inventory_data):
+        """Test de statistiques produit avec une seule borne de date"""
+        other_line = {**sample_inventory_data["products"][0], "product_id": "autre_produit", "quantity_sold": 4}
+        for day in ["2024-01-10", "2024-01-11", "2024-01-12"]:
+            await test_client.post("/api/inventories", json={
+                "date": day,
+                "products": [sample_inventory_data["products"][0], other_line]
+            })
+        
+        response = await test_client.get("/api/stats/product/test_product_id?start_date=2024-01-11")
+        assert [d["date"] for d in response.json()["daily_stats"]] == ["2024-01-11", "2024-01-12"]
+        assert all(d["sold"] == 15 for d in response.json()["daily_stats"])
+        
+        response = await test_client.get("/api/stats/product/autre_produit?end_date=2024-01-10")
+        assert response.json()["daily_stats"] == [
+            {"date": "2024-01-10", "produced": 20, "sold": 4, "wasted": 2, "revenue": 6.0}
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_export_streaming_formats(self, test_client, sample_inventory_data):
+        """Test de l'export en flux NDJSON et CSV (une ligne par produit d'inventaire)"""
+        import json
+        second_line = {**sample_inventory_data["products"][0], "product_id": "p2", "product_name": "Éclair"}
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        await test_client.post("/api/inventories", json={
+            "date": "2024-01-16",
+            "products": [sample_inventory_data["products"][0], second_line]
+        })
+        
+        response = await test_client.get("/api/export?format=ndjson")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == 3
+        assert rows[0]["date"] == "2024-01-16"
+        assert rows[1]["product_name"] == "Éclair"
+        assert rows[2]["revenue"] == 15 * 1.50
+        
+        response = await test_client.get("/api/export?format=csv&start_date=2024-01-16")
+        lines = response.text.splitlines()
+        assert lines[0].startswith("date,product_id,product_name")
+        assert len(lines) == 3
+        
+        response = await test_client.get("/api/export?format=xml")
+        assert response.status_code == 400
+    
+    @pytest.mark.asyncio
+    async def test_rolling_stats(self, test_client, sample_inventory_data):
+        """Test des moyennes glissantes (fenêtres en jours calendaires, moyenne par jour d'inventaire)"""
+        line = sample_inventory_data["products"][0]
+        for day in [1, 2, 3, 4, 5, 9]:
+            await test_client.post("/api/inventories", json={
+                "date": f"2024-01-{day:02d}",
+                "products": [{**line, "quantity_produced": 20, "quantity_sold": day, "quantity_wasted": 1, "quantity_remaining": 19 - day}]
+            })
+        
+        response = await test_client.get("/api/stats/rolling?windows=7,3&start_date=2024-01-05")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["windows"] == [3, 7]
+        assert data["dates"] == ["2024-01-05", "2024-01-09"]
+        product = data["products"][0]
+        assert product["sold"] == [5, 9]
+        
+        # 2024-01-05 : les jours précédant start_date alimentent les fenêtres
+        # 2024-01-09 : 3 jours = 07..09, 7 jours = 03..09 (03, 04, 05, 09)
+        assert data["days"] == {"3": [3, 1], "7": [5, 4]}
+        assert product["rolling"]["3"] == {
+            "sold": [12, 9], "wasted": [3, 1], "revenue": [18.0, 13.5],
+            "avg_sold": [4.0, 9.0], "avg_wasted": [1.0, 1.0], "avg_revenue": [6.0, 13.5]
+        }
+        assert product["rolling"]["7"]["sold"] == [15, 21]
+        assert product["rolling"]["7"]["avg_sold"] == [3.0, 5.25]
+        
+        response = await test_client.get("/api/stats/rolling?windows=0")
+        assert response.status_code == 400
+        response = await test_client.get("/api/stats/rolling?windows=7,abc")
+        assert response.status_code == 400
+    
+    @pytest.mark.asyncio
+    async def test_rolling_stats_missing_product_days(self, test_client, sample_inventory_data):
+        """Un produit absent d'un inventaire compte pour zéro dans la fenêtre"""
+        line = sample_inventory_data["products"][0]
+        other = {**line, "product_id": "autre_produit"}
+        await test_client.post("/api/inventories", json={"date": "2024-01-01", "products": [line, other]})
+        await test_client.post("/api/inventories", json={"date": "2024-01-02", "products": [other]})
+        
+        response = await test_client.get("/api/stats/rolling?windows=2&product_id=test_product_id")
+        data = response.json()
+        assert [p["product_id"] for p in data["products"]] == ["test_product_id"]
+        assert data["dates"] == ["2024-01-01", "2024-01-02"]
+        assert data["products"][0]["sold"] == [15, 0]
+        assert data["days"]["2"] == [1, 2]
+        assert data["products"][0]["rolling"]["2"]["avg_sold"] == [15.0, 7.5]
+    
+    @pytest.mark.asyncio
+    async def test_rolling_stats_skip_non_dates(self, test_client, sample_inventory_data):
+        """Une date mal formée est refusée à l'écriture, et ignorée par les fenêtres si elle est déjà stockée"""
+        import server
+        import rollups
+        line = sample_inventory_data["products"][0]
+        response = await test_client.post("/api/inventories", json={"date": "2024-1-5", "products": [line]})
+        assert response.status_code == 400
+        response = await test_client.put("/api/inventories/2024-1-5?upsert=true", json={"products": [line]})
+        assert response.status_code == 400
+        
+        await test_client.post("/api/inventories", json={"date": "2024-01-06", "products": [line]})
+        await server.db.inventories.insert_one({"date": "2024-1-5", "products": [{**line, "price": 150}], "total_revenue": 2250})
+        await rollups.rebuild(server.db)
+        
+        data = (await test_client.get("/api/stats/rolling?windows=2")).json()
+        assert data["dates"] == ["2024-01-06"]
+        assert data["products"][0]["rolling"]["2"]["sold"] == [15]
+    
+    @pytest.mark.asyncio
+    async def test_analytics_table_matches_mongodb(self, test_client, sample_inventory_data):
+        """Le tableau analytique en mémoire suit les écritures et donne les mêmes résultats que MongoDB"""
+        import server
+        import rollups
+        line = sample_inventory_data["products"][0]
+        other = {**line, "product_id": "autre_produit", "product_name": "Éclair", "quantity_sold": 4, "price": 2.0}
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        # Construit le tableau : les écritures suivantes y sont appliquées sans relecture
+        await test_client.get("/api/stats/summary")
+        await test_client.post("/api/inventories/bulk", json=[
+            {"date": "2024-01-16", "products": [line, other]},
+            {"date": "2024-02-01", "products": [other]},
+        ])
+        await test_client.put("/api/inventories/2024-01-15", json={"products": [{**line, "quantity_sold": 10}]})
+        await test_client.patch("/api/inventories/2024-01-16/products/autre_produit", json={"quantity_sold": 6})
+        await test_client.delete("/api/inventories/2024-02-01")
+        await test_client.put("/api/inventories/2024-03-01?upsert=true", json={"products": [other]})
+        
+        assert server.analytics_table.version == await server.get_version("inventories")
+        for start, end in [(None, None), ("2024-01-16", None), (None, "2024-01-31")]:
+            expected = server.summarize_rollups(await rollups.load_summary_rows(server.db, start, end))
+            actual = server.analytics_table.summary(start, end)
+            assert actual["days"] == expected["days"]
+            assert actual["total_sales"] == pytest.approx(expected["total_sales"])
+            assert sorted(actual["products"], key=lambda p: p["product_id"]) == \
+                sorted(expected["products"], key=lambda p: p["product_id"])
+        
+        response = await test_client.get("/api/stats/product/autre_produit")
+        assert response.json()["daily_stats"] == [
+            {"date": "2024-01-16", "produced": 20, "sold": 6, "wasted": 2, "revenue": 12.0},
+            {"date": "2024-03-01", "produced": 20, "sold": 4, "wasted": 2, "revenue": 8.0},
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_analytics_table_reloads_after_foreign_write(self, test_client, sample_inventory_data):
+        """Une écriture d'un autre worker (compteur de version modifié) force la reconstruction du tableau"""
+        import server
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        assert (await test_client.get("/api/stats/summary")).json()["total_sold"] == 15
+        
+        lines = [{**line, "price": 150} for line in sample_inventory_data["products"]]
+        await server.db.inventories.insert_one({"date": "2024-01-16", "products": lines, "total_revenue": 2250})
+        await server.db.counters.update_one({"_id": "inventories"}, {"$inc": {"seq": 1}})
+        assert (await test_client.get("/api/stats/summary")).json()["total_sold"] == 30
+    
+    @pytest.mark.asyncio
+    async def test_patch_during_analytics_rebuild(self, test_client, sample_inventory_data, monkeypatch):
+        """Un PATCH dont l'écriture est lue par une reconstruction du tableau n'est pas compté deux fois"""
+        import server
+        import rollups
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        assert (await test_client.get("/api/stats/summary")).json()["total_sold"] == 15
+        
+        apply_line_change = rollups.apply_line_change
+        async def rebuild_meanwhile(*args):
+            # Entre l'écriture du PATCH et sa répercussion dans le tableau
+            server.analytics_table.version = None
+            await server.load_analytics(await server.get_version("inventories"))
+            await apply_line_change(*args)
+        monkeypatch.setattr(rollups, "apply_line_change", rebuild_meanwhile)
+        
+        response = await test_client.patch("/api/inventories/2024-01-15/products/test_product_id", json={"quantity_sold": 18})
+        assert response.status_code == 200
+        assert (await test_client.get("/api/stats/summary")).json()["total_sold"] == 18
+        assert server.analytics_table.usable
+    
+    @pytest.mark.asyncio
+    async def test_analytics_table_falls_back_on_non_dates(self, test_client, sample_inventory_data):
+        """Une date d'inventaire non calendaire rend le tableau inutilisable : MongoDB répond"""
+        import server
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        # Jour hérité d'avant la validation des dates à l'écriture
+        import rollups
+        lines = [{**line, "price": 150} for line in sample_inventory_data["products"]]
+        await server.db.inventories.insert_one({"date": "hier", "products": lines, "total_revenue": 2250})
+        await rollups.rebuild(server.db)
+        await server.db.counters.update_one({"_id": "inventories"}, {"$inc": {"seq": 1}})
+        
+        response = await test_client.get("/api/stats/summary")
+        assert response.json()["total_sold"] == 30
+        assert server.analytics_table.usable is False
+        response = await test_client.get("/api/stats/product/test_product_id?start_date=2024-01-15")
+        assert [d["date"] for d in response.json()["daily_stats"]] == ["2024-01-15", "hier"]
+    
+    @pytest.mark.asyncio
+    async def test_stats_breakdown(self, test_client, sample_inventory_data):
+        """Test des totaux par catégorie, jour de la semaine et mois"""
+        line = sample_inventory_data["products"][0]
+        cake = {**line, "product_id": "fraisier", "category": "gâteau", "quantity_sold": 2, "price": 20.0}
+        # 2024-01-15 et 2024-02-05 sont des lundis, 2024-01-16 un mardi
+        await test_client.post("/api/inventories", json=sample_inventory_data)
+        await test_client.post("/api/inventories", json={"date": "2024-01-16", "products": [line, cake]})
+        await test_client.post("/api/inventories", json={"date": "2024-02-05", "products": [cake]})
+        
+        response = await test_client.get("/api/stats/breakdown?by=category")
+        assert response.status_code == 200
+        groups = {g["key"]: g for g in response.json()["groups"]}
+        assert groups["viennoiserie"]["total_sold"] == 30
+        assert groups["viennoiserie"]["days"] == 2
+        assert groups["gâteau"]["total_revenue"] == 80.0
+        
+        response = await test_client.get("/api/stats/breakdown?by=weekday")
+        assert [(g["key"], g["days"], g["total_sold"]) for g in response.json()["groups"]] == [(0, 2, 17), (1, 1, 17)]
+        
+        response = await test_client.get("/api/stats/breakdown?by=month&start_date=2024-01-16")
+        assert [(g["key"], g["total_sold"]) for g in response.json()["groups"]] == [("2024-01", 17), ("2024-02", 2)]
+        
+        response = await test_client.get("/api/stats/breakdown?by=product")
+        assert response.status_code == 400
+    
+    @pytest.mark.asyncio
+    async def test_stats_breakdown_mongodb_fallback(self, test_client, sample_inventory_data):
+        """Sans tableau analytique utilisable, l'agrégation MongoDB donne les mêmes groupes"""
+        import server
+        line = sample_inventory_data["products"][0]
+        cake = {**line, "product_id": "fraisier", "category": "gâteau", "quantity_sold": 2, "price": 20.0}
+        await test_client.post("/api/inventories", json={"date": "2024-01-16", "products": [line, cake]})
+        await test_client.post("/api/inventories", json={"date": "2024-02-05", "products": [cake]})
+        expected = {by: (await test_client.get(f"/api/stats/breakdown?by={by}")).json() for by in ["category", "month"]}
+        
+        server.analytics_table.usable = False
+        for by in ["category", "month"]:
+            assert (await test_client.get(f"/api/stats/breakdown?by={by}")).json() == expected[by]